@@ -7,6 +7,7 @@ from .mol2IO import Mol2IO
 from .filter_mol2 import FilterMol2
 from .index import *
 from .algorithms import *
+from .kernels import *
 from .pdbIO import *
 from .mlearn import *
 
@@ -9,6 +9,14 @@ import math
 import numpy as np
 import pandas as pd
 
+from dockml import kernels
+
+
+def _is_histogram(x):
+    """Whether x is a histogram counted chunk by chunk, such as
+    mdanaly.accumulator.HistogramAccumulator, with counts_ and edges_"""
+    return hasattr(x, "counts_") and hasattr(x, "edges_")
+
 
 class BasicAlgorithm(object):
 
@@ -21,7 +29,7 @@ class BasicAlgorithm(object):
 
         Parameters
         ----------
-        x : float
+        x : float, or np.ndarray
             the input distance value
         d0 : float
             the distance cutoff, it is usually 2 times of
@@ -33,7 +41,7 @@ class BasicAlgorithm(object):
 
         Returns
         -------
-        switched_dist : float
+        switched_dist : float, or np.ndarray
             the switched continuous distance
 
         Notes
@@ -42,14 +50,13 @@ class BasicAlgorithm(object):
           s= [1 - (x/d0)^6] / [1 - (x/d0)^12]
         d0 is a cutoff, should be twice larger than the distance cutoff
 
+        See Also
+        --------
+        kernels.rational_switch
+
         """
-        count = 0.0
-        try:
-            count = (1.0 - math.pow((x / d0), n)) / (1.0 - math.pow((x / d0), m))
-        except ZeroDivisionError:
-            print("Divide by zero, ", x, d0)
 
-        return count
+        return kernels.rational_switch(x, d0=d0, n=n, m=m)
 
     def exponentialFunction(self, x, exp=2.0, k=1.0, c0=0.0, bias=0.0):
         """The exponential function
@@ -80,8 +87,8 @@ class BasicAlgorithm(object):
 
         Parameters
         ----------
-        x : np.ndarray, shape = [ N, 1]
-            The input data vector
+        x : np.ndarray, shape = [ N, 1], or a histogram (counts_, edges_)
+            The input data vector, or a histogram counted chunk by chunk
         minX : float
             A minimium value for the probability calculation,
             to avoid log by zero error.
@@ -90,12 +97,16 @@ class BasicAlgorithm(object):
             kbt is around 2.5
         bins : int, or array like, default = 20
             The number of bins, or pre-defined bin edges.
+            It is ignored if x is a histogram.
 
         Returns
         -------
 
         """
-        dist, xedge = np.histogram(x, bins=bins)
+        if _is_histogram(x):
+            dist = x.counts_.astype(np.float64)
+        else:
+            dist, xedge = np.histogram(x, bins=bins)
 
         dist = dist / np.max(dist)
         dist[dist == 0.0] = minX / np.max(dist)
@@ -107,10 +118,10 @@ class BasicAlgorithm(object):
 
         Parameters
         ----------
-        X : np.ndarray, or array like, shape = [N, 1]
-            The first input vector
+        X : np.ndarray, or array like, shape = [N, 1], or a histogram (counts_, edges_)
+            The first input vector, or a 2D histogram counted chunk by chunk
         Y : np.ndarray, or array like, shape = [N, 1]
-            The 2nd input vector
+            The 2nd input vector, it is ignored if X is a histogram
         minX : float
             A minimium value for the probability calculation,
             to avoid log by zero error.
@@ -119,6 +130,7 @@ class BasicAlgorithm(object):
             kbt is around 2.5
         bins : int, or array like, default = 20
             The number of bins, or pre-defined bin edges.
+            It is ignored if X is a histogram.
 
         Returns
         -------
@@ -130,7 +142,11 @@ class BasicAlgorithm(object):
             The PMF matrix
         """
 
-        hist, edges_1, edges_2= np.histogram2d(X, Y, bins=bins)
+        if _is_histogram(X):
+            hist = X.counts_.astype(np.float64)
+            edges_1, edges_2 = X.edges_
+        else:
+            hist, edges_1, edges_2= np.histogram2d(X, Y, bins=bins)
         hist = hist / np.max(hist)
 
         hist = pd.DataFrame(hist)
@@ -5,10 +5,80 @@ import math
 import argparse
 from argparse import RawTextHelpFormatter
 import sys, os
+import hashlib
+import glob
+import re
+import json
+import time
+import multiprocessing
 import numpy as np
+from scipy import sparse
+from scipy.spatial import cKDTree
 import dockml.index as index
 import dockml.pdbIO as pio
 import mdanaly, dockml
+from dockml import kernels
+
+# the parameter tables, loaded once per process, { file name: table }
+_PARAMETER_TABLES = {}
+
+# the atomic properties of a ligand, see BindingFeature.ligandPropertyTable
+LIGAND_PROPERTY_DTYPE = [("ndx", "U11"), ("element", "U4"), ("eleid", np.int64),
+                         ("sigma", np.float64), ("epsilon", np.float64),
+                         ("charge", np.float64), ("negativity", np.float64)]
+
+
+def vdwParameterTable(fname):
+    '''
+    the vdw parameters of the atom types, the file is read once per process
+    :param fname: str, the AtomType.dat file
+    :return: tuple, (list of atom types, ndarray of sigma, ndarray of epsilon)
+    '''
+    key = ("vdw", os.path.abspath(fname))
+    if key not in _PARAMETER_TABLES :
+        types, sigma, epsilon = [], [], []
+        with open(fname) as lines :
+            for s in lines :
+                if "#" not in s and ";" not in s :
+                    ## in AtomType.dat nm
+                    if s.split()[0] not in types :
+                        types.append(s.split()[0])
+                        sigma.append(0.0)
+                        epsilon.append(0.0)
+                    sigma[types.index(s.split()[0])]   = float(s.split()[-2])
+                    epsilon[types.index(s.split()[0])] = float(s.split()[-1])
+        _PARAMETER_TABLES[key] = (types, np.array(sigma), np.array(epsilon))
+
+    return _PARAMETER_TABLES[key]
+
+
+def elementParameterTable(fname):
+    '''
+    the atomic number and electronegativity of the elements,
+    the file is read once per process
+    :param fname: str, the elementNegativity.dat file
+    :return: tuple, (list of elements, ndarray of atomic number, ndarray of negativity)
+    '''
+    key = ("element", os.path.abspath(fname))
+    if key not in _PARAMETER_TABLES :
+        elements, eleid, negat = [], [], []
+        with open(fname) as lines :
+            for s in [ x for x in lines if (x[0] not in [";", "#"] and len(x.split()) > 3 )] :
+                if s.split()[1] in elements :
+                    i = elements.index(s.split()[1])
+                    eleid[i], negat[i] = int(s.split()[0]), float(s.split()[3])
+                else :
+                    elements.append(s.split()[1])
+                    eleid.append(int(s.split()[0]))
+                    negat.append(float(s.split()[3]))
+        _PARAMETER_TABLES[key] = (elements, np.array(eleid, dtype=np.int64), np.array(negat))
+
+    return _PARAMETER_TABLES[key]
+
+
+# the pocket grids, { hash: (grid centers, number of grids) }
+_POCKET_GRIDS = {}
+
 
 class GridBasedFeature :
 
@@ -27,6 +97,8 @@ class GridBasedFeature :
         self.eleparm = bf.getElementParams()
 
         self.atominfor = pio.parsePDB().atomInformation(self.ligpdb)
+        # mass vdw_sigma, vdw_epsilon, charge, negativity of the ligand atoms
+        self.properties_ = bf.ligandPropertyTable(self.ligpdb, self.atominfor)
 
         try :
             with open(self.ligpdb) as lines :
@@ -37,21 +109,23 @@ class GridBasedFeature :
     def pocketFromRes(self, receptorPDB, reslist, chain='A'):
         '''
         get a list of residues' index, return their coordinates (angstrom)
+        the receptor file is read only once for all the residues
         :param receptorPDB:
         :param reslist: list of int
         :param chain:
-        :return:
+        :return: list, N*3 dimension, atom coordinates of the residues
         '''
 
-        pndx = []
-        for res in reslist:
-            ndx = index.PdbIndex(reference=self.recpdb, chain=[chain, ],
-                                 atomtype="all", resSeq=[res,])
-            ndx.prepare_selection().res_index()
-            pndx += ndx.atomndx
+        reslist = set([ int(x) for x in reslist ])
+
+        with open(receptorPDB) as lines :
+            pocketResCoord = [ [float(s[30:38].strip()),
+                                float(s[38:46].strip()),
+                                float(s[46:54].strip())]
+                               for s in lines if len(s) > 26 and s[:4] in ["ATOM", "HETA"]
+                               and s[21] == chain and int(s[22:26]) in reslist
+                               ]
 
-        pocketResCoord = pio.coordinatesPDB().getAtomCrdByNdx(singleFramePDB=self.recpdb,
-                                                              atomNdx=pndx)
         return pocketResCoord
 
     def createCubicPocket(self, coordinates, extension=10.0):
@@ -72,8 +146,9 @@ class GridBasedFeature :
     def generateGrids(self, boundaries, gridfile="GRID"):
         '''
         the grid ndarray, generated from the boundaries in x y z dimension
+        the number of grids in x y z dimension is kept in self.gridShape_
         :param boundaries: list of list, [ [x, y, z], [x, y, z]]
-        :param gridfile: str, output grid file format
+        :param gridfile: str, output grid file format, None for not writing the file
         :param gridsize: float, grid bin size
         :return: ndarray of floats, N * 3 dimmension
         '''
@@ -85,6 +160,7 @@ class GridBasedFeature :
         z_range = np.arange(lowbound[2], upbound[2], self.gridsize)
 
         xsize, ysize, zsize = x_range.shape[0], y_range.shape[0], z_range.shape[0]
+        self.gridShape_ = (xsize, ysize, zsize)
 
         grid_x = np.repeat(x_range, ysize*zsize)
 
@@ -98,10 +174,49 @@ class GridBasedFeature :
                                       ), axis=0
                                      ).T
 
-        np.savetxt(gridfile, grid_center, delimiter=" ", fmt="%8.3f")
+        if gridfile is not None :
+            np.savetxt(gridfile, grid_center, delimiter=" ", fmt="%8.3f")
 
         return grid_center
 
+    def pocketGrids(self, reslist=None, chain='A', extension=10.0,
+                    coordinates=None, gridfile=None):
+        '''
+        the grids of the receptor pocket. The pocket and its grids are computed
+        once and cached by the hash of the receptor file content (or the
+        coordinates) and the pocket parameters
+        :param reslist: list of int, residues defining the pocket
+        :param chain: str, chain of the residues
+        :param extension: float, extend the pocket box
+        :param coordinates: ndarray, M*3 dim, define the pocket by these
+                            coordinates instead of the receptor residues
+        :param gridfile: str, output grid file, written only when the grids are created
+        :return: tuple, (grid centers, ndarray N*3 dim, number of grids (nx, ny, nz))
+        '''
+
+        if reslist is None and coordinates is None :
+            raise ValueError("The pocket is defined by reslist or coordinates, "
+                             "neither of them is given")
+
+        key = hashlib.sha1()
+        if coordinates is None :
+            with open(self.recpdb, "rb") as lines :
+                key.update(lines.read())
+            key.update(repr((sorted([ int(x) for x in reslist ]), chain)).encode())
+        else :
+            key.update(np.ascontiguousarray(coordinates, dtype=np.float64).tobytes())
+        key.update(repr((float(extension), float(self.gridsize))).encode())
+        key = key.hexdigest()
+
+        if key not in _POCKET_GRIDS :
+            if coordinates is None :
+                coordinates = self.pocketFromRes(self.recpdb, reslist, chain)
+            pocket = self.createCubicPocket(coordinates, extension=extension)
+            grids = self.generateGrids(pocket, gridfile=gridfile)
+            _POCKET_GRIDS[key] = (grids, self.gridShape_)
+
+        return _POCKET_GRIDS[key]
+
     def ligCoords(self, chain="B"):
         '''
         from ligandpdb file get ligand atoms coordinates
@@ -111,10 +226,16 @@ class GridBasedFeature :
         '''
 
         coords = defaultdict(list)
+        ligndx = set(self.ligndx)
 
-        for ndx in self.ligndx :
-            coords[ndx] = pio.coordinatesPDB().getAtomCrdByNdx(singleFramePDB=self.ligpdb,
-                                                               atomNdx=[ndx,])[0]
+        # read the file once, keep the first record of each atom index
+        with open(self.ligpdb) as lines :
+            for s in lines :
+                if len(s) > 4 and s[:4] in ["ATOM", "HETA"] and s.split()[1] in ligndx \
+                        and s.split()[1] not in coords :
+                    coords[s.split()[1]] = [float(s[30:38].strip()),
+                                            float(s[38:46].strip()),
+                                            float(s[46:54].strip())]
 
         return coords
 
@@ -125,114 +246,129 @@ class GridBasedFeature :
         :param grid_center:
         :param atomcrd:
         :param count_cutoff:
-        :return:
+        :return: tuple, (the first grid id with counts larger than count_cutoff, counts),
+                 (-1, 0.0) if not found
         '''
 
-        try :
-            num_bin = grid_center.shape[0]
-        except TypeError :
-            num_bin = np.asarray(grid_center).shape[0]
-
-        for num in range(num_bin) :
-            grid = grid_center[num]
-            count = self.pointInGrid(atomcrd, grid)
-            if count > count_cutoff :
-                print(num, count)
-                return num, count
-            else :
-                pass
+        grid_center = np.asarray(grid_center, dtype=np.float64).reshape((-1, 3))
+
+        # the counts of the atom in all the grids
+        counts = np.atleast_1d(self.pointInGrid(atomcrd, grid_center))
+        found = np.flatnonzero(counts > count_cutoff)
 
-        return -1, 0.0
+        if found.shape[0] :
+            return found[0], counts[found[0]]
+        else :
+            return -1, 0.0
 
     def distToGrid(self, grid_point, physic_point):
 
-        distance = mdanaly.ContactMap(self.ligpdb).atomDistance(list(grid_point),
-                                                                list(physic_point),
-                                                                sqrt=True
-                                                                )
+        distance = np.linalg.norm(np.asarray(physic_point, dtype=np.float64) -
+                                  np.asarray(grid_point, dtype=np.float64), axis=-1)
 
         return distance
 
     def pointInGrid(self, point, grid, cutoff=4.0):
         '''
         determine a point in a grid box or not
-        :param point: float, a list of 3 items
-        :param grid: float, a list of 3 items, the grid center
+        :param point: float, a list of 3 items, or np.ndarray of points, shape = [N, 3]
+        :param grid: float, a list of 3 items, the grid center, or np.ndarray of grids
         :param gridsize: float, the grid size
-        :return: float, scaled contact number
+        :return: float, scaled contact number, or np.ndarray for N points
         '''
 
-        '''if point[0] > grid[0] and point[0] <= grid[1] \
-                        and point[1] > grid[2] and point[1] <= grid[3] \
-                        and point[2] > grid[4] and point[2] <= grid[5] :
-                    return True
-                else :
-                    pass
-
-                return False'''
-
-        dist = self.distToGrid(point, grid)
-        dist_scaled = dockml.BasicAlgorithm().switchFuction(dist, d0=cutoff*2)
+        dist = self.distToGrid(grid, point)
+        dist_scaled = kernels.rational_switch(dist, d0=cutoff*2)
 
         return dist_scaled
 
-    def gridAtomMap(self, grid_table, ligcoords):
+    def gridAtomMap(self, grid_table, ligcoords, cutoff=4.0, count_cutoff=0.01):
         '''
-        determine in each grid bin, whether ligand atom exists there
+        determine in each grid bin, the contact numbers of the ligand atoms
+        the grid-atom pairs are found by a kd-tree neighbor search, and the
+        switch function (see pointInGrid) is applied to all the pairs at once
         :param grid_table: ndarray, N*3 dim
         :param ligcoords: defaultdict(list),{ key, dimension N*3},
                           the coordinates of ligand atoms
-        :return: { grid_id: (atomndx, contactnumber) }
+        :param cutoff: float, the distance cutoff of the switch function
+        :param count_cutoff: float, grid-atom pairs with smaller contact numbers are ignored
+        :return: scipy.sparse.csr_matrix, shape = [N, M], the contact numbers between
+                 N grids and M ligand atoms, the atoms are ordered as self.ligndx
         '''
 
-        gridMapper = defaultdict(list)
+        grid_table = np.asarray(grid_table, dtype=np.float64).reshape((-1, 3))
+        atoms = np.array([ ligcoords[x] for x in self.ligndx ], dtype=np.float64).reshape((-1, 3))
 
-        for k in range(grid_table.shape[0]) :
-            grid = grid_table[k]
-            gridMapper[k] = [ (x, self.pointInGrid(ligcoords[x], grid)) for x in self.ligndx ]
+        # the switch function s = 1 / (1 + (d/d0)^6) decreases monotonically,
+        # pairs further than s^-1(count_cutoff) are not needed
+        d0 = cutoff * 2.0
+        if count_cutoff > 0 :
+            radius = d0 * (1.0 / count_cutoff - 1.0) ** (1.0 / 6.0)
+        else :
+            radius = np.inf
 
-            '''for ndx in self.ligndx :
-                
-                crd = ligcoords[ndx]
-                #print(grid, crd)
-                count = self.pointInGrid(crd, grid)
-                #count = 0.0
+        pairs = cKDTree(grid_table).sparse_distance_matrix(cKDTree(atoms), radius,
+                                                          output_type="ndarray")
+        counts = kernels.rational_switch(pairs["v"], d0=d0)
+        keep = counts >= count_cutoff
 
-                if count > count_cutoff :
-                    #print("found", k, i, count)
-                    try :
-                        gridMapper[k].append((ndx, count))
-                    except KeyError :
-                        pass
-            '''
-        return gridMapper
+        return sparse.csr_matrix((counts[keep], (pairs["i"][keep], pairs["j"][keep])),
+                                 shape=(grid_table.shape[0], atoms.shape[0]))
+
+    def gridPropertyMatrix(self, gridMapper, properties, count_cutoff=0.2):
+        '''
+        the atomic based properties of all the grids, the properties of a grid
+        is the sum of the atomic properties weighted by the contact numbers
+        :param gridMapper: scipy.sparse matrix, shape = [N, M], see gridAtomMap
+        :param properties: dict, { atomndx: [dim=5] }, see atomProperties
+        :param count_cutoff: float, ignore the atoms with smaller contact numbers
+        :return: ndarray, shape = [N, 5]
+        '''
+
+        weights = sparse.csr_matrix(gridMapper, dtype=np.float64, copy=True)
+        weights.data[weights.data < count_cutoff] = 0.0
+        weights.eliminate_zeros()
+
+        # mass vdw_sigma, vdw_epsilon, charge, negativity
+        atom_properties = np.array([ properties[x] for x in self.ligndx ],
+                                   dtype=np.float64).reshape((len(self.ligndx), -1))
+
+        return weights.dot(atom_properties)
 
     def gridBinProperty(self, gridMapper, properties, count_cutoff=0.2):
         '''
         get atomic based properties from the gridmapper
-        :param gridMapper: defaultdict(list)
-        :return: defaultdict(list), { grid_id, [dim=5]
+        :param gridMapper: scipy.sparse matrix, shape = [N, M], see gridAtomMap
+        :param properties: dict, { atomndx: [dim=5] }, see atomProperties
+        :param count_cutoff: float, ignore the atoms with smaller contact numbers
+        :return: defaultdict(list), { grid_id, [dim=5] }
         '''
 
-        grid_features = defaultdict(list)
-        grid_ids = sorted(gridMapper.keys())
+        features = self.gridPropertyMatrix(gridMapper, properties, count_cutoff)
 
-        #properties = self.atomProperties(self.ligndx)
+        grid_features = defaultdict(list)
+        for id in range(features.shape[0]) :
+            grid_features[id] = features[id]
 
-        for id in grid_ids :
-            # mass vdw_epsilon, vdw_sigma, charge, negativity
-            #p = np.array([ 0.0, 0.0, 0.0, 0.0, 0])
-            grid_features[id] = [[ 0.0, 0.0, 0.0, 0.0, 0], ]
+        return grid_features
 
-            grid_features[id] = [ list(np.array(properties[x[0]]) * x[1])
-                                  for x in gridMapper[id]
-                                  if (gridMapper[id] and len(x) == 2 and x[1] >= count_cutoff)
-                                  ]
+    def voxelTensor(self, grids, shape, cutoff=4.0, count_cutoff=0.2):
+        '''
+        the voxel representation of the ligand, one channel per atomic property
+        :param grids: ndarray, N*3 dim, the grid centers, see generateGrids
+        :param shape: tuple, (nx, ny, nz), number of grids in each dimension
+        :param cutoff: float, the distance cutoff of the switch function
+        :param count_cutoff: float, ignore the atoms with smaller contact numbers
+        :return: ndarray of float32, shape = [5, nx, ny, nz]
+        '''
 
-            grid_features[id] = np.sum(np.array(grid_features[id]), axis=0)
-            #grid_features[id] = (list(p))
+        gmap = self.gridAtomMap(grids, self.ligCoords(), cutoff=cutoff,
+                                count_cutoff=count_cutoff)
+        properties = self.atomProperties(self.ligndx)
+        features = self.gridPropertyMatrix(gmap, properties, count_cutoff)
 
-        return grid_features
+        # the grids are ordered with x the slowest and z the fastest
+        return np.ascontiguousarray(features.T, dtype=np.float32).reshape((-1, ) + tuple(shape))
 
     def getLigPartialCharges(self):
         '''
@@ -252,52 +388,85 @@ class GridBasedFeature :
     def atomProperties(self, ligatomndx):
         '''
         get the properties of a atom
-        mass, vdw_e, vdw_s, charge, negativity
+        mass, vdw_s, vdw_e, charge, negativity
         :param ligatomndx:
-        :return:
+        :return: dict, { atomndx: [dim=5] }
         '''
 
         properties = defaultdict(list)
+        rows = dict([ (x, i) for i, x in enumerate(self.properties_["ndx"]) ])
 
         for atomndx in ligatomndx :
-            # mass vdw_epsilon, vdw_sigma, charge, negativity
-            p = [0.0, 0.0, 0.0, 0.0, 0.0]
+            # mass vdw_sigma, vdw_epsilon, charge, negativity
+            p = self.properties_[rows[atomndx]]
+            properties[atomndx] = [float(p["eleid"]), p["sigma"], p["epsilon"],
+                                   p["charge"], p["negativity"]]
 
-            atom_parms = self.atominfor[atomndx]
+        return properties
 
-            ele = atom_parms[7]
-            if ele == "A" :
-                ele = "C"
 
-            try :
-                [e, s] = self.vdwparm[ele]
-            except :
-                e, s = 0.0, 0.0
+def voxelizePoses(ligands, receptorPDB, output="voxels", reslist=None, chain='A',
+                  gridsize=1.0, extension=10.0, cutoff=4.0, count_cutoff=0.2,
+                  shard_size=1000, compress=True):
+    '''
+    voxelize many ligand poses in the same receptor pocket, the voxels are
+    written into shards of npz files, each contains
+      voxels: float32 ndarray, shape = [n_poses, 5, nx, ny, nz],
+              channels are mass, vdw_sigma, vdw_epsilon, charge, negativity
+      names: the ligand file names of the poses
+      origin: the first grid center, gridsize: the grid size
+    The pocket grids are created once for all the poses.
+    :param ligands: list of str, the ligand pose files
+    :param receptorPDB: str, the receptor file
+    :param output: str, the output file name prefix, shards are output_00000.npz ...
+    :param reslist: list of int, the pocket residues. If None, the pocket is
+                    defined by the first ligand
+    :param chain: str, chain of the pocket residues
+    :param shard_size: int, number of poses per shard
+    :param compress: bool, write compressed npz files
+    :return: list of str, the shard file names
+    '''
 
-            try :
-                [eleid, negat] = self.eleparm[ele]
-            except :
-                eleid, negat = 0.0, 0.0
+    gf = GridBasedFeature(ligands[0], receptorPDB, gridsize)
+    if reslist is None :
+        grids, shape = gf.pocketGrids(extension=extension,
+                                      coordinates=list(gf.ligCoords().values()))
+    else :
+        grids, shape = gf.pocketGrids(reslist, chain, extension)
+
+    save = np.savez_compressed if compress else np.savez
+    shard_size = max(int(shard_size), 1)
+    shards = []
 
+    for start in range(0, len(ligands), shard_size) :
+        voxels, names = [], []
+        for ligpdb in ligands[start:start+shard_size] :
             try :
-                charges = self.getLigPartialCharges()
-                if atomndx in charges.keys() :
-                    p[3] = charges[atomndx]
-            except FileNotFoundError :
-                pass
+                gf = GridBasedFeature(ligpdb, receptorPDB, gridsize)
+                voxels.append(gf.voxelTensor(grids, shape, cutoff, count_cutoff))
+                names.append(ligpdb)
+            except Exception :
+                print("Errors: %s "%ligpdb)
 
-            p[1], p[2] = e, s
-            p[0], p[4] = eleid, negat
+        fn = "%s_%05d.npz" % (output, len(shards))
+        save(fn, voxels=np.asarray(voxels, dtype=np.float32).reshape((len(voxels), -1) + tuple(shape)),
+             names=np.array(names, dtype=str), origin=grids[0], gridsize=gridsize)
+        shards.append(fn)
+        print("Progress: %d poses voxelized into %s" % (len(names), fn))
 
-            properties[atomndx] = p
+    return shards
 
-        return properties
 
 class BindingFeature :
 
+    # the residue based features, each has one column per residue
+    residueFeatures = ["countback", "countside", "vdwback", "vdwside", "columbback", "columbside"]
+
     def __init__(self, vdwCutoff=6., vdwEnerCutoff=12.,
                  colEnerCutoff=12., contCutoff=12., disCutoff=3.5,
-                 pdbqt=True,
+                 pdbqt=True, receptorCacheSize=4,
+                 minHeavyDistance=1.5, clashCutoff=2.2, maxClashes=2,
+                 minContactFraction=0.5, pocketResidues=None,
                  ):
         if os.path.exists("AtomType.dat") and os.path.exists("elementNegativity.dat"):
             self.atomtype = "AtomType.dat"
@@ -318,44 +487,97 @@ class BindingFeature :
         self.backboneAtoms = ["C", "N", "O", "CA"]
         self.pdbqt = pdbqt
 
+        # pose pre-filter, see poseFilter
+        self.minHeavyDistance = minHeavyDistance
+        self.clashCutoff = clashCutoff
+        self.maxClashes = maxClashes
+        self.minContactFraction = minContactFraction
+        self.pocketResidues = pocketResidues
+
         # attributes
         self.vdwParameters_ = self.getVdWParams()
+        # integer atom type ids, and per type sigma and epsilon
+        self.atomTypes_ = list(self.vdwParameters_.keys())
+        self.vdwSigma_ = np.array([ self.vdwParameters_[x][0] for x in self.atomTypes_ ])
+        self.vdwEpsilon_ = np.array([ self.vdwParameters_[x][1] for x in self.atomTypes_ ])
+        # C6 and C12 of all the atom type pairs, shape = [ntypes, ntypes]
+        self.vdwC6_, self.vdwC12_ = self.vdwPairTables()
+        # parsed receptors, { content hash: (receptor atom arrays, kd-tree) }
+        self.receptorCacheSize = receptorCacheSize
+        self.receptorCache_ = {}
 
     def getVdWParams(self) :
         '''
         Get vdw parameters, mainly sigma and epsilon term in energy function
-        :inputFile: str, a library file containing atomic vdw parameters
-        :return:
+        the parameter file is read once per process, see vdwParameterTable
+        :return: dict, { atomtype: [sigma, epsilon] }
         '''
         # obtain vdw radius for different atoms
         vdwParams = defaultdict(list)
-        with open(self.atomtype) as lines :
-            for s in lines :
-                #param = []
-                if "#" not in s and ";" not in s :
-                    #print s.split()[-2].split("e")[0]
-                    ## in AtomType.dat nm
-                    ## nm to angstrom by multiply 10.0
-                    sigma   = float(s.split()[-2]) #.split("e")[0]) * ( 10 ** float(s.split()[-2].split("e")[1])) * 10.0
-                    epsilon = float(s.split()[-1]) #.split("e")[0]) * ( 10 ** float(s.split()[-1].split("e")[1])) * 10.0
-                    #param = [ sigma, epsilon ]
-                    vdwParams[s.split()[0]] = [sigma, epsilon]
+        types, sigma, epsilon = vdwParameterTable(self.atomtype)
+        for i, t in enumerate(types) :
+            vdwParams[t] = [sigma[i], epsilon[i]]
 
-        # format of vdwParams : { "C":[C12, C6] }
+        # format of vdwParams : { "C":[sigma, epsilon] }
         return vdwParams
 
     def getElementParams(self):
         '''
         get element negativity and atomic mass
+        the parameter file is read once per process, see elementParameterTable
         :return: dict, { element: [atomic mass, negativity, ] }
         '''
 
         elemParams = defaultdict(list)
-        with open(self.elenegat) as lines :
-            for s in [ x for x in lines if (x[0] not in [";", "#"] and len(x.split()) > 3 )] :
-                elemParams[ s.split()[1] ] = (int(s.split()[0]), float(s.split()[3]))
+        elements, eleid, negat = elementParameterTable(self.elenegat)
+        for i, e in enumerate(elements) :
+            elemParams[e] = (int(eleid[i]), negat[i])
         return elemParams
 
+    def ligandPropertyTable(self, ligpdb, atominfor=None):
+        '''
+        parse the atomic properties of a ligand once into a structured array
+        :param ligpdb: str, the ligand pdb or pdbqt file, partial charges
+                       are only available in pdbqt files
+        :param atominfor: dict, the atom information of the ligand, see
+                          pdbIO.parsePDB.atomInformation
+        :return: ndarray, dtype = LIGAND_PROPERTY_DTYPE, one record per atom
+                 ndx: atom index, element: element from the pdb file,
+                 eleid: atomic number, sigma and epsilon: vdw parameters,
+                 charge: partial charge, negativity: electronegativity
+        '''
+        if atominfor is None :
+            atominfor = pio.parsePDB().atomInformation(ligpdb)
+
+        charges = {}
+        if ligpdb[-5:] == "pdbqt" :
+            with open(ligpdb) as lines :
+                for s in [ x for x in lines if "ATOM" in x ] :
+                    charges[s.split()[1]] = float(s.split()[-2])
+
+        types, sigma, epsilon = vdwParameterTable(self.atomtype)
+        elements, eleid, negat = elementParameterTable(self.elenegat)
+        # one extra record of zeros for the unknown elements
+        sigma, epsilon = np.append(sigma, 0.0), np.append(epsilon, 0.0)
+        eleid, negat = np.append(eleid, 0), np.append(negat, 0.0)
+        vdwndx = dict([ (t, i) for i, t in enumerate(types) ])
+        elendx = dict([ (e, i) for i, e in enumerate(elements) ])
+
+        atomndx = list(atominfor.keys())
+        table = np.zeros(len(atomndx), dtype=LIGAND_PROPERTY_DTYPE)
+        table["ndx"] = atomndx
+        table["element"] = [ atominfor[x][7] for x in atomndx ]
+
+        # the aromatic carbon "A" in pdbqt files
+        ele = [ "C" if x == "A" else x for x in table["element"] ]
+        v = np.array([ vdwndx.get(x, len(types)) for x in ele ], dtype=np.int64)
+        e = np.array([ elendx.get(x, len(elements)) for x in ele ], dtype=np.int64)
+        table["sigma"], table["epsilon"] = sigma[v], epsilon[v]
+        table["eleid"], table["negativity"] = eleid[e], negat[e]
+        table["charge"] = [ charges.get(x, 0.0) for x in atomndx ]
+
+        return table
+
     def getXYZCoord(self, pdbline) :
         '''
         from a pdb line to get xyz data
@@ -446,281 +668,343 @@ class BindingFeature :
 
         return allDistances
 
+    def atomTypeIndex(self, atomtypes):
+        '''
+        map atom type names to the integer index of atomTypes_
+        unrecognized atom types are mapped to the "dummy" atom type DU
+        :param atomtypes: list of str, atom type names
+        :return: np.ndarray of int
+        '''
+        alias = {"N1+": "N", "L": "Cl", "CL": "Cl",
+                 "B": "Br", "BR": "Br", "R": "Br"}
+        lookup = dict([ (t, i) for i, t in enumerate(self.atomTypes_) ])
+        dummy = lookup["DU"]
+
+        return np.array([ lookup.get(t, lookup.get(alias.get(t), dummy))
+                          for t in atomtypes ], dtype=np.int64)
+
+    def getAtomArrays(self, atomLines):
+        '''
+        convert the atomID-PDBline information into arrays
+        :param atomLines: dict, { atomID: pdb line }, see getAtomInfor
+        :return: dict of arrays, the keys are
+                 xyz: np.ndarray, shape = [N, 3], coordinates in angstrom
+                 residues: list of str, residueName_ResidueIndex_Chain
+                 residue: np.ndarray of int, index of the residue of each atom
+                 backbone: np.ndarray of bool, whether the atom is a backbone atom
+                 heavy: np.ndarray of bool, whether the atom is a non-hydrogen atom
+                 vdwtype: np.ndarray of int, atom type index for vdw energies
+                 contacttype: np.ndarray of int, atom type index for contacts counting
+                 charge: np.ndarray of float, partial charges, zero if not pdbqt
+        '''
+        atomIDs = list(atomLines.keys())
+        lines = [ atomLines[x] for x in atomIDs ]
+
+        residues, resndx, residue = [], {}, []
+        for atom in atomIDs :
+            res = "_".join(atom.split("_")[1:4])
+            if res not in resndx :
+                resndx[res] = len(residues)
+                residues.append(res)
+            residue.append(resndx[res])
+
+        if self.pdbqt :
+            contacttypes = [ s.split()[-1] for s in lines ]
+            charges = [ float(s.split()[-2]) for s in lines ]
+        else :
+            contacttypes = [ s[13] for s in lines ]
+            charges = [ 0.0 ] * len(lines)
+
+        return {
+            "xyz": np.array([ self.getXYZCoord(s) for s in lines ],
+                            dtype=np.float64).reshape((-1, 3)),
+            "residues": residues,
+            "residue": np.array(residue, dtype=np.int64),
+            "backbone": np.array([ s.split()[2] in self.backboneAtoms for s in lines ],
+                                 dtype=bool),
+            "heavy": np.array([ not (s[12:16].strip().lstrip("0123456789")[:1] == "H"
+                                     or s.split()[-1] in ["H", "HD", "HS"])
+                                for s in lines ], dtype=bool),
+            "vdwtype": self.atomTypeIndex([ s.split()[-1] for s in lines ]),
+            "contacttype": self.atomTypeIndex(contacttypes),
+            "charge": np.array(charges, dtype=np.float64),
+        }
+
+    def pairList(self, receptorXYZ, ligandXYZ, cutoff=None, receptorTree=None):
+        '''
+        find the receptor-ligand atom pairs within a distance cutoff
+        with a kd-tree neighbor search
+        :param receptorXYZ: np.ndarray, shape = [N, 3], receptor coordinates
+        :param ligandXYZ: np.ndarray, shape = [M, 3], ligand coordinates
+        :param cutoff: float, distance cutoff, angstrom. Default is the largest
+                       cutoff of all the descriptors
+        :param receptorTree: cKDTree, a pre-built kd-tree of receptorXYZ
+        :return: tuple, (receptor index, ligand index, distance), sorted by
+                 receptor index then ligand index
+        '''
+        if cutoff is None :
+            cutoff = max(self.contactCutoff, self.vdwEnerCutoff,
+                         self.colEnerCutoff, self.distCutoff * 2.0)
+
+        if receptorTree is None :
+            receptorTree = cKDTree(receptorXYZ)
+
+        pairs = receptorTree.sparse_distance_matrix(cKDTree(ligandXYZ), cutoff,
+                                                    output_type="ndarray")
+        order = np.lexsort((pairs["j"], pairs["i"]))
+
+        return (pairs["i"][order].astype(np.int64),
+                pairs["j"][order].astype(np.int64),
+                pairs["v"][order])
+
+    def getComplexArrays(self, input, ligCode):
+        '''
+        from a pdb file of the receptor-ligand complex get the atom arrays
+        the receptor block is parsed only once and cached by its content hash,
+        thus for many poses against the same receptor, only the ligand is parsed
+        :param input: str, input receptor-ligand complex
+        :param ligCode: str, res-name of the ligand
+        :return: tuple, (receptor atom arrays, ligand atom arrays, receptor kd-tree)
+        '''
+        recatomLine = {}
+        ligatomLine = {}
+
+        with open(input) as lines :
+            lines = [ s for s in lines if ("ATOM" == s.split()[0]
+                                           or "HETATM" == s.split()[0]
+                                           and len(s.split()) > 5)
+                      ]
+        reclines = [ s for s in lines if ligCode != s[17:20].strip() ]
+
+        key = hashlib.sha1("".join(reclines).encode()).hexdigest()
+        if key not in self.receptorCache_ :
+            for s in reclines :
+                atomID = s[6:11].strip() + "_" +s[17:20].strip() + "_" + s[22:26].strip()+"_"+s[21]
+                recatomLine[atomID] = s
+            recAtoms = self.getAtomArrays(recatomLine)
+
+            # drop the earliest receptor if the cache is full
+            if len(self.receptorCache_) >= max(self.receptorCacheSize, 1) :
+                del self.receptorCache_[next(iter(self.receptorCache_))]
+            self.receptorCache_[key] = (recAtoms, cKDTree(recAtoms["xyz"]))
+
+        recAtoms, recTree = self.receptorCache_[key]
+
+        for s in lines :
+            if ligCode == s[17:20].strip() :
+                atomID = s[6:11].strip() + "_" +s[17:20].strip() + "_" + s[22:26].strip()+"_"+s[21]
+                ligatomLine[atomID] = s
+        ligAtoms = self.getAtomArrays(ligatomLine)
+
+        return recAtoms, ligAtoms, recTree
+
+    def _subsetTree(self, atoms, name, mask):
+        '''
+        the kd-tree of a subset of atoms, built once and kept in atoms["trees"]
+        :param atoms: dict, atom arrays, see getAtomArrays
+        :param name: str, the name of the subset
+        :param mask: np.ndarray of bool, the atoms in the subset
+        :return: cKDTree
+        '''
+        trees = atoms.setdefault("trees", {})
+        if name not in trees :
+            trees[name] = cKDTree(atoms["xyz"][mask].reshape((-1, 3)))
+
+        return trees[name]
+
+    def poseFilter(self, recAtoms, ligAtoms):
+        '''
+        cheap checks of a ligand pose before computing the descriptors
+        a pose is rejected if the minimum receptor-ligand heavy atom distance is
+        smaller than minHeavyDistance (mindist), or more than maxClashes heavy
+        atom pairs are closer than clashCutoff (clash), or the fraction of
+        ligand atoms within contactCutoff of the pocket residues (pocketResidues,
+        all receptor residues if None) is smaller than minContactFraction (pocket)
+        :param recAtoms: dict, receptor atom arrays, see getAtomArrays
+        :param ligAtoms: dict, ligand atom arrays, see getAtomArrays
+        :return: tuple, (min heavy atom distance, number of clashes,
+                 contact fraction, list of the rejection reasons)
+        '''
+        heavyTree = self._subsetTree(recAtoms, "heavy", recAtoms["heavy"])
+        if self.pocketResidues is None :
+            pocketTree = self._subsetTree(recAtoms, "pocket", np.ones(recAtoms["heavy"].shape, dtype=bool))
+        else :
+            pocket = set(self.pocketResidues)
+            pocket = np.array([ x in pocket for x in recAtoms["residues"] ], dtype=bool)
+            pocketTree = self._subsetTree(recAtoms, "pocket", pocket[recAtoms["residue"]])
+
+        ligHeavy = ligAtoms["xyz"][ligAtoms["heavy"]]
+        if ligHeavy.shape[0] and heavyTree.n :
+            min_dist = float(heavyTree.query(ligHeavy, k=1)[0].min())
+            clashes = int(heavyTree.query_ball_point(ligHeavy, self.clashCutoff,
+                                                     return_length=True).sum())
+        else :
+            min_dist, clashes = np.inf, 0
+
+        if ligAtoms["xyz"].shape[0] and pocketTree.n :
+            dist = pocketTree.query(ligAtoms["xyz"], k=1,
+                                    distance_upper_bound=self.contactCutoff)[0]
+            fraction = float(np.mean(dist <= self.contactCutoff))
+        else :
+            fraction = 0.0
+
+        reasons = []
+        if min_dist < self.minHeavyDistance :
+            reasons.append("mindist")
+        if clashes > self.maxClashes :
+            reasons.append("clash")
+        if fraction < self.minContactFraction :
+            reasons.append("pocket")
+
+        return min_dist, clashes, fraction, reasons
+
     def switchFuction(self, x, d0, m=12, n=6):
         """
         for countting, implement a rational switch function to enable a smooth transition
         the function is lik  s= [1 - (x/d0)^6] / [1 - (x/d0)^12]
         d0 is a cutoff, should be twice the larget than the distance cutoff
-        :param x: float
+        :param x: float, or np.ndarray
         :param d0: distance cutoff, should be 2 times of normal cutoff
         :param m: int
         :param n: int
-        :return: float
+        :return: float, or np.ndarray
         """
-        return(1.0 - math.pow((x / d0), n)) / (1.0 - math.pow((x / d0), m))
+        return kernels.rational_switch(x, d0=d0, n=n, m=m)
 
-    def residueCounts(self, alldistpairs, atomDetailInfor) :
+    def _residueSums(self, recndx, values, recAtoms):
         """
-        input all the distances pairs
-        return the number of contacts
-        alldistpairs: the porteinID-LigID-Distance inforamtion
-        atomdetailInfor : the atomID-PDBline information
-        distance unit is angstrom
-        :param alldistpairs: dictionary, all distances
-        :param atomDetailInfor: dictionary, detail information
-        :return:
+        accumulate pair values per receptor residue, backbone and side-chain seperated
+        :param recndx: np.ndarray, receptor atom index of each pair
+        :param values: np.ndarray, the value of each pair
+        :param recAtoms: dict, receptor atom arrays, see getAtomArrays
+        :return: tuple, (backbone sums, sidechain sums), np.ndarray of size n_residues
         """
+        nres = len(recAtoms["residues"])
 
-        atoms = alldistpairs.keys()
-        recRes =[]
-
-
-        for atom in atoms :
-            res = atom.split("+")[0].split("_")[1] + "_" + \
-                  atom.split("+")[0].split("_")[2] + "_" + \
-                  atom.split("+")[0].split("_")[3]
-
-            # get the full residue_seq list
-            if res not in recRes :
-                recRes.append(res)
-
-        # counts between backbone (or side-chain) and ligand
-        backCount = {}  # format is : {"ARE175": 0 }
-        sideCount = {}  # format is : {"ARE175": 0 }
-        for res in recRes :
-            backCount[res] = 0.0
-            sideCount[res] = 0.0
-
-        # find all the
-        for atom in atoms :
-            # first set a distance cutoff check, only short range distances are considered
-            distance = alldistpairs[atom]
-            if distance <= self.contactCutoff :
-                line = atomDetailInfor[atom.split("+")[0]]
-
-                ### add more chain ID, in case you have several different chains
-                ### better, you may use 1 2 3 4 as your chain id, here choose original chain id
-                ### residueID  residueName_ResidueIndex_Chain
-                residueID = atom.split("+")[0].split("_")[1] + "_" + \
-                            atom.split("+")[0].split("_")[2] + "_" + \
-                            atom.split("+")[0].split("_")[3]
-                #residueID = line[17:20].strip() + "_" + line[22:26].strip()
-                ## count contacts in backbones
-                if line.split()[2] in self.backboneAtoms :
-                    backCount[residueID] += self.switchFuction(distance, self.distCutoff*2.0)
-
-                ## count contacts in sidechains
-                elif line.split()[2] not in self.backboneAtoms :
-                    sideCount[residueID] += self.switchFuction(distance, self.distCutoff*2.0)
-
-        return recRes, backCount, sideCount
+        # one bincount, bin 2*i for the backbone and 2*i+1 for the sidechain of residue i
+        bins = recAtoms["residue"][recndx] * 2 + (~recAtoms["backbone"][recndx])
+        sums = np.bincount(bins, weights=values, minlength=2 * nres).reshape((nres, 2))
 
-    def atomicVdWEnergy(self, atomtype1, atomtype2, distance) :
+        return sums[:, 0], sums[:, 1]
+
+    def residueCounts(self, pairs, recAtoms) :
         """
-        Calculate atomic level Van der Waals interaction energy
-        VdW potential calculation, using combination rule 2
-        vdwParam is a dictionary list, eg. { "O": [ 0.22617E-02, 0.74158E-0.6 ]; }
-        unit of the parameters: nanometer
-        :param atomtype1:
-        :param atomtype2: dictionary, parameters of atom type and sigma epsilon
-        :param distance: float
-        :return: float, short range vdw energy
+        input the receptor-ligand atom pairs
+        return the number of contacts per residue
+        distance unit is angstrom
+        :param pairs: tuple, (receptor index, ligand index, distance), see pairList
+        :param recAtoms: dict, receptor atom arrays, see getAtomArrays
+        :return: tuple, (residues, backbone counts, sidechain counts)
         """
+        recndx, ligndx, distances = pairs
+        recRes = recAtoms["residues"]
 
-        Sigma_i   = self.vdwParameters_[atomtype1][0]
-        Epsilon_i = self.vdwParameters_[atomtype1][1]
-        Sigma_j   = self.vdwParameters_[atomtype2][0]
-        Epsilon_j = self.vdwParameters_[atomtype2][1]
-
-        # combination rule 2 of vdw MM force field
-        sigma_ij   = 0.5 * ( Sigma_i + Sigma_j )
-        epsilon_ij = math.sqrt( Epsilon_i * Epsilon_j )
+        # first set a distance cutoff check, only short range distances are considered
+        sel = distances <= self.contactCutoff
+        counts = self.switchFuction(distances[sel], self.distCutoff*2.0)
 
-        # Lennard-Jones Potential energy
-        # the sigma is the distance at the lowest energy point, in unit of angstrom
-        # (sigma / distance)^6
-        C6  = 4.0 * epsilon_ij * (sigma_ij**6)
-        C12 = 4.0 * epsilon_ij * (sigma_ij**12)
-        d6  = distance ** 6
-        d12 = distance ** 12
+        ### residueID  residueName_ResidueIndex_Chain
+        ### format is : {"ARG_175_A": 0 }
+        back, side = self._residueSums(recndx[sel], counts, recAtoms)
 
-        return C12 / d12 - C6 / d6
+        return recRes, dict(zip(recRes, back)), dict(zip(recRes, side))
 
-    def resVdWContribution(self, alldistpairs, recatomInfor, ligatomInfor,
-                           vdwParams, repulsionMax=10.0 ) :
+    def vdwPairTables(self):
         """
-        accumulated vdw for side-chain or backbone
-        alldistpairs: the porteinID-LigID-Distance inforamtion
-        atomdetailInfor : the atomID-PDBline information
-        :param alldistpairs: dict, all distances
-        :param recatomInfor:
-        :param ligatomInfor: dict, the ligand-ligand_line information
-        :param vdwParams:  dict, all vdw parameters
-        :param pdbqt: bool, whether it is a pdbqt file
-        :return:
+        the Lennard-Jones C6 and C12 terms of all the atom type pairs,
+        using combination rule 2 of vdw MM force field
+        :return: tuple, (C6, C12), np.ndarray of shape [ntypes, ntypes],
+                 indexed by the atom type ids of atomTypes_
         """
+        sigma_ij   = 0.5 * (self.vdwSigma_[:, None] + self.vdwSigma_[None, :])
+        epsilon_ij = np.sqrt(self.vdwEpsilon_[:, None] * self.vdwEpsilon_[None, :])
 
-        atoms = alldistpairs.keys()
-        recRes =[]
-
-        #backboneAtoms = ["C", "N", "O", "CA"]
+        # the sigma is the distance at the lowest energy point, in unit of nanometer
+        C6  = 4.0 * epsilon_ij * (sigma_ij ** 6)
+        C12 = 4.0 * epsilon_ij * (sigma_ij ** 12)
 
-        for atom in atoms:
-            res = atom.split("+")[0].split("_")[1] + "_" + \
-                  atom.split("+")[0].split("_")[2] + "_" + \
-                  atom.split("+")[0].split("_")[3]
-            if res not in recRes:
-                recRes.append(res)  # get the full residue_seq_chain list
+        return C6, C12
 
-        backVdWEner = {}  # format is : {"ARE_175_A": -1.20 }
-        sideVdWEner = {}  # format is : {"ARE_175_A": -1.20 }
-        for res in recRes:
-            backVdWEner[res] = 0.0
-            sideVdWEner[res] = 0.0
-
-        for atom in atoms :
+    def atomicVdWEnergy(self, atomtype1, atomtype2, distance) :
+        """
+        Calculate atomic level Van der Waals interaction energy
+        VdW potential calculation, using combination rule 2
+        unit of the parameters: nanometer
+        :param atomtype1: str, or int atom type id, or np.ndarray of the ids
+        :param atomtype2: str, or int atom type id, or np.ndarray of the ids
+        :param distance: float, or np.ndarray, unit nanometer
+        :return: float, or np.ndarray, short range vdw energy
+        """
+        if isinstance(atomtype1, str) :
+            atomtype1 = self.atomTypeIndex([atomtype1])[0]
+        if isinstance(atomtype2, str) :
+            atomtype2 = self.atomTypeIndex([atomtype2])[0]
 
-            ## in recatomInfor, the whole original line of a pdb file is maintained, so as ligatomInfor
-            recline = recatomInfor[atom.split("+")[0]]
-            ligline = ligatomInfor[atom.split("+")[1]]
+        # Lennard-Jones Potential energy, C12 / d^12 - C6 / d^6
+        d6 = 1.0 / np.asarray(distance, dtype=np.float64) ** 6
 
-            residueID = atom.split("+")[0].split("_")[1] + "_" + atom.split("+")[0].split("_")[2] + "_" \
-                        +  atom.split("+")[0].split("_")[3]
+        return (self.vdwC12_[atomtype1, atomtype2] * d6 - self.vdwC6_[atomtype1, atomtype2]) * d6
 
-            # atom element, related to the vdw C6 and C12 terms
-            #atomtype1 = proAtomTypes[ recline.split()[2] + "_" + recline[17:20].strip() ]
-            # if this is a pdbqt file line
-            if self.pdbqt :
-                atomtype1 = recline.split()[-1]
-                atomtype2 = ligline.split()[-1]
-            else :
-                # how to define the ligand atom type? Very difficult. May need to transfer file into Mol2 file
-                # then decide the atom type from the mol2 file
-                # atomtype2 = None  # atom element, related to the vdw radius
-                # or, the case is, if there is no element information in the last column of the pdb line?
-                # need to be completed here
-                atomtype1 = recline.split()[-1]
-                atomtype2 = ligline.split()[-1]
-
-            if atomtype1 not in vdwParams.keys() :
-                if atomtype1 == " N1+" :
-                    atomtype1 = "N"
-                elif atomtype1 in ["L", "CL"]:
-                    atomtype1 = "Cl"
-                elif atomtype1 in ["B", "BR"]:
-                    atomtype1 = "Br"
-                else :
-                    atomtype1 = "DU"
-            if atomtype2 not in vdwParams.keys() :
-                if atomtype2 == " N1+":
-                    atomtype2 = "N"
-                elif atomtype2 in ["L", "CL", "Cl"]:
-                    atomtype1 = "Cl"
-                elif atomtype2 in ["B", "BR", "R", "Br"]:
-                    atomtype1 = "Br"
-                else :
-                    atomtype2 = "DU"
+    def resVdWContribution(self, pairs, recAtoms, ligAtoms, repulsionMax=10.0 ) :
+        """
+        accumulated vdw for side-chain or backbone
+        :param pairs: tuple, (receptor index, ligand index, distance), see pairList
+        :param recAtoms: dict, receptor atom arrays, see getAtomArrays
+        :param ligAtoms: dict, ligand atom arrays, see getAtomArrays
+        :param repulsionMax: float, the maximum vdw energy of a residue
+        :return: tuple, (residues, backbone energies, sidechain energies)
+        """
+        recndx, ligndx, distances = pairs
+        recRes = recAtoms["residues"]
 
-            # calculate L J potential per residue
-            if alldistpairs[atom] <= self.vdwEnerCutoff :
-                # transfer angstrom to nanometer by multiplying 0.1
-                energy = self.atomicVdWEnergy(atomtype1, atomtype2, alldistpairs[atom] * 0.1, vdwParams)
-            else:
-                energy = 0.0
-                #energy = self.atomicVdWEnergy(atomtype1, atomtype2, maxCutoff, vdwParams)
+        # calculate L J potential per residue
+        sel = distances <= self.vdwEnerCutoff
+        recndx = recndx[sel]
 
-            if recline.split()[2] in self.backboneAtoms:
-                backVdWEner[residueID] += energy
-            else:
-                sideVdWEner[residueID] += energy
+        # transfer angstrom to nanometer by multiplying 0.1
+        energy = self.atomicVdWEnergy(recAtoms["vdwtype"][recndx],
+                                      ligAtoms["vdwtype"][ligndx[sel]],
+                                      distances[sel] * 0.1)
 
-        for key in backVdWEner.keys():
-            if backVdWEner[key] > repulsionMax:
-                backVdWEner[key] = repulsionMax
-        for key in sideVdWEner.keys():
-            if sideVdWEner[key] > repulsionMax:
-                sideVdWEner[key] = repulsionMax
+        back, side = self._residueSums(recndx, energy, recAtoms)
+        back = np.minimum(back, repulsionMax)
+        side = np.minimum(side, repulsionMax)
 
-        return recRes, backVdWEner, sideVdWEner
+        return recRes, dict(zip(recRes, back)), dict(zip(recRes, side))
 
-    def contactsAtomtype(self, alldistpairs, recatomInfor, ligatomInfor,):
+    def contactsAtomtype(self, pairs, recAtoms, ligAtoms):
 
         """
-        # vdw counting based on different atom types
-        # alldistpairs: the porteinID-LigID-Distance inforamtion
-        # atomdetailInfor : the atomID-PDBline information
-        # vdwParams is the C6 and C12 terms for different atom types
-        :param alldistpairs:
-        :param recatomInfor:
-        :param ligatomInfor:
-        :param pdbqt: bool, whether it is a pdbqt file
-        :return:
+        # contacts counting based on different atom types
+        # unrecognized atomtype occur, "dummy" atomtype is used
+        :param pairs: tuple, (receptor index, ligand index, distance), see pairList
+        :param recAtoms: dict, receptor atom arrays, see getAtomArrays
+        :param ligAtoms: dict, ligand atom arrays, see getAtomArrays
+        :return: dict, { "recAtomType_ligAtomType": counts }
         """
-        atoms = alldistpairs.keys()
-        atomTypeCounts = {}
-        for atomT1 in self.vdwParameters_.keys() :
-            for atomT2 in self.vdwParameters_.keys() :
-                atomTypeCounts[ atomT1 + "_" + atomT2 ] = 0.0
-
-        for atom in atoms :
-            distance = alldistpairs[atom]
-            if distance <= self.distCutoff * 2 :
-                recline = recatomInfor[atom.split("+")[0]]
-                ligline = ligatomInfor[atom.split("+")[1]]
-
-                # unrecognized atomtype occur, "dummy" atomtype is used
-                # create all the combinations of the atomtypes known
-                if self.pdbqt:
-                    ligAtom = ligline.split()[-1]
-                else :
-                    #ligAtom = ligline.split()[-1]
-                    ligAtom = ligline[13]
+        recndx, ligndx, distances = pairs
+        ntypes = len(self.atomTypes_)
 
-                if ligAtom not in self.vdwParameters_.keys():
-                    if ligAtom == "N1+":
-                        ligAtom = "N"
+        sel = distances <= self.distCutoff * 2
+        combination = recAtoms["contacttype"][recndx[sel]] * ntypes + \
+                      ligAtoms["contacttype"][ligndx[sel]]
+        # apply a switch function to smooth the transition
+        counts = np.bincount(combination,
+                             weights=self.switchFuction(distances[sel], self.distCutoff*2.0),
+                             minlength=ntypes * ntypes)
 
-                    elif ligAtom in ["L", "CL", "Cl"] :
-                        ligAtom = "Cl"
-                    elif ligAtom in ["B", "BR", "Br", "R"] :
-                        ligAtom = "Br"
-                    else:
-                        ligAtom = "DU"
-                        print("DU {}".format(ligAtom), ligline)
+        # create all the combinations of the atomtypes known
+        combines = [ atomT1 + "_" + atomT2 for atomT1 in self.atomTypes_
+                     for atomT2 in self.atomTypes_ ]
 
+        return dict(zip(combines, counts))
 
-                if self.pdbqt :
-                    recAtom = recline.split()[-1]
-                else :
-                    #recAtom = recline.split()[-1]
-                    recAtom = recline[13]
-
-                if recAtom not in self.vdwParameters_.keys() :
-                    if recAtom == "N1+" :
-                        recAtom = "N"
-                    elif recAtom == "CL" :
-                        recAtom = "Cl"
-                    else :
-                        recAtom = "DU"
-
-                atomTypeCombination = recAtom + "_" + ligAtom
-                if atomTypeCombination not in atomTypeCounts.keys():
-                    # apply a switch function to smooth the transition
-                    atomTypeCounts[atomTypeCombination] = self.switchFuction(distance, self.distCutoff*2.0)
-                else:
-                    atomTypeCounts[atomTypeCombination] += self.switchFuction(distance, self.distCutoff*2.0)
-
-        return atomTypeCounts
-
-    def coulombE(self, alldistpairs, recatomInfor, ligatomInfor,
-                 dielectric=1.0,
-                 ):
+    def coulombE(self, pairs, recAtoms, ligAtoms, dielectric=1.0,):
         """
         calculate residue-ligand interaction coulomb energies
-        :param alldistpairs: atom-distance information
-        :param recatomInfor: dict, atom_index: atom_line
-        :param ligatomInfor: dict, atom_index: atom_line
-        :param maxCutoff: float, cutoff of the columbic eneriges
+        :param pairs: tuple, (receptor index, ligand index, distance), see pairList
+        :param recAtoms: dict, receptor atom arrays, see getAtomArrays
+        :param ligAtoms: dict, ligand atom arrays, see getAtomArrays
         :param dielectric: float, dielectric constant
         :return: tuple, (residues, backbone energies, sidechain energies)
         """
@@ -729,194 +1013,372 @@ class BindingFeature :
         ## f = 1 / (4 * pi * epsilon) = 138.935 485 kJ * nm / (mol * e ^2)
         f = 138.935485
 
-        ## all pair of atoms
-        atoms = alldistpairs.keys()
-        recRes = []
-
-        for atom in atoms:
-            res = atom.split("+")[0].split("_")[1] + "_" + \
-                  atom.split("+")[0].split("_")[2] + "_" + \
-                  atom.split("+")[0].split("_")[3]
-            if res not in recRes:
-                recRes.append(res)
-                # get the full residue_seq list
-
-        backElectroEner, sideElectroEner = {}, {}  # format is : {"ARE175": -1.20 }
-        for res in recRes:
-            backElectroEner[res] = 0.0
-            sideElectroEner[res] = 0.0
-
-        for atom in atoms:
-            if alldistpairs[atom] <= self.vdwEnerCutoff:  #maxCutoff:
-
-                recline = recatomInfor[atom.split("+")[0]]
-                ligline = ligatomInfor[atom.split("+")[1]]
-                #residueID = atom.split("+")[0].split("_")[1] + "_" + atom.split("+")[0].split("_")[2]
-                res = atom.split("+")[0].split("_")[1] + "_" + \
-                      atom.split("+")[0].split("_")[2] + "_" + \
-                      atom.split("+")[0].split("_")[3]
-
-                #q1 = RecCharges[ recline[16:20].strip() + "_" + recline[12:16].strip()]
-                #q2 = LigCharges[ ligline[16:20].strip() + "_" + ligline[12:16].strip()]
-                if self.pdbqt :
-                    q1 = float(recline.split()[-2])
-                    q2 = float(ligline.split()[-2])
-                else :
-                    q1, q2 = 0., 0.
+        recndx, ligndx, distances = pairs
+        recRes = recAtoms["residues"]
 
-                if recline.split()[2] in self.backboneAtoms :
-                    #if atom.split("+")[0].split("_")[0] in backboneAtoms :
-                    # from angstrom to nanometer
-                    backElectroEner[res] += f * q1 * q2 /(alldistpairs[atom] * 0.1 * dielectric)
-                else :
-                    # from angstrom to nanometer
-                    sideElectroEner[res] += f * q1 * q2 /(alldistpairs[atom] * 0.1 * dielectric)
+        sel = distances <= self.colEnerCutoff
+        recndx = recndx[sel]
+        q1 = recAtoms["charge"][recndx]
+        q2 = ligAtoms["charge"][ligndx[sel]]
+
+        # from angstrom to nanometer
+        energy = f * q1 * q2 / (distances[sel] * 0.1 * dielectric)
+
+        back, side = self._residueSums(recndx, energy, recAtoms)
+
+        return recRes, dict(zip(recRes, back)), dict(zip(recRes, side))
+
+    def caseFeatures(self, pdbfilename, ligCode, dielec=4.0, atoms=None):
+        """
+        calculate all the descriptors of one receptor-ligand complex
+        :param pdbfilename: str, input receptor-ligand complex
+        :param ligCode: str, res-name of the ligand
+        :param dielec: float, dielectric constant
+        :param atoms: tuple, the parsed complex, see getComplexArrays
+        :return: tuple, (residues, { feature name: { residue: value } }, atomTypeCounts)
+        """
+        # get atom information, the receptor is parsed once for all the poses
+        if atoms is None :
+            atoms = self.getComplexArrays(input=pdbfilename, ligCode=ligCode)
+        recAtoms, ligAtoms, recTree = atoms
+
+        # one neighbor search, all the descriptors share the same pair list
+        pairs = self.pairList(recAtoms["xyz"], ligAtoms["xyz"], receptorTree=recTree)
+
+        # counting contacts of atom pairs. Backbone and SideChain are seperated.
+        reslist1, backcount, sidecount = self.residueCounts(pairs, recAtoms)
+        # calculate Van der Waals contributions. Backbone and SideChain are seperated
+        reslist2, backvan, sidevan = self.resVdWContribution(pairs, recAtoms, ligAtoms)
+
+        # for all the atomtypes combinations, what are the contacts counts given a cutoff?
+        atomTypeCounts = self.contactsAtomtype(pairs, recAtoms, ligAtoms)
+
+        reslist3, backcol, sidecol = self.coulombE(pairs, recAtoms, ligAtoms,
+                                                   dielectric=dielec,
+                                                   )
+
+        reslist = sorted(list(set.intersection(set(reslist1), set(reslist2), set(reslist3))))
+        features = dict(zip(self.residueFeatures,
+                            [backcount, sidecount, backvan, sidevan, backcol, sidecol]))
 
-        return recRes, backElectroEner, sideElectroEner
+        return reslist, features, atomTypeCounts
+
+    def featureColumns(self, reslist, atomCombine):
+        """
+        the names of the output columns
+        :param reslist: list, residues of the residue based features
+        :param atomCombine: list, atom type combinations
+        :return: list of str
+        """
+        colnames = []
+        for cn in self.residueFeatures :
+            colnames += [cn+"_" + x for x in reslist]
+
+        colnames += ["atomTCount" + "_" + x for x in atomCombine]
+
+        return colnames
+
+    def featurizeShard(self, cases, reslist, atomCombine, dielec=4.0, prefilter=None):
+        """
+        calculate the feature vectors of a list of complexes
+        :param cases: list of tuple, (complex file name, ligand code)
+        :param reslist: list, residues of the residue based features
+        :param atomCombine: list, atom type combinations
+        :param dielec: float, dielectric constant
+        :param prefilter: str, None, reject or flag. Check the poses with poseFilter,
+                          the failed poses are skipped (reject) or kept (flag)
+        :return: tuple, (case names, feature matrix, failed (case name, error)
+                 pairs, failed poseFilter records, seconds used)
+        """
+        start = time.time()
+        case_names, allcases, errors, rejected = [], [], [], []
+
+        for pdbfilename, ligCode in cases :
+            try :
+                atoms = self.getComplexArrays(input=pdbfilename, ligCode=ligCode)
+
+                # the cheap checks before computing the descriptors
+                if prefilter is not None :
+                    min_dist, clashes, fraction, reasons = self.poseFilter(atoms[0], atoms[1])
+                    if len(reasons) :
+                        rejected.append((pdbfilename, min_dist, clashes, fraction,
+                                         ";".join(reasons)))
+                        if prefilter == "reject" :
+                            continue
+
+                rl, features, atomTypeCounts = self.caseFeatures(pdbfilename, ligCode,
+                                                                 dielec, atoms)
+
+                case = []
+                for cn in self.residueFeatures :
+                    case += [features[cn][x] for x in reslist]
+                case += [atomTypeCounts[x] for x in atomCombine]
+
+                case_names.append(pdbfilename)
+                allcases.append(case)
+            except Exception as e :
+                errors.append((pdbfilename, repr(e)))
+
+        n_cols = len(self.residueFeatures) * len(reslist) + len(atomCombine)
+        allcases = np.asarray(allcases, dtype=np.float64).reshape((len(allcases), n_cols))
+
+        return case_names, allcases, errors, rejected, time.time() - start
 
     def extractFeatures(self, inputfile="input.txt",
                         outputfile="output.dat",
                         dielec=4.0,
                         feature_terms = [ True, True, True, True],
+                        n_jobs=1, shard_size=1000, resume=False,
+                        output_format="csv", prefilter=None,
                         ) :
         """
         extract necessary short range interaction features
+
+        The complexes are processed in shards, optionally by a pool of worker
+        processes. The features of each shard are appended to the output in
+        the input order as soon as the shard is done, and a checkpoint file
+        (outputfile + ".ckpt") records the completed shards, thus a broken
+        run could be resumed. The columns are fixed by the first complex.
+
+        With output_format="npz", each shard is written as a sparse matrix
+        file, outputfile "features.npz" gives the shards features_00000.npz,
+        features_00001.npz ..., see saveSparseFeatures and loadSparseFeatures.
+
         :param inputfile: str, file containing two cols, filename and ligand code
-        :param outputfile: str, file containing all energy terms
-        :param vdwCountCutoff: float
-        :param vdwEnerCutoff: float
-        :param colEnerCutoff: float
-        :param dielec:
+        :param outputfile: str, file containing all energy terms. The complex names
+                           and the failed complexes with their errors are written
+                           to outputfile-stem + "_names.dat" and "_errors.log"
+        :param dielec: float, dielectric constant
+        :param n_jobs: int, number of worker processes
+        :param shard_size: int, number of complexes per shard
+        :param resume: bool, continue from the last completed shard
+        :param output_format: str, csv or npz, dense text or sparse matrix output
+        :param prefilter: str, None, reject or flag. Check the poses with poseFilter
+                          before computing the descriptors, the failed poses are
+                          skipped (reject) or kept (flag), and recorded in the side
+                          table outputfile-stem + "_rejected.csv"
         :return:
         """
 
-        error_log = open("./error.log", 'w')
-        # the Van der Waals interaction parameters,
-        # the format is: { "C" : [0.339, 0.359824]; "DU" : [0.339, 0.359] }
-        vdwParams = self.getVdWParams()
-
         with open(inputfile) as lines :
-            fnames_ligs = [ (x.split()[0], x.split()[1]) for x in lines if "#" not in x ]
-            pdbfileLig = dict(fnames_ligs)
+            fnames_ligs = [ (x.split()[0], x.split()[1]) for x in lines
+                            if "#" not in x and len(x.split()) > 1 ]
+
+        shard_size = max(int(shard_size), 1)
+        shards = [ fnames_ligs[i:i+shard_size] for i in range(0, len(fnames_ligs), shard_size) ]
+
+        ckpt_file = outputfile + ".ckpt"
+        stem = os.path.splitext(outputfile)[0]
+        outputs = { "output": outputfile, "names": stem + "_names.dat",
+                    "errors": stem + "_errors.log" }
+        if output_format == "npz" :
+            # the shards are separated files, written as a whole
+            del outputs["output"]
+        if prefilter is not None :
+            outputs["rejected"] = stem + "_rejected.csv"
+
+        ckpt = None
+        if resume and os.path.exists(ckpt_file) :
+            with open(ckpt_file) as lines :
+                ckpt = json.load(lines)
+            if ckpt["inputfile"] != inputfile or ckpt["shard_size"] != shard_size \
+                    or ckpt["n_cases"] != len(fnames_ligs) \
+                    or sorted(ckpt["offsets"].keys()) != sorted(outputs.keys()) :
+                print("Warning: checkpoint %s does not match the input, start over. " % ckpt_file)
+                ckpt = None
+
+        if ckpt is None :
+            # the column layout is determined by the first complex
+            reslist, atomCombine = None, None
+            for pdbfilename, ligCode in fnames_ligs :
+                try :
+                    rl, features, atomTypeCounts = self.caseFeatures(pdbfilename, ligCode, dielec)
+                    reslist, atomCombine = rl, sorted(atomTypeCounts.keys())
+                    break
+                except Exception :
+                    continue
+            if reslist is None :
+                print("Errors: no complex could be processed. ")
+                return 0
+
+            ckpt = { "inputfile": inputfile, "shard_size": shard_size,
+                     "n_cases": len(fnames_ligs), "shards_done": 0,
+                     "reslist": reslist, "atomCombine": atomCombine, "offsets": {} }
+
+            handles = dict([ (k, open(v, "w")) for k, v in outputs.items() ])
+            if output_format == "npz" :
+                for fn in sparseShardFiles(outputfile) :
+                    os.remove(fn)
+            else :
+                handles["output"].write("# " + ",".join(self.featureColumns(reslist, atomCombine)) + "\n")
+            if prefilter is not None :
+                handles["rejected"].write("# name,min_heavy_distance,clashes,contact_fraction,reasons\n")
+        else :
+            # drop the records written after the last checkpoint
+            handles = {}
+            for k, v in outputs.items() :
+                handles[k] = open(v, "r+")
+                handles[k].seek(ckpt["offsets"][k])
+                handles[k].truncate()
+            print("Resume from shard %d out of %d" % (ckpt["shards_done"], len(shards)))
+
+        todo = shards[ckpt["shards_done"]:]
+        worker_args = (self, ckpt["reslist"], ckpt["atomCombine"], dielec, prefilter)
+
+        if n_jobs > 1 and len(todo) > 1 :
+            pool = multiprocessing.Pool(processes=min(n_jobs, len(todo)),
+                                        initializer=_init_shard_worker,
+                                        initargs=worker_args)
+            results = pool.imap(_featurize_shard_worker, todo)
+        else :
+            pool = None
+            _init_shard_worker(*worker_args)
+            results = map(_featurize_shard_worker, todo)
 
-        allcases = []
-        colnames = []
-        num_cols = 0
-        case_names = []
-
-        for i in range(len(pdbfileLig.keys())) :
-            print("Progress: no. %d file, out of %d"%(i, len(pdbfileLig.keys())))
-
-            # obtain pro-lig complex file name
-            pdbfilename = fnames_ligs[i][0]
-
-            # get atom information
-            receptorXYZ, ligandXYZ, recatomDetailInfor, ligatomDetailInfor = \
-                self.getAtomInfor(input=pdbfilename, ligCode=fnames_ligs[i][1])
-
-            alldistpairs = self.atomDistMatrix(receptorXYZ, ligandXYZ)
-            # containing all the atom-atom distances data
-
-            # counting contacts of atom pairs. Backbone and SideChain are seperated.
-            # this function pass the test
-            reslist1, backcount, sidecount = self.residueCounts(alldistpairs,
-                                                                recatomDetailInfor,
-                                                                )
-            # calculate Van der Waals contributions. Backbone and SideChain are seperated
-            # this function works fine
-            reslist2, backvan, sidevan = self.resVdWContribution(alldistpairs,
-                                                                 recatomDetailInfor,
-                                                                 ligatomDetailInfor,
-                                                                 vdwParams ,
-                                                                 pdbqt=False,
-                                                                 )
-
-            # for all the atomtypes combinations, what are the contacts counts given a cutoff as 6.0 angstrom?
-            # this function passes the test and works fine
-            atomTypeCounts = self.contactsAtomtype(alldistpairs,
-                                                   recatomDetailInfor,
-                                                   ligatomDetailInfor,
-                                                   vdwParams,
-                                                    )
-
-            reslist3, backcol, sidecol = self.coulombE(alldistpairs,
-                                                       recatomDetailInfor,
-                                                       ligatomDetailInfor,
-                                                       dielectric=dielec,
-                                                       )
-
-            case = []
-
-            # now, print the information into files
-            if i == 0:
-                reslist = sorted(list(set.intersection(set(reslist1), set(reslist2), set(reslist3))))
-                atomCombine = sorted(atomTypeCounts.keys())
-
-                for cn in ["countback", "countside", "vdwback", "vdwside", "columbback", "columbside"]:
-                    colnames += [cn+"_" + x for x in reslist]
-
-                colnames += ["atomTCount" + "_" + x for x in atomCombine]
-
-                num_cols = len(colnames)
-                # case_names.append(pdbfilename)
+        try :
+            for case_names, allcases, errors, rejected, seconds in results :
+                i = ckpt["shards_done"]
+
+                # output the features
+                if output_format == "npz" :
+                    saveSparseFeatures(sparseShardName(outputfile, i), allcases,
+                                       self.featureColumns(ckpt["reslist"], ckpt["atomCombine"]),
+                                       case_names)
+                else :
+                    np.savetxt(handles["output"], allcases, fmt="%.3f", delimiter=",")
+                if len(case_names) :
+                    handles["names"].write(("," if handles["names"].tell() else "")
+                                           + ",".join(case_names))
+                for pdbfilename, error in errors :
+                    handles["errors"].write("%s %s\n" % (pdbfilename, error))
+                    print("Errors: %s %s" % (pdbfilename, error))
+                if prefilter is not None :
+                    for record in rejected :
+                        handles["rejected"].write("%s,%.3f,%d,%.3f,%s\n" % record)
+
+                for k in handles.keys() :
+                    handles[k].flush()
+                    ckpt["offsets"][k] = handles[k].tell()
+                ckpt["shards_done"] = i + 1
+                with open(ckpt_file + ".tmp", "w") as tofile :
+                    json.dump(ckpt, tofile)
+                os.replace(ckpt_file + ".tmp", ckpt_file)
+
+                print("Progress: shard %d out of %d, %d complexes in %.2f s, %.2f complexes/s"
+                      % (i, len(shards), len(shards[i]), seconds,
+                         len(shards[i]) / max(seconds, 1e-6)))
+        finally :
+            if pool is not None :
+                pool.close()
+                pool.join()
+
+        handles["names"].write("\n")
+        for k in handles.keys() :
+            handles[k].close()
+        os.remove(ckpt_file)
 
-            try :
+        return 1
 
-                # countback and countside
-                case += [backcount[x] for x in reslist]
-                case += [sidecount[x] for x in reslist]
+def sparseShardName(fname, i):
+    '''
+    the file name of a sparse feature shard, features.npz gives features_00000.npz ...
+    :param fname: str, the sparse feature file name
+    :param i: int, the shard index
+    :return: str
+    '''
+    return "%s_%05d.npz" % (os.path.splitext(fname)[0], i)
 
-                # vdwback and vdwside
-                case += [backvan[x] for x in reslist]
-                case += [sidevan[x] for x in reslist]
 
-                # columbback and cloumbback
-                case += [backcol[x] for x in reslist]
-                case += [sidecol[x] for x in reslist]
+def sparseShardFiles(fname):
+    '''
+    the existing shard files of a sparse feature file, in shard order
+    :param fname: str, the sparse feature file name
+    :return: list of str
+    '''
+    stem = os.path.splitext(fname)[0]
+    shards = [ x for x in glob.glob(stem + "_*.npz")
+               if re.match(r"^_\d{5}\.npz$", x[len(stem):]) ]
 
-                # atomTcount
-                case += [atomTypeCounts[x] for x in atomCombine]
-                case_names.append(pdbfilename)
-                allcases.append(case)
+    return sorted(shards)
 
-            except :
-                if num_cols == 0 :
-                    num_cols = len(allcases[-1])
-                #case = [ 0.0 ] * num_cols
-                error_log.write("%s errors here \n"%pdbfilename)
-                print("Errors: %s "%pdbfilename)
 
-        tofile = open("ligand_features_name.dat", "w")
-        tofile.write(",".join(case_names)+"\n")
+def saveSparseFeatures(fname, X, columns, names=None):
+    '''
+    save a feature matrix in the sparse CSR format, with its column names
+    :param fname: str, output npz file name
+    :param X: ndarray, or scipy.sparse matrix, shape = [N, M]
+    :param columns: list of str, M column names
+    :param names: list of str, N row names, such as the complex file names
+    :return: str, the output file name
+    '''
+    X = sparse.csr_matrix(X, dtype=np.float64)
+    if names is None :
+        names = []
 
-        error_log.write(",".join(case_names)+"\n")
-        allcases = np.asarray(allcases)
+    np.savez_compressed(fname, data=X.data, indices=X.indices, indptr=X.indptr,
+                        shape=np.array(X.shape), columns=np.array(columns, dtype=str),
+                        names=np.array(names, dtype=str))
 
-        # output the features
-        np.savetxt(outputfile, allcases, fmt="%.3f", delimiter=",",
-                   header=",".join(colnames)
-                   )
+    return fname
 
-        error_log.close()
 
-        return 1
+def loadSparseFeatures(fnames):
+    '''
+    load sparse feature files and stack their rows
+    :param fnames: str, or list of str, the npz files. If a file name does not
+                   exist, its shards (see sparseShardName) are loaded instead
+    :return: tuple, (scipy.sparse.csr_matrix, columns, row names)
+    '''
+    if isinstance(fnames, str) :
+        fnames = [ fnames, ]
+
+    files = []
+    for fn in fnames :
+        files += [ fn, ] if os.path.exists(fn) else sparseShardFiles(fn)
+    if not len(files) :
+        raise IOError("No sparse feature file found: %s" % ", ".join(fnames))
+
+    matrices, columns, names = [], None, []
+    for fn in files :
+        with np.load(fn) as data :
+            if columns is None :
+                columns = [ str(x) for x in data["columns"] ]
+            elif [ str(x) for x in data["columns"] ] != columns :
+                raise ValueError("The columns of %s are different from %s" % (fn, files[0]))
+
+            matrices.append(sparse.csr_matrix((data["data"], data["indices"], data["indptr"]),
+                                              shape=tuple(data["shape"])))
+            names += [ str(x) for x in data["names"] ]
+
+    return sparse.vstack(matrices, format="csr"), columns, names
+
+
+# the feature extractor used by a worker process
+_shard_worker = {}
+
+
+def _init_shard_worker(binding, reslist, atomCombine, dielec, prefilter=None):
+    _shard_worker["binding"] = binding
+    _shard_worker["args"] = (reslist, atomCombine, dielec, prefilter)
+
+
+def _featurize_shard_worker(cases):
+    return _shard_worker["binding"].featurizeShard(cases, *_shard_worker["args"])
+
 
 class LigandFingerPrints(BindingFeature) :
 
     def elementCount(self, ligand):
-        from dockml import pdbIO
-
-        elements = self.getVdWParams().keys()
-        atominfor = pdbIO.parsePDB(ligand).atomInformation(ligand)
 
-        elem_count = dict(zip(elements, np.zeros(len(elements))))
+        elements = list(self.getVdWParams().keys())
+        table = self.ligandPropertyTable(ligand)
 
-        for atom in atominfor.keys():
+        # unknown elements are counted as the dummy atom type DU
+        elendx = dict([ (e, i) for i, e in enumerate(elements) ])
+        ndx = [ elendx.get(x, elendx["DU"]) for x in table["element"] ]
+        counts = np.bincount(np.array(ndx, dtype=np.int64), minlength=len(elements))
 
-            if atominfor[atom][7] not in elements:
-                elem_count["DU"] += 1
-            else :
-                elem_count[atominfor[atom][7]] += 1
+        elem_count = dict(zip(elements, counts.astype(np.float64)))
 
         return elem_count
 
@@ -940,6 +1402,21 @@ def main() :
                         help="The input file, containing names of proteins and their ligands as well.")
     parser.add_argument("-out",default="output.dat",type=str,
                         help="The output binding features file name.")
+    parser.add_argument("-nt", default=1, type=int,
+                        help="Number of worker processes. Default is 1.")
+    parser.add_argument("-shard", default=1000, type=int,
+                        help="Number of complexes per shard, the output is written \n"
+                             "and checkpointed after each shard. Default is 1000.")
+    parser.add_argument("-format", default="csv", type=str,
+                        help="The output format, csv or npz. The npz format is a sparse \n"
+                             "matrix file per shard. Default is csv.")
+    parser.add_argument("-prefilter", default=None, type=str, choices=["reject", "flag"],
+                        help="Check the poses for clashes and pocket contacts before the \n"
+                             "feature calculation, the failed poses are skipped (reject) or \n"
+                             "kept (flag), and recorded in <out>_rejected.csv. Default is None.")
+    parser.add_argument("-resume", default=False, type=lambda x: (str(x).lower() == "true"),
+                        help="Resume from the last completed shard of a broken run. \n"
+                             "Default is False.")
 
     '''
     parser.add_argument("-ac",type=bool,default=True,
@@ -957,4 +1434,6 @@ def main() :
 
     binding = BindingFeature()
 
-    binding.extractFeatures(args.inp, args.out, )
\ No newline at end of file
+    binding.extractFeatures(args.inp, args.out, n_jobs=args.nt,
+                            shard_size=args.shard, resume=args.resume,
+                            output_format=args.format, prefilter=args.prefilter)
\ No newline at end of file
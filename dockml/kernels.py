@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+"""
+Smooth contact kernels (switching functions) working on np.ndarray.
+
+All the kernels take an array of distances x and return an array of
+the same shape, 1 for close contacts decaying to 0 for far away pairs.
+The kernels are always evaluated in float64, float32 inputs only give
+float32 outputs, thus the results do not depend on the input precision.
+The output could be written into a pre-allocated array by passing
+out=..., use out=x to evaluate in place.
+"""
+
+import numpy as np
+
+
+def _prepare(x, out=None):
+    """Convert x to a float64 array and allocate the work array
+
+    Parameters
+    ----------
+    x : float, or array like
+        the input distances
+    out : np.ndarray, default = None
+        the output array, out=x for in place evaluation
+
+    Returns
+    -------
+    x : np.ndarray
+        the input as a float64 array
+    work : np.ndarray
+        the float64 array the kernel is evaluated in, it is out
+        if out is a float64 array
+    dtype : np.dtype
+        the output dtype, float32 for float32 inputs, otherwise float64
+    """
+    x = np.asarray(x)
+    dtype = np.dtype(np.float32) if x.dtype == np.float32 else np.dtype(np.float64)
+
+    converted = x.dtype != np.float64
+    if converted:
+        x = x.astype(np.float64)
+
+    if out is not None and out.dtype == np.float64:
+        work = out
+    elif converted:
+        # x is a private copy now, evaluate in place
+        work = x
+    else:
+        work = np.empty(x.shape, dtype=np.float64)
+
+    return x, work, dtype
+
+
+def _finish(work, out, dtype):
+    """Write the result to out, or cast it to the output dtype. Return
+    a scalar for a scalar (0-d) input"""
+    if out is not None:
+        if out is not work:
+            out[...] = work
+        result = out
+    else:
+        result = work.astype(dtype, copy=False)
+
+    if result.ndim == 0:
+        return result[()]
+    return result
+
+
+def rational_switch(x, d0, n=6, m=12, out=None):
+    """The rational switch function
+
+    Parameters
+    ----------
+    x : float, or np.ndarray
+        the input distances
+    d0 : float
+        the distance cutoff, it is usually 2 times of
+        the real distance cutoff
+    n : int, default = 6
+        the exponential index of lower order
+    m : int, default = 12
+        the exponential index of higher order
+    out : np.ndarray, default = None
+        the output array, out=x to evaluate in place
+
+    Returns
+    -------
+    s : float, or np.ndarray
+        the switched continuous contacts
+
+    Notes
+    -----
+    the function is like:
+      s = [1 - (x/d0)^n] / [1 - (x/d0)^m]
+    At x = d0 both the numerator and the denominator are zero, the
+    limit n/m is returned. When m = 2n, the function is evaluated as
+    s = 1 / [1 + (x/d0)^n], which is exact for all x.
+
+    """
+    x, work, dtype = _prepare(x, out)
+
+    np.divide(x, d0, out=work)
+    if m == 2 * n:
+        np.power(work, n, out=work)
+        work += 1.0
+        np.reciprocal(work, out=work)
+    else:
+        r_n = np.power(work, n, out=np.empty_like(work))
+        np.power(work, m, out=work)
+        # the removable singularity at x = d0
+        singular = np.isclose(work, 1.0, rtol=0.0, atol=np.finfo(work.dtype).eps * 4)
+        np.subtract(1.0, work, out=work)
+        work[singular] = 1.0
+        np.subtract(1.0, r_n, out=r_n)
+        np.divide(r_n, work, out=work)
+        work[singular] = float(n) / float(m)
+        # both powers overflow for very large x
+        work[np.isnan(work)] = 0.0
+
+    return _finish(work, out, dtype)
+
+
+def exponential_switch(x, r0, d0=0.0, out=None):
+    """The exponential switch function
+
+    s = exp(-(x - d0) / r0) for x > d0, otherwise s = 1
+
+    Parameters
+    ----------
+    x : float, or np.ndarray
+        the input distances
+    r0 : float
+        the decay length
+    d0 : float, default = 0.0
+        the distance below which s = 1
+    out : np.ndarray, default = None
+        the output array, out=x to evaluate in place
+
+    Returns
+    -------
+    s : float, or np.ndarray
+    """
+    x, work, dtype = _prepare(x, out)
+
+    np.subtract(x, d0, out=work)
+    np.maximum(work, 0.0, out=work)
+    work /= -r0
+    np.exp(work, out=work)
+
+    return _finish(work, out, dtype)
+
+
+def gaussian_switch(x, r0, d0=0.0, out=None):
+    """The Gaussian switch function
+
+    s = exp(-(x - d0)^2 / (2 r0^2)) for x > d0, otherwise s = 1
+
+    Parameters
+    ----------
+    x : float, or np.ndarray
+        the input distances
+    r0 : float
+        the width of the Gaussian
+    d0 : float, default = 0.0
+        the distance below which s = 1
+    out : np.ndarray, default = None
+        the output array, out=x to evaluate in place
+
+    Returns
+    -------
+    s : float, or np.ndarray
+    """
+    x, work, dtype = _prepare(x, out)
+
+    np.subtract(x, d0, out=work)
+    np.maximum(work, 0.0, out=work)
+    np.square(work, out=work)
+    work /= -2.0 * r0 * r0
+    np.exp(work, out=work)
+
+    return _finish(work, out, dtype)
+
+
+def cosine_cutoff(x, rc, out=None):
+    """The cosine cutoff function
+
+    s = 0.5 * [cos(pi * x / rc) + 1] for x < rc, otherwise s = 0
+
+    Parameters
+    ----------
+    x : float, or np.ndarray
+        the input distances
+    rc : float
+        the cutoff distance
+    out : np.ndarray, default = None
+        the output array, out=x to evaluate in place
+
+    Returns
+    -------
+    s : float, or np.ndarray
+    """
+    x, work, dtype = _prepare(x, out)
+
+    np.divide(x, rc, out=work)
+    np.clip(work, 0.0, 1.0, out=work)
+    work *= np.pi
+    np.cos(work, out=work)
+    work += 1.0
+    work *= 0.5
+
+    return _finish(work, out, dtype)
+
+
+KERNELS = {
+    "rational": rational_switch,
+    "exponential": exponential_switch,
+    "gaussian": gaussian_switch,
+    "cosine": cosine_cutoff,
+}
+
+
+def switch_function(x, method="rational", out=None, **kwargs):
+    """Apply a contact kernel by its name
+
+    Parameters
+    ----------
+    x : float, or np.ndarray
+        the input distances
+    method : str, default = 'rational'
+        the kernel, options: rational, exponential, gaussian, cosine
+    out : np.ndarray, default = None
+        the output array, out=x to evaluate in place
+    kwargs : dict
+        the parameters of the kernel, for example d0 for rational
+
+    Returns
+    -------
+    s : float, or np.ndarray
+    """
+    if method not in KERNELS.keys():
+        raise ValueError("Unknown switch function %s, options: %s"
+                         % (method, ", ".join(KERNELS.keys())))
+
+    return KERNELS[method](x, out=out, **kwargs)
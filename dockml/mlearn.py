@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 
+import multiprocessing
 import numpy as np
 import pandas as pd
 from .algorithms import BasicAlgorithm
+from .features import loadSparseFeatures
 from sklearn import preprocessing
 
 class FeatureSelection :
@@ -51,25 +53,70 @@ class FeatureSelection :
 
         return HX + HY - HXY
 
-    def correlations(self, X):
+    def mutualInformationMatrix(self, X, nbins=20, normalized=False, n_jobs=1, memmap=None):
+        """
+        calculate the mutual information between all pairs of features,
+        see MutualInformation
+        :param X: pandas dataframe or ndarray, shape = [N_samples, M_features]
+        :param nbins: int, number of bins of each feature
+        :param normalized: bool, whether normalize MI by the mean entropy
+        :param n_jobs: int, number of processes
+        :param memmap: str, file name of a float32 np.memmap output
+        :return: M*M matrix, mutual information matrix
+        """
+
+        mi = MutualInformation(nbins=nbins, normalized=normalized, n_jobs=n_jobs, memmap=memmap)
+
+        return mi.fit(X).mi_
+
+    def correlations(self, X, block=1024):
         '''
         calculate pair-wise correlations between features
         return their correlation matrix
         :param X: pandas dataframe
+        :param block: int, number of features per matrix product
         :return: N*N matrix, correlation matrix
         '''
 
-        correlations = []
-        features = X.columns
+        Z = _standardize(X)
+        if Z is None:
+            # missing values, pandas excludes them pair by pair
+            return X.corr().values
+
+        n_features = Z.shape[1]
+        corr = np.empty((n_features, n_features))
+        for i in range(0, n_features, block):
+            corr[i:i + block] = np.dot(Z[:, i:i + block].T, Z)
+
+        return np.clip(corr, -1.0, 1.0, out=corr)
+
+    def correlatedPairs(self, X, corr_cutoff=0.85, block=1024):
+        """
+        find the feature pairs with absolute correlations higher than the cutoff,
+        the full correlation matrix is never stored
+        :param X: pandas dataframe
+        :param corr_cutoff: float, the cutoff value for correlation determination
+        :param block: int, number of features per matrix product
+        :return: N*N scipy.sparse.csr_matrix, True for the correlated pairs
+        """
+        from scipy import sparse
 
-        for f1 in features:
-            for f2 in features:
-                corr = X[f1].corr(X[f2])
-                correlations.append(corr)
+        Z = _standardize(X)
+        if Z is None:
+            high = np.abs(X.corr().values) > corr_cutoff
+            np.fill_diagonal(high, False)
+            return sparse.csr_matrix(high)
 
-        corr = np.reshape(correlations, (len(features), len(features)))
+        n_features = Z.shape[1]
+        blocks = []
+        for i in range(0, n_features, block):
+            high = np.abs(np.dot(Z[:, i:i + block].T, Z)) > corr_cutoff
+            # a feature is not correlated with itself here
+            rows = np.arange(high.shape[0])
+            high[rows, rows + i] = False
+            blocks.append(sparse.csr_matrix(high))
 
-        return corr
+        return sparse.vstack(blocks, format="csr")
 
     def removeCorrelated(self, X, corr_cutoff = 0.85):
         """
@@ -80,22 +127,19 @@ class FeatureSelection :
         :param corr_cutoff: float, the cutoff value for correlation determination
         :return: pandas dataframe with only uncorrelated features
         """
-        import math
 
-        # get feature correlation matrix
-        corr = self.correlations(X)
+        # get the correlated feature pairs
+        high = self.correlatedPairs(X, corr_cutoff)
 
-        features = X.columns
-        features = list(features)
-        key_fe = list(X.columns.values)
+        # in the order of the features, a feature is removed if it is
+        # correlated with any feature that is still kept
+        keep = np.ones(high.shape[0], dtype=bool)
+        for i in range(high.shape[0]):
+            if keep[high.indices[high.indptr[i]:high.indptr[i + 1]]].any():
+                keep[i] = False
 
-        for i in range(len(features)):
-            for j in range(len(features)):
-                if math.fabs(corr[i, j]) > corr_cutoff and i != j and \
-                                features[i] in key_fe and \
-                                features[j] in key_fe:
-                        key_fe.remove(features[i])
-        return X[key_fe], key_fe
+        key_fe = list(X.columns.values[keep])
+        return X.loc[:, keep], key_fe
 
     def PCA(self, X):
         """
@@ -114,6 +158,268 @@ class FeatureSelection :
 
         return X_trans, pca
 
+def _standardize(X):
+    """Standardize each feature, so that the correlations are the matrix
+    products Z^T Z. Constant features become NaN, as their correlations
+    are not defined.
+
+    Parameters
+    ----------
+    X : pd.DataFrame, or np.ndarray, shape = [N, M]
+        the dataset, N is number of samples, M is number of features
+
+    Returns
+    -------
+    Z : np.ndarray, shape = [N, M]
+        (X - mean) / (std * sqrt(N)), or None if X has missing values
+    """
+    X = np.asarray(X, dtype=np.float64)
+    if np.isnan(X).any():
+        return None
+
+    Z = X - X.mean(axis=0)
+    norm = np.sqrt(np.sum(np.square(Z), axis=0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        Z /= np.where(norm > 0, norm, np.nan)
+
+    return Z
+
+
+def _discretize(X, nbins=20):
+    """Assign the values of each feature to its bins. The bins of each
+    feature are the same as np.histogram(x, bins=nbins), nbins equal
+    bins between the min and max of the feature.
+
+    Parameters
+    ----------
+    X : np.ndarray, shape = [N, M]
+        the dataset, N is number of samples, M is number of features
+    nbins : int, default = 20
+        number of bins of each feature
+
+    Returns
+    -------
+    codes : np.ndarray, shape = [N, M], dtype = np.int64
+        the bin index of each value
+    """
+    X = np.asarray(X, dtype=np.float64)
+    lower = X.min(axis=0)
+    upper = X.max(axis=0)
+    # a constant feature, np.histogram uses the range (x - 0.5, x + 0.5)
+    constant = lower == upper
+    lower = np.where(constant, lower - 0.5, lower)
+    upper = np.where(constant, upper + 0.5, upper)
+
+    codes = ((X - lower) * (nbins / (upper - lower))).astype(np.int64)
+    codes[codes == nbins] -= 1
+
+    # correct the round off errors at the bin edges, like np.histogram
+    edges = lower + (upper - lower) * (codes / float(nbins))
+    codes[X < edges] -= 1
+    edges = lower + (upper - lower) * ((codes + 1) / float(nbins))
+    codes[(X >= edges) & (codes != nbins - 1)] += 1
+
+    return codes
+
+
+def _entropies(counts, n_samples):
+    """The entropy of each row of counts, -sum p * ln(p), p = counts / n_samples"""
+    counts = np.asarray(counts, dtype=np.float64)
+    plogp = np.zeros(counts.shape)
+    nonzero = counts > 0
+    p = counts[nonzero] / float(n_samples)
+    plogp[nonzero] = p * np.log(p)
+
+    return -1.0 * plogp.sum(axis=-1)
+
+
+# the discretized dataset shared by the worker processes
+_MI_CODES = None
+
+
+def _mi_init(codes):
+    global _MI_CODES
+    _MI_CODES = codes
+
+
+def _mi_block(args):
+    """The joint entropies of the feature pairs of two blocks of features"""
+    rows, cols, nbins = args
+    codes = _MI_CODES
+    n = codes.shape[1]
+
+    # the joint bin of each pair, shifted by the index of the pair. The
+    # samples of a pair are contiguous, so bincount writes to few bins
+    # at a time
+    joint = codes[rows][:, np.newaxis, :] * nbins + codes[cols][np.newaxis, :, :]
+    joint += (np.arange(len(rows) * len(cols), dtype=joint.dtype) *
+              nbins * nbins).reshape(len(rows), len(cols), 1)
+    counts = np.bincount(joint.ravel(), minlength=len(rows) * len(cols) * nbins * nbins)
+
+    return rows, cols, _entropies(counts.reshape(len(rows), len(cols), -1), n)
+
+
+class MutualInformation(object):
+    """Mutual information between all the pairs of features.
+
+    Each feature is discretized once into nbins equal bins (the same
+    bins as BasicAlgorithm.entropy1D). The joint counts of many feature
+    pairs are then counted together with one np.bincount per block of
+    pairs. The blocks could be computed by several processes.
+
+    MI(x, y) = H(x) + H(y) - H(x, y)
+    normalized MI(x, y) = MI(x, y) / ((H(x) + H(y)) / 2)
+
+    Parameters
+    ----------
+    nbins : int, default = 20
+        number of bins of each feature
+    normalized : bool, default = False
+        whether normalize the MI by the mean entropy of the two features
+    n_jobs : int, default = 1
+        number of processes
+    block_size : int, default = None
+        number of features per block, by default it is chosen so that
+        a block of joint bins has about 2^22 entries
+    memmap : str, default = None
+        The file name of a raw binary np.memmap file to hold the MI
+        matrix, with dtype float32. It could be loaded with
+        np.memmap(memmap, dtype=np.float32, mode='r').reshape(M, M).
+
+    Attributes
+    ----------
+    entropy_ : np.ndarray, shape = [M, ]
+        the entropy of each feature
+    mi_ : np.ndarray or np.memmap, shape = [M, M]
+        the (normalized) mutual information matrix
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> from dockml import mlearn
+    >>> X = np.random.rand(1000, 50)
+    >>> mi = mlearn.MutualInformation(nbins=20, n_jobs=2).fit(X)
+    >>> mi.mi_.shape
+    (50, 50)
+
+    """
+
+    def __init__(self, nbins=20, normalized=False, n_jobs=1, block_size=None, memmap=None):
+        self.nbins = nbins
+        self.normalized = normalized
+        self.n_jobs = n_jobs
+        self.block_size = block_size
+        self.memmap = memmap
+
+        self.entropy_ = None
+        self.mi_ = None
+
+    def _blocks(self, n_samples, n_features):
+        """The pairs of feature blocks of the upper triangle"""
+        if self.block_size is None:
+            block = int(np.sqrt(2 ** 22 / float(max(n_samples, self.nbins ** 2))))
+        else:
+            block = self.block_size
+        block = min(max(block, 1), n_features)
+
+        starts = np.arange(0, n_features, block)
+        features = np.arange(n_features)
+
+        return [(features[i:i + block], features[j:j + block], self.nbins)
+                for i in starts for j in starts if j >= i]
+
+    def fit(self, X):
+        """Compute the mutual information matrix
+
+        Parameters
+        ----------
+        X : pd.DataFrame, or np.ndarray, shape = [N, M]
+            the dataset, N is number of samples, M is number of features
+
+        Returns
+        -------
+        self : the instance itself
+        """
+        codes = _discretize(X, self.nbins)
+        n, m = codes.shape
+
+        jobs = self._blocks(n, m)
+        # one row per feature, the smallest integer type for the joint bins
+        n_joint = len(jobs[0][0]) * len(jobs[0][1]) * self.nbins ** 2
+        codes = np.ascontiguousarray(codes.T, dtype=np.int32 if n_joint < 2 ** 31 else np.int64)
+
+        self.entropy_ = _entropies(np.stack([np.bincount(codes[i], minlength=self.nbins)
+                                             for i in range(m)]), n)
+
+        if self.memmap is not None:
+            self.mi_ = np.memmap(self.memmap, dtype=np.float32, mode="w+", shape=(m, m))
+        else:
+            self.mi_ = np.zeros((m, m))
+
+        if self.n_jobs > 1 and len(jobs) > 1:
+            pool = multiprocessing.Pool(self.n_jobs, initializer=_mi_init, initargs=(codes, ))
+            results = pool.imap_unordered(_mi_block, jobs)
+        else:
+            pool = None
+            _mi_init(codes)
+            results = map(_mi_block, jobs)
+
+        try:
+            for rows, cols, joint in results:
+                hx = self.entropy_[rows][:, np.newaxis]
+                hy = self.entropy_[cols][np.newaxis, :]
+                mi = np.maximum(hx + hy - joint, 0.0)
+                if self.normalized:
+                    mean = (hx + hy) / 2.0
+                    mi = np.where(mean > 0, mi / np.where(mean > 0, mean, 1.0), 0.0)
+                self.mi_[np.ix_(rows, cols)] = mi
+                self.mi_[np.ix_(cols, rows)] = mi.T
+        finally:
+            _mi_init(None)
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        if self.memmap is not None:
+            self.mi_.flush()
+
+        return self
+
+
+def loadSparseDataFrame(fnames):
+    """
+    load the sparse binding features into a dataframe with sparse columns,
+    the rows are indexed by the complex names
+
+    Parameters
+    ----------
+    fnames : str, or list of str
+        the .npz sparse feature files, or the output file name
+        given to extractFeatures, whose shards are then loaded
+
+    Returns
+    -------
+    data : pd.DataFrame
+        the features, the columns are Sparse[float64, 0.0], thus the
+        implicit entries are zeros. data.sparse.to_coo() gives the
+        sparse matrix
+    """
+    X, columns, names = loadSparseFeatures(fnames)
+
+    index = names if len(names) == X.shape[0] else None
+
+    # one sparse column at a time, the fill value of the columns is 0.0
+    # (DataFrame.sparse.from_spmatrix gives NaN as the fill value)
+    X = X.tocsc()
+    X.sort_indices()
+    data = dict([ (i, pd.arrays.SparseArray.from_spmatrix(X[:, [i]]))
+                  for i in range(X.shape[1]) ])
+    data = pd.DataFrame(data, index=index)
+    data.columns = columns
+
+    return data
+
+
 class DataClean :
 
     def __init__(self):
@@ -122,11 +428,15 @@ class DataClean :
     def loadDataFile(self, dataf, delimiter=",", header=0):
         """
         load data file to pd dataframe
-        :param dataf: str, file name
+        :param dataf: str, file name, a .npz file is loaded as sparse features,
+                      see features.loadSparseFeatures
         :param delimiter: str, seperation of columns
         :param header: int, index of header line
         :return: pd dataframe
         """
+        if dataf[-4:] == ".npz" :
+            return loadSparseDataFrame(dataf)
+
         data = pd.read_csv(dataf, delimiter=delimiter, header=header)
 
         return data
@@ -369,6 +679,11 @@ class BindingFeatureClean:
         self.Y = y
 
     def processPipeLine(self):
+        # the sparse features are converted to dense before scaling
+        if isinstance(self.X, pd.DataFrame) and \
+                any([ isinstance(x, pd.SparseDtype) for x in self.X.dtypes ]) :
+            self.X = self.X.sparse.to_dense()
+
         # remove all zero
         self.X = self.removeAllZeroFeatures(self.X)
         print("Dropping all-zeroes columns ... ")
@@ -394,9 +709,11 @@ class BindingFeatureClean:
     def loadDataSet(self, fn='positive.csv'):
         '''
         load data set and return a dataframe
-        :param fn:
-        :return: pandas dataframe
+        :param fn: str, a csv file, or a .npz sparse feature file
+        :return: pandas dataframe, dense for training
         '''
+        if fn[-4:] == ".npz" :
+            return loadSparseDataFrame(fn).sparse.to_dense()
 
         return pd.read_csv(fn, header=0, sep=',')
 
@@ -9,6 +9,7 @@ from .gmxcli import *
 from .pca import *
 from .cmap import *
 from .coordNum import *
+from .accumulator import *
 
 PROJECT_ROOT = os.path.abspath(os.path.dirname(__file__))
 DEFINITIONS_ROOT = os.path.join(PROJECT_ROOT, 'sample', 'lib')
@@ -0,0 +1,484 @@
+# -*- coding: utf-8 -*-
+
+import os
+import numpy as np
+
+
+class ArrayAccumulator(object):
+    """Collect chunk-wise results into one array without repeated
+    concatenation.
+
+    The rows of each appended block are copied into a preallocated
+    buffer. If the final number of rows is known, the buffer is
+    allocated only once, otherwise its capacity grows geometrically.
+    The buffer could be an on-disk np.memmap file, thus the results
+    do not need to fit into memory.
+
+    Parameters
+    ----------
+    n_rows : int, default = None
+        The final number of rows. If None, the buffer grows when
+        necessary.
+    dtype : np.dtype, default = None
+        The data type of the results. If None, the data type of the
+        first block is used.
+    memmap : str, default = None
+        The file name of a raw binary np.memmap file to hold the results.
+        The file could be loaded with np.memmap(memmap, dtype=dtype_,
+        mode='r').reshape(shape_).
+    growth : float, default = 2.0
+        The growth factor of the buffer capacity.
+
+    Attributes
+    ----------
+    data_ : np.ndarray or np.memmap
+        The buffer holding the results
+    n_rows_ : int
+        Number of rows filled
+    dtype_ : np.dtype
+        The data type of the results
+    shape_ : tuple
+        The shape of the filled results
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> from mdanaly import accumulator
+    >>> acc = accumulator.ArrayAccumulator(n_rows=5)
+    >>> acc.append(np.ones((2, 3)))
+    >>> acc.append(np.zeros((3, 3)))
+    >>> acc.values().shape
+    (5, 3)
+
+    """
+
+    def __init__(self, n_rows=None, dtype=None, memmap=None, growth=2.0):
+        self.n_rows = n_rows
+        self.dtype = dtype
+        self.memmap = memmap
+        self.growth = max(float(growth), 1.1)
+
+        self.data_ = None
+        self.n_rows_ = 0
+        self.dtype_ = None
+        self.shape_ = (0, )
+
+    def _allocate(self, capacity, row_shape):
+        """Allocate (or enlarge) the buffer to hold capacity rows
+
+        Parameters
+        ----------
+        capacity : int
+            the number of rows of the buffer
+        row_shape : tuple
+            the shape of a single row
+
+        Returns
+        -------
+        self : the instance itself
+        """
+        shape = (capacity, ) + tuple(row_shape)
+
+        if self.memmap is None:
+            data = np.empty(shape, dtype=self.dtype_)
+            if self.data_ is not None:
+                data[:self.n_rows_] = self.data_[:self.n_rows_]
+        else:
+            # the rows already written stay in place, only the file is extended
+            if self.data_ is None:
+                mode = "w+"
+            else:
+                self.data_.flush()
+                self.data_ = None
+                with open(self.memmap, "r+b") as f:
+                    f.truncate(int(np.prod(shape)) * self.dtype_.itemsize)
+                mode = "r+"
+            data = np.memmap(self.memmap, dtype=self.dtype_, mode=mode, shape=shape)
+
+        self.data_ = data
+
+        return self
+
+    def append(self, X):
+        """Append a block of rows to the results
+
+        Parameters
+        ----------
+        X : np.ndarray, shape = [ N, ... ]
+            the block of results, N is number of rows
+
+        Returns
+        -------
+        self : the instance itself
+        """
+        X = np.asarray(X)
+
+        if self.data_ is None:
+            self.dtype_ = np.dtype(self.dtype) if self.dtype is not None else X.dtype
+            if self.n_rows is not None:
+                capacity = max(int(self.n_rows), X.shape[0], 1)
+            else:
+                capacity = max(X.shape[0], 1)
+            self._allocate(capacity, X.shape[1:])
+
+        n = X.shape[0]
+        capacity = self.data_.shape[0]
+        if self.n_rows_ + n > capacity:
+            capacity = max(int(capacity * self.growth), self.n_rows_ + n)
+            self._allocate(capacity, X.shape[1:])
+
+        self.data_[self.n_rows_:self.n_rows_ + n] = X
+        self.n_rows_ += n
+        self.shape_ = (self.n_rows_, ) + tuple(X.shape[1:])
+
+        return self
+
+    def values(self):
+        """The results collected so far
+
+        Returns
+        -------
+        X : np.ndarray or np.memmap, shape = [ N, ... ]
+            the results, N is the number of rows appended
+        """
+        if self.data_ is None:
+            return np.array([])
+
+        if self.memmap is not None:
+            self.finalize()
+
+        return self.data_[:self.n_rows_]
+
+    def finalize(self):
+        """Flush the results to disk and trim the unused rows of the
+        np.memmap file
+
+        Returns
+        -------
+        self : the instance itself
+        """
+        if self.memmap is not None and self.data_ is not None:
+            if self.data_.shape[0] != self.n_rows_:
+                self.data_.flush()
+                self.data_ = None
+                with open(self.memmap, "r+b") as f:
+                    f.truncate(int(np.prod(self.shape_)) * self.dtype_.itemsize)
+                self.data_ = np.memmap(self.memmap, dtype=self.dtype_, mode="r+",
+                                       shape=self.shape_)
+            self.data_.flush()
+
+        return self
+
+    def clear(self):
+        """Remove the buffer, and the np.memmap file if there is one
+
+        Returns
+        -------
+        self : the instance itself
+        """
+        self.data_ = None
+        self.n_rows_ = 0
+        if self.memmap is not None and os.path.exists(self.memmap):
+            os.remove(self.memmap)
+
+        return self
+
+
+class MeanAccumulator(object):
+    """Compute the column means (and standard deviations) of chunk-wise
+    results in a single pass with constant memory.
+
+    Only the running sums (and sums of squares) of each column are kept,
+    the rows themselves are discarded after they are added.
+
+    Parameters
+    ----------
+    start : int, default = 0
+        The first row (counted over all the appended blocks) to include
+    end : int, default = None
+        The row to stop at (not included). None means all the rows.
+    std : bool, default = False
+        Whether keep the sums of squares for the standard deviations
+
+    Attributes
+    ----------
+    sum_ : np.ndarray
+        The sum of the included rows
+    sum_sq_ : np.ndarray
+        The sum of squares of the included rows, only if std is True
+    n_rows_ : int
+        Number of rows appended
+    n_samples_ : int
+        Number of rows included in the means
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> from mdanaly import accumulator
+    >>> acc = accumulator.MeanAccumulator(start=1, std=True)
+    >>> acc.append(np.array([[9.0, 9.0], [1.0, 2.0]]))
+    >>> acc.append(np.array([[3.0, 2.0]]))
+    >>> acc.mean()
+    array([2., 2.])
+    >>> acc.std()
+    array([1., 0.])
+
+    """
+
+    def __init__(self, start=0, end=None, std=False):
+        self.start = max(int(start), 0)
+        self.end = end
+        self.compute_std = std
+
+        self.sum_ = None
+        self.sum_sq_ = None
+        self.n_rows_ = 0
+        self.n_samples_ = 0
+
+    def append(self, X):
+        """Add a block of rows
+
+        Parameters
+        ----------
+        X : np.ndarray, shape = [ N, ... ]
+            the block of results, N is number of rows
+
+        Returns
+        -------
+        self : the instance itself
+        """
+        X = np.asarray(X)
+
+        # the rows of this block within [start, end)
+        first = min(max(self.start - self.n_rows_, 0), X.shape[0])
+        last = X.shape[0] if self.end is None else \
+            min(max(self.end - self.n_rows_, first), X.shape[0])
+        self.n_rows_ += X.shape[0]
+
+        if self.sum_ is None:
+            self.sum_ = np.zeros(X.shape[1:], dtype=np.float64)
+            if self.compute_std:
+                self.sum_sq_ = np.zeros(X.shape[1:], dtype=np.float64)
+
+        if last > first:
+            X = X[first:last].astype(np.float64)
+            self.sum_ += X.sum(axis=0)
+            if self.compute_std:
+                self.sum_sq_ += np.square(X).sum(axis=0)
+            self.n_samples_ += last - first
+
+        return self
+
+    def mean(self):
+        """The means of the included rows"""
+        if self.sum_ is None:
+            return np.array([])
+
+        return self.sum_ / max(self.n_samples_, 1)
+
+    def std(self):
+        """The (population) standard deviations of the included rows"""
+        if self.sum_sq_ is None:
+            return np.array([])
+
+        mean = self.mean()
+        var = self.sum_sq_ / max(self.n_samples_, 1) - np.square(mean)
+
+        return np.sqrt(np.maximum(var, 0.0))
+
+    def values(self):
+        """The means of the included rows, see mean()"""
+        return self.mean()
+
+
+class HistogramAccumulator(object):
+    """Count samples into a histogram with fixed bin edges, chunk by chunk.
+
+    The edges are given in advance, thus the counts of different chunks,
+    files or processes are simply additive and could be merged. Like
+    np.histogram, the bins are half open [a, b) except the last one,
+    which includes its right edge. Samples outside the edges (or NaN)
+    are not counted.
+
+    Parameters
+    ----------
+    edges : array like, or list of array like
+        The bin edges of a 1D histogram, or a list of the bin edges of
+        each dimension for a N-D histogram.
+
+    Attributes
+    ----------
+    edges_ : list of np.ndarray
+        The bin edges of each dimension
+    counts_ : np.ndarray, shape = [n_bins_1, n_bins_2, ...]
+        The number of samples in each bin
+    n_samples_ : int
+        Number of samples appended, including those outside the edges
+    n_outside_ : int
+        Number of samples outside the edges
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> from mdanaly import accumulator
+    >>> hist = accumulator.HistogramAccumulator([np.linspace(0, 1, 5), ] * 2)
+    >>> hist.append(np.random.rand(100, 2))
+    >>> hist.counts_.sum()
+    100
+
+    """
+
+    def __init__(self, edges):
+        if np.ndim(edges[0]) == 0:
+            edges = [edges, ]
+        self.edges_ = [np.asarray(x, dtype=np.float64) for x in edges]
+
+        self.counts_ = np.zeros([x.shape[0] - 1 for x in self.edges_], dtype=np.int64)
+        self.n_samples_ = 0
+        self.n_outside_ = 0
+
+    @classmethod
+    def from_range(cls, ranges, bins=20):
+        """Create a histogram with evenly spaced bins
+
+        Parameters
+        ----------
+        ranges : list, or list of list
+            The (min, max) of a 1D histogram, or of each dimension
+        bins : int, or list of int, default = 20
+            Number of bins of each dimension
+
+        Returns
+        -------
+        hist : HistogramAccumulator
+        """
+        if np.ndim(ranges[0]) == 0:
+            ranges = [ranges, ]
+        if np.ndim(bins) == 0:
+            bins = [bins, ] * len(ranges)
+
+        return cls([np.linspace(r[0], r[1], int(b) + 1) for r, b in zip(ranges, bins)])
+
+    @property
+    def ndim(self):
+        return len(self.edges_)
+
+    def append(self, X):
+        """Count a chunk of samples
+
+        Parameters
+        ----------
+        X : np.ndarray, shape = [ N, ] or [ N, n_dims]
+            the samples, N is number of samples
+
+        Returns
+        -------
+        self : the instance itself
+        """
+        X = np.asarray(X, dtype=np.float64).reshape((-1, self.ndim))
+
+        bins = np.zeros(X.shape[0], dtype=np.int64)
+        inside = np.ones(X.shape[0], dtype=bool)
+        for d, edges in enumerate(self.edges_):
+            n_bins = edges.shape[0] - 1
+            idx = np.searchsorted(edges, X[:, d], side="right") - 1
+            # the last bin includes its right edge
+            idx[X[:, d] == edges[-1]] = n_bins - 1
+            inside &= (idx >= 0) & (idx < n_bins)
+            bins = bins * n_bins + idx
+
+        self.counts_ += np.bincount(bins[inside], minlength=self.counts_.size).reshape(self.counts_.shape)
+        self.n_samples_ += X.shape[0]
+        self.n_outside_ += int(X.shape[0] - np.sum(inside))
+
+        return self
+
+    def merge(self, other):
+        """Add the counts of another histogram with the same edges
+
+        Parameters
+        ----------
+        other : HistogramAccumulator
+
+        Returns
+        -------
+        self : the instance itself
+        """
+        if len(other.edges_) != self.ndim or \
+                not all([np.array_equal(a, b) for a, b in zip(self.edges_, other.edges_)]):
+            raise ValueError("Only histograms with the same bin edges could be merged.")
+
+        self.counts_ += other.counts_
+        self.n_samples_ += other.n_samples_
+        self.n_outside_ += other.n_outside_
+
+        return self
+
+    def probability(self):
+        """The probability of each bin, normalized by the counts inside
+        the edges"""
+        return self.counts_ / float(max(np.sum(self.counts_), 1))
+
+    def pmf(self, kbt=2.5, min_count=0.5):
+        """The potential of mean force, PMF = -kbt * ln(p / p_max)
+
+        Parameters
+        ----------
+        kbt : float, default = 2.5
+            The Kb * T value. If using KJ/mol as the unit, kbt is
+            around 2.5
+        min_count : float, default = 0.5
+            The count assigned to the empty bins, to avoid log by zero error
+
+        Returns
+        -------
+        pmf : np.ndarray, shape = [n_bins_1, n_bins_2, ...]
+        """
+        counts = np.maximum(self.counts_.astype(np.float64), min_count)
+
+        return -1.0 * kbt * np.log(counts / np.max(counts))
+
+    def centers(self):
+        """The bin centers of each dimension"""
+        return [(x[1:] + x[:-1]) / 2.0 for x in self.edges_]
+
+    def save(self, fname):
+        """Save the counts and the edges into a .npz file
+
+        Parameters
+        ----------
+        fname : str
+            the output file name
+
+        Returns
+        -------
+        self : the instance itself
+        """
+        edges = dict([("edges_%d" % i, x) for i, x in enumerate(self.edges_)])
+        np.savez(fname, counts=self.counts_, n_samples=self.n_samples_,
+                 n_outside=self.n_outside_, **edges)
+
+        return self
+
+    @classmethod
+    def load(cls, fname):
+        """Load a histogram saved with save()
+
+        Parameters
+        ----------
+        fname : str
+            the .npz file name
+
+        Returns
+        -------
+        hist : HistogramAccumulator
+        """
+        dat = np.load(fname)
+        n_dims = len([x for x in dat.files if x.startswith("edges_")])
+
+        hist = cls([dat["edges_%d" % i] for i in range(n_dims)])
+        hist.counts_ = dat["counts"].astype(np.int64)
+        hist.n_samples_ = int(dat["n_samples"])
+        hist.n_outside_ = int(dat["n_outside"])
+
+        return hist
@@ -7,6 +7,7 @@ from dockml import index
 import sys
 import os
 from mdanaly import gmxcli
+from mdanaly.accumulator import ArrayAccumulator
 
 
 class ComputeAngles(object):
@@ -249,22 +250,20 @@ def gmxangle():
                                 stride=int(args.dt / args.ps))
         if args.v:
             print("Frame information: ")
-            for i, traj in enumerate(trajs):
-                print("Trajectory %3d: %12d frames" % (i, traj.n_frames))
+            print("Trajectory: %12d frames, %d chunks" % (trajs.n_frames_, trajs.n_chunks_))
 
-        angles = np.array([])
+        angles = ArrayAccumulator(n_rows=trajs.n_frames_)
 
-        # for each traj chunk, calculate angles, and cat them together
+        # for each traj chunk, calculate angles, and collect them together
         for i, traj in enumerate(trajs):
             cangle = ComputeAngles(traj)
             if args.v:
                 print("Progress: %12d " % (i * traj.n_frames))
-                print(angles.shape)
+                print(angles.shape_)
 
-            if angles.shape[0] == 0:
-                angles = cangle.get_dihedral_angles(ndx)
-            else:
-                angles = np.concatenate((angles, cangle.get_dihedral_angles(ndx)), axis=0)
+            angles.append(cangle.get_dihedral_angles(ndx))
+
+        angles = angles.values()
 
         if args.v:
             print("Write angles to output file: ", args.o)
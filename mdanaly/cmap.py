@@ -10,10 +10,12 @@
 #####################################################
 
 from mdanaly import gmxcli, pca
-from dockml import pdbIO, index, algorithms
+from mdanaly.accumulator import ArrayAccumulator, MeanAccumulator
+from dockml import pdbIO, index, kernels
 
 from matplotlib import pyplot as plt
 from datetime import datetime
+from functools import partial
 
 import math
 import os
@@ -21,6 +23,136 @@ import sys
 import numpy as np
 import pandas as pd
 import mdtraj as mt
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+
+class SuperposeContext(object):
+    """A reference structure prepared once for superimposing many
+    trajectory chunks.
+
+    The reference pdb file is loaded and the atom selection is
+    resolved only once. The coordinates of the selected reference atoms
+    are centered in advance, thus each chunk only costs the alignment:
+    the optimal rotations (Kabsch algorithm) of all the frames are
+    computed together with numpy.
+
+    Parameters
+    ----------
+    top : str, format pdb
+        the reference pdb file name
+    atom_selection : str, default is CA
+        the atom names used for the superimposition
+    frame : int, default = 0
+        the frame of the reference structure
+
+    Attributes
+    ----------
+    ref_ : mt.Trajectory
+        The reference structure.
+    topology_ : mt.Topology object
+        the topology of the reference structure
+    superpose_atom_indices_ : np.array,
+        the atom indices, starting from 0, format is int
+    ref_offset_ : np.ndarray, shape = [3, ]
+        the center of the selected reference atoms
+    ref_centered_ : np.ndarray, shape = [n_atoms, 3]
+        the centered coordinates of the selected reference atoms
+
+    Examples
+    --------
+    >>> context = SuperposeContext("reference.pdb", "CA")
+    >>> for traj in mt.iterload("traj.xtc", top="reference.pdb", chunk=1000):
+    ...     xyz = context.xyz_coordinates(traj)
+
+    """
+
+    def __init__(self, top, atom_selection="CA", frame=0):
+        if os.path.exists(top):
+            self.ref_ = mt.load(top)
+        else:
+            print("Reference pdb structure %s is not existed or accessible." % top)
+            sys.exit(0)
+
+        self.topology_ = self.ref_.topology
+        self.superpose_atom_indices_ = self.topology_.select(
+            "name {}".format(atom_selection))
+
+        ref_xyz = self.ref_.xyz[frame, self.superpose_atom_indices_].astype(np.float64)
+        self.ref_offset_ = ref_xyz.mean(axis=0)
+        self.ref_centered_ = ref_xyz - self.ref_offset_
+
+    def rotations(self, xyz):
+        """The optimal rotations superimposing the selected atoms of
+        each frame onto the reference
+
+        Parameters
+        ----------
+        xyz : np.ndarray, shape = [N, n_atoms, 3]
+            the coordinates of all the atoms of N frames
+
+        Returns
+        -------
+        rotations : np.ndarray, shape = [N, 3, 3]
+            the rotation matrix of each frame, applied as x.dot(R)
+        offsets : np.ndarray, shape = [N, 1, 3]
+            the center of the selected atoms of each frame
+        """
+        align = xyz[:, self.superpose_atom_indices_].astype(np.float64)
+        offsets = align.mean(axis=1, keepdims=True)
+        align -= offsets
+
+        # Kabsch algorithm, H = X^T Y, R = U diag(1, 1, d) V^T
+        H = np.einsum("fni,nj->fij", align, self.ref_centered_)
+        U, S, Vt = np.linalg.svd(H)
+        d = np.sign(np.linalg.det(np.matmul(U, Vt)))
+        U[:, :, 2] *= d[:, np.newaxis]
+
+        return np.matmul(U, Vt), offsets
+
+    def superpose(self, traj):
+        """Superimpose all the atoms of a trajectory to the reference in
+        place, like mt.Trajectory.superpose
+
+        Parameters
+        ----------
+        traj : mt.Trajectory
+            the trajectory chunk
+
+        Returns
+        -------
+        traj : mt.Trajectory
+            the superimposed trajectory
+        """
+        rot, offsets = self.rotations(traj.xyz)
+        traj.xyz = (np.matmul(traj.xyz - offsets, rot) + self.ref_offset_).astype(traj.xyz.dtype)
+
+        return traj
+
+    def xyz_coordinates(self, traj, atom_indices=None):
+        """Superimpose a trajectory chunk and extract the coordinates of
+        the selected atoms. Only the selected atoms are transformed and
+        the trajectory itself is not changed.
+
+        Parameters
+        ----------
+        traj : mt.Trajectory
+            the trajectory chunk
+        atom_indices : np.array, default = None
+            the atoms to extract, default is the superimposition atoms
+
+        Returns
+        -------
+        xyz : np.ndarray, shape = [N, M]
+            N is number of frames, M is the multiply of number of atoms and 3
+        """
+        if atom_indices is None:
+            atom_indices = self.superpose_atom_indices_
+
+        rot, offsets = self.rotations(traj.xyz)
+        xyz = np.matmul(traj.xyz[:, atom_indices] - offsets, rot) + self.ref_offset_
+
+        return xyz.astype(traj.xyz.dtype).reshape((xyz.shape[0], -1))
 
 
 class CoordinatesXYZ(object):
@@ -34,6 +166,9 @@ class CoordinatesXYZ(object):
         the reference pdb file name
     atom_selection : str, default is name CA
         the atom selection for pca calculation.
+    context : SuperposeContext, default = None
+        a prepared reference structure, if provided, top and
+        atom_selection are ignored and the reference is not loaded again
 
     Attributes
     ----------
@@ -67,13 +202,12 @@ class CoordinatesXYZ(object):
 
     """
 
-    def __init__(self, traj, top, atom_selection="CA"):
+    def __init__(self, traj, top, atom_selection="CA", context=None):
         self.traj_ = traj
-        if os.path.exists(top):
-            self.ref_ = mt.load(top)
-        else:
-            print("Reference pdb structure %s is not existed or accessible." % top)
-            sys.exit(0)
+        if context is None:
+            context = SuperposeContext(top, atom_selection)
+        self.context_ = context
+        self.ref_ = context.ref_
 
         # topology
         self.topology_ = self.ref_.topology
@@ -81,8 +215,7 @@ class CoordinatesXYZ(object):
         self.n_atoms_ = self.traj_.n_atoms
 
         self.superimposed_ = False
-        self.superpose_atom_indices_ = self.topology_.select(
-            "name {}".format(atom_selection))
+        self.superpose_atom_indices_ = context.superpose_atom_indices_
 
         self.xyz_ = None
 
@@ -96,8 +229,7 @@ class CoordinatesXYZ(object):
 
         """
         if not self.superimposed_:
-            self.traj_.superpose(self.ref_, frame=0,
-                                 atom_indices=self.superpose_atom_indices_)
+            self.context_.superpose(self.traj_)
             self.superimposed_ = True
 
         return self
@@ -155,6 +287,12 @@ class ContactMap(object):
         the list of atom index in cmap x-axis
     cutoff : float, default = 0.35
         the distance cutoff, default is 3.5 angstrom
+    backend : str, default = 'brute'
+        the method for finding contacts. Options: brute, kdtree
+        brute: compute the distances of all the atom pairs
+        kdtree: only evaluate the atom pairs within the distance cutoff
+        found by a KD-tree neighbor search, periodic boundary conditions
+        are considered for rectangular boxes.
 
     Attributes
     ----------
@@ -175,13 +313,17 @@ class ContactMap(object):
         whether the contact map has been calculated
     coord_number_ : int
         the number of contact number (coordination number)
+    contacts_ : list of np.array, shape = N
+        the indices of the atom pairs in contact for each frame,
+        N is number of frames. Only used with the kdtree backend.
 
     """
 
-    def __init__(self, traj, group_a, group_b, cutoff=0.35):
+    def __init__(self, traj, group_a, group_b, cutoff=0.35, backend="brute"):
 
         self.traj = traj
         self.cutoff = cutoff
+        self.backend = backend
 
         self.atom_group_a = group_a
         self.atom_group_b = group_b
@@ -201,6 +343,9 @@ class ContactMap(object):
 
         self.coord_number_ = None
 
+        self.contacts_ = []
+        self.neighbors_computed_ = False
+
     def distance_matrix(self):
         """Calculate the atom distance matrix.
 
@@ -234,15 +379,26 @@ class ContactMap(object):
         self: the instance itself
 
         """
-        if not self.distmtx_computed_:
+        if not self.cmap_computed_ and not switch and self._use_neighbor_search():
+            self.neighbor_search()
+
+            cmap = np.zeros((self.traj.n_frames, self.n_pairs_()))
+            for i, contacts in enumerate(self.contacts_):
+                cmap[i, contacts] = 1.0
+
+            if shape == "matrix":
+                cmap = cmap.reshape((cmap.shape[0], self.atom_group_a.shape[0],
+                                     self.atom_group_b.shape[0]))
+
+            self.cmap_ = cmap
+            self.cmap_computed_ = True
+
+        if not self.distmtx_computed_ and not self.cmap_computed_:
             self.distance_matrix()
 
         if not self.cmap_computed_:
             if switch:
-                sf = algorithms.BasicAlgorithm()
-                vf = np.vectorize(sf.switchFuction)
-
-                cmap = vf(self.dist_matrix_, d0=self.cutoff*2.0)
+                cmap = kernels.rational_switch(self.dist_matrix_, d0=self.cutoff*2.0)
             else:
                 cmap = (self.dist_matrix_ <= self.cutoff) * 1.0
 
@@ -260,7 +416,8 @@ class ContactMap(object):
         return self
 
     def generate_atom_pairs(self):
-        """Generate atom pairs list.
+        """Generate atom pairs list. For each atom in group_a, it is
+        paired with all the atoms in group_b.
 
         Returns
         -------
@@ -270,15 +427,82 @@ class ContactMap(object):
 
         if bool(self.atom_group_a.shape[0]) and bool(self.atom_group_b.shape[0]):
             list_a = np.repeat(self.atom_group_a, self.atom_group_b.shape[0])
-            list_b = np.repeat(self.atom_group_b, self.atom_group_a.shape[0])
-            list_b = list_b.reshape((self.atom_group_a.shape[0], -1)).T.ravel()
+            list_b = np.tile(self.atom_group_b, self.atom_group_a.shape[0])
 
-            self.atom_pairs_ = np.array(list(zip(list_a, list_b)))
+            self.atom_pairs_ = np.column_stack((list_a, list_b))
         else:
             self.atom_pairs_ = np.array([])
 
         return self
 
+    def n_pairs_(self):
+        """Number of atom pairs between group_a and group_b"""
+        return self.atom_group_a.shape[0] * self.atom_group_b.shape[0]
+
+    def _use_neighbor_search(self):
+        """Whether the kdtree backend could be applied. Triclinic boxes
+        are not supported by the KD-tree, the distance matrix is used."""
+        if self.backend != "kdtree" or self.n_pairs_() == 0:
+            return False
+
+        if self.traj.unitcell_angles is not None and \
+                not np.allclose(self.traj.unitcell_angles, 90.0):
+            return False
+
+        return True
+
+    def neighbor_search(self):
+        """Find the atom pairs within the distance cutoff for each frame.
+
+        A KD-tree (periodic if the trajectory has a rectangular box) of
+        both atom groups gives the candidate pairs, then the distances of
+        the candidates are computed with mdtraj, so the contacts are the
+        same as those from the full distance matrix.
+
+        Returns
+        -------
+        self: the instance itself
+
+        """
+        if self.neighbors_computed_:
+            return self
+
+        n_b = self.atom_group_b.shape[0]
+        # slightly larger radius, the exact distances are checked later
+        radius = self.cutoff * (1.0 + 1e-4)
+
+        contacts = []
+        for i in range(self.traj.n_frames):
+            xyz_a = self.traj.xyz[i, self.atom_group_a].astype(np.float64)
+            xyz_b = self.traj.xyz[i, self.atom_group_b].astype(np.float64)
+
+            if self.traj.unitcell_lengths is not None:
+                box = self.traj.unitcell_lengths[i].astype(np.float64)
+                xyz_a = _wrap_coordinates(xyz_a, box)
+                xyz_b = _wrap_coordinates(xyz_b, box)
+            else:
+                box = None
+
+            tree_a = cKDTree(xyz_a, boxsize=box)
+            tree_b = cKDTree(xyz_b, boxsize=box)
+            pairs = tree_a.sparse_distance_matrix(tree_b, radius,
+                                                  output_type="ndarray")
+
+            candidates = np.sort(pairs["i"].astype(np.int64) * n_b + pairs["j"])
+            if candidates.shape[0]:
+                atom_pairs = np.column_stack((self.atom_group_a[candidates // n_b],
+                                              self.atom_group_b[candidates % n_b]))
+                dist = mt.compute_distances(self.traj.slice(i, copy=False),
+                                            atom_pairs)[0]
+                candidates = candidates[dist <= self.cutoff]
+
+            contacts.append(candidates)
+
+        self.contacts_ = contacts
+        self.neighbors_computed_ = True
+
+        return self
+
     def coord_num(self):
         """
         Calculate the coordinate number using mdtraj
@@ -288,6 +512,12 @@ class ContactMap(object):
         self: the instance itself
 
         """
+        if not self.cmap_computed_ and self._use_neighbor_search():
+            self.neighbor_search()
+            self.coord_number_ = np.array([x.shape[0] for x in self.contacts_],
+                                          dtype=np.float64)
+            return self
+
         if not self.cmap_computed_:
             self.generate_cmap(shape="array", switch=False)
 
@@ -296,17 +526,370 @@ class ContactMap(object):
         return self
 
 
+    def binary_cmap(self, storage="packed"):
+        """Calculate the contact map in a compact format. The contact
+        map is not kept in the instance.
+
+        Parameters
+        ----------
+        storage : str, default = 'packed'
+            the format of the contact map. Options: packed, sparse
+            packed: each frame is a row of bits, np.packbits
+            sparse: a scipy.sparse.csr_matrix of the atom pairs in contact
+
+        Returns
+        -------
+        cmap : np.ndarray or scipy.sparse.csr_matrix
+            packed: np.uint8 array, shape = [N, ceil(M / 8)]
+            sparse: bool csr_matrix, shape = [N, M]
+            N is number of frames, M is number of atom pairs.
+
+        """
+        if self._use_neighbor_search():
+            # the contacts are already sparse, no dense matrix is needed
+            self.neighbor_search()
+            counts = [x.shape[0] for x in self.contacts_]
+            indptr = np.concatenate(([0, ], np.cumsum(counts))).astype(np.int64)
+            if len(counts) and indptr[-1]:
+                indices = np.concatenate(self.contacts_).astype(np.int64)
+            else:
+                indices = np.array([], dtype=np.int64)
+
+            cmap = sparse.csr_matrix((np.ones(indices.shape[0], dtype=bool), indices, indptr),
+                                     shape=(self.traj.n_frames, self.n_pairs_()))
+            if storage == "packed":
+                cmap = np.packbits(cmap.toarray(), axis=1)
+        else:
+            if not self.distmtx_computed_:
+                self.distance_matrix()
+
+            cmap = self.dist_matrix_ <= self.cutoff
+            self.dist_matrix_ = None
+            self.distmtx_computed_ = False
+
+            if storage == "packed":
+                cmap = np.packbits(cmap, axis=1)
+            else:
+                cmap = sparse.csr_matrix(cmap)
+
+        return cmap
+
+
+def _wrap_coordinates(xyz, box):
+    """Put the coordinates into a rectangular box [0, box)"""
+    xyz = xyz - np.floor(xyz / box) * box
+    return np.where(xyz >= box, xyz - box, xyz)
+
+
+class BinaryCmap(object):
+    """A binary (0 or 1) contact map stored in a compact format.
+
+    A dense contact map costs 8 bytes (np.float64) per atom pair and per
+    frame. Here each frame is either packed into bits (np.packbits), or
+    only the atom pairs in contact are kept in a sparse CSR matrix, which
+    is smaller when the contacts are rare.
+
+    Parameters
+    ----------
+    n_pairs : int
+        The number of atom pairs (columns) of the contact map
+    storage : str, default = 'packed'
+        The storage format. Options: packed, sparse
+    memmap : str, default = None
+        The file name of a raw np.memmap file to hold the packed frames,
+        only used with packed storage.
+
+    Attributes
+    ----------
+    n_pairs_ : int
+        The number of atom pairs
+    n_frames_ : int
+        The number of frames
+    storage_ : str
+        The storage format
+    data_ : np.ndarray or scipy.sparse.csr_matrix
+        packed: np.uint8 array, shape = [N, ceil(M / 8)]
+        sparse: bool csr_matrix, shape = [N, M]
+    index_ : np.array, shape = [N, ]
+        The label (time) of each frame
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> from mdanaly import cmap
+    >>> cm = cmap.BinaryCmap(n_pairs=3)
+    >>> cm.append(np.array([[1, 0, 1], [0, 0, 1]]))
+    >>> cm.mean(axis=0)
+    array([0.5, 0. , 1. ])
+    >>> cm.toarray()
+    array([[1., 0., 1.],
+           [0., 0., 1.]])
+
+    See Also
+    --------
+    ContactMap.binary_cmap
+
+    """
+
+    def __init__(self, n_pairs, storage="packed", memmap=None):
+        if storage not in ["packed", "sparse"]:
+            raise ValueError("storage should be packed or sparse, got %s" % storage)
+
+        self.n_pairs_ = int(n_pairs)
+        self.storage_ = storage
+        self.memmap = memmap
+
+        self.n_frames_ = 0
+        self.index_ = None
+
+        self._packed = ArrayAccumulator(dtype=np.uint8, memmap=memmap)
+        self._blocks = []
+        self._data = None
+
+    @property
+    def shape(self):
+        return self.n_frames_, self.n_pairs_
+
+    @property
+    def data_(self):
+        if self._data is None:
+            if self.storage_ == "packed":
+                if self._packed.n_rows_:
+                    self._data = self._packed.values()
+                else:
+                    self._data = np.zeros((0, (self.n_pairs_ + 7) // 8), dtype=np.uint8)
+            else:
+                if len(self._blocks):
+                    self._data = sparse.vstack(self._blocks, format="csr")
+                else:
+                    self._data = sparse.csr_matrix((0, self.n_pairs_), dtype=bool)
+                self._blocks = [self._data, ]
+
+        return self._data
+
+    def append(self, cmap):
+        """Append the frames of a contact map
+
+        Parameters
+        ----------
+        cmap : np.ndarray or scipy.sparse matrix
+            the contact map of some frames. Dense arrays with shape
+            [N, M] are treated as binary (non-zero is contact). A np.uint8
+            array with shape [N, ceil(M / 8)] is taken as packed frames,
+            the padding bits of their last byte are ignored.
+
+        Returns
+        -------
+        self : the instance itself
+        """
+        packed = isinstance(cmap, np.ndarray) and cmap.dtype == np.uint8 and \
+            cmap.ndim == 2 and cmap.shape[1] == (self.n_pairs_ + 7) // 8 and \
+            cmap.shape[1] != self.n_pairs_
+
+        if self.storage_ == "packed":
+            if sparse.issparse(cmap):
+                cmap = cmap.toarray()
+            if not packed:
+                cmap = np.packbits(np.asarray(cmap) != 0, axis=1)
+            elif self.n_pairs_ % 8:
+                # clear the padding bits of the last byte, thus the bit
+                # counts of the frames only include the atom pairs
+                cmap = cmap.copy()
+                cmap[:, -1] &= np.uint8((0xff << (8 - self.n_pairs_ % 8)) & 0xff)
+            self._packed.append(cmap)
+        else:
+            if packed:
+                cmap = np.unpackbits(cmap, axis=1, count=self.n_pairs_)
+            cmap = sparse.csr_matrix(cmap != 0) if not sparse.issparse(cmap) \
+                else sparse.csr_matrix(cmap, dtype=bool)
+            self._blocks.append(cmap)
+
+        self.n_frames_ += cmap.shape[0]
+        self._data = None
+
+        return self
+
+    def toarray(self, start=0, end=None, columns=None, dtype=np.float64):
+        """Dense contact map of a range of frames
+
+        Parameters
+        ----------
+        start : int, default = 0
+            the first frame
+        end : int, default = None
+            the last frame (not included), None means all the frames
+        columns : np.array, default = None
+            the indices of the atom pairs to keep, None means all
+        dtype : np.dtype, default = np.float64
+            the data type of the output
+
+        Returns
+        -------
+        cmap : np.ndarray, shape = [N, M]
+            N is number of frames, M is number of atom pairs.
+        """
+        if self.storage_ == "packed":
+            cmap = np.unpackbits(self.data_[start:end], axis=1, count=self.n_pairs_)
+        else:
+            cmap = self.data_[start:end].toarray()
+
+        if columns is not None:
+            cmap = cmap[:, columns]
+
+        return cmap.astype(dtype)
+
+    def tocsr(self, columns=None, dtype=np.float64, block=1000):
+        """The contact map as a scipy.sparse.csr_matrix, the packed
+        frames are converted block by block, never as a whole.
+
+        Parameters
+        ----------
+        columns : np.array, default = None
+            the indices of the atom pairs to keep, None means all
+        dtype : np.dtype, default = np.float64
+            the data type of the output
+        block : int, default = 1000
+            the number of packed frames converted at a time
+
+        Returns
+        -------
+        cmap : scipy.sparse.csr_matrix, shape = [N, M]
+        """
+        if self.storage_ == "sparse":
+            cmap = self.data_
+        else:
+            blocks = [sparse.csr_matrix(np.unpackbits(self.data_[i:i + block], axis=1,
+                                                      count=self.n_pairs_).astype(bool))
+                      for i in range(0, self.n_frames_, block)]
+            if len(blocks):
+                cmap = sparse.vstack(blocks, format="csr")
+            else:
+                cmap = sparse.csr_matrix((0, self.n_pairs_), dtype=bool)
+
+        if columns is not None:
+            cmap = cmap[:, columns]
+
+        return cmap.astype(dtype)
+
+    def iter_blocks(self, block=1000, columns=None, dtype=np.float64):
+        """Iterate over the dense contact map in blocks of frames
+
+        Parameters
+        ----------
+        block : int, default = 1000
+            the number of frames per block
+        columns : np.array, default = None
+            the indices of the atom pairs to keep, None means all
+        dtype : np.dtype, default = np.float64
+            the data type of the output
+
+        Yields
+        ------
+        cmap : np.ndarray, shape = [block, M]
+        """
+        for start in range(0, self.n_frames_, block):
+            yield self.toarray(start, start + block, columns=columns, dtype=dtype)
+
+    def sum(self, axis=0, block=1000):
+        """The number of frames in contact for each atom pair (axis=0),
+        or the number of contacts of each frame (axis=1)."""
+        if self.storage_ == "sparse":
+            return np.asarray(self.data_.sum(axis=axis, dtype=np.int64)).ravel()
+
+        if axis == 0:
+            counts = np.zeros(self.n_pairs_, dtype=np.int64)
+            for x in self.iter_blocks(block, dtype=np.uint8):
+                counts += x.sum(axis=0, dtype=np.int64)
+            return counts
+        else:
+            # count the bits of each frame
+            bits = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+            return bits[self.data_].sum(axis=1)
+
+    def mean(self, axis=0, block=1000):
+        """The contact probability of each atom pair (axis=0)"""
+        n = self.n_frames_ if axis == 0 else self.n_pairs_
+        return self.sum(axis=axis, block=block) / float(max(n, 1))
+
+    def greater_fraction(self, threshold):
+        """The fraction of frames where the contact map is greater than
+        the threshold, for each atom pair"""
+        if threshold < 0:
+            return np.ones(self.n_pairs_)
+        elif threshold < 1:
+            return self.mean(axis=0)
+        else:
+            return np.zeros(self.n_pairs_)
+
+    def subset(self, rows):
+        """A new BinaryCmap object with the selected frames
+
+        Parameters
+        ----------
+        rows : np.array
+            the frame indices or a boolean mask of the frames
+
+        Returns
+        -------
+        cmap : BinaryCmap
+        """
+        rows = np.arange(self.n_frames_)[rows]
+        cm = BinaryCmap(self.n_pairs_, storage=self.storage_)
+        cm.append(self.data_[rows])
+        if self.index_ is not None:
+            cm.index_ = np.asarray(self.index_)[rows]
+
+        return cm
+
+    def save(self, fname):
+        """Save the contact map to a compressed .npz file"""
+        if self.storage_ == "packed":
+            data = {"data": self.data_}
+        else:
+            data = {"indices": self.data_.indices, "indptr": self.data_.indptr}
+
+        index = self.index_ if self.index_ is not None else np.arange(self.n_frames_)
+        np.savez_compressed(fname, storage=self.storage_, n_pairs=self.n_pairs_,
+                            index=index, **data)
+
+        return self
+
+    @classmethod
+    def load(cls, fname):
+        """Load a contact map saved by BinaryCmap.save"""
+        dat = np.load(fname)
+        cm = cls(int(dat["n_pairs"]), storage=str(dat["storage"]))
+        if cm.storage_ == "packed":
+            cm.append(dat["data"])
+        else:
+            indices = dat["indices"]
+            indptr = dat["indptr"]
+            cm.append(sparse.csr_matrix((np.ones(indices.shape[0], dtype=bool), indices, indptr),
+                                        shape=(indptr.shape[0] - 1, cm.n_pairs_)))
+        cm.index_ = dat["index"]
+
+        return cm
+
+
 class CmapNbyN(ContactMap):
-    """Generate side-chain contact map
+    """Generate residue based (side-chain) contact map
 
-    This class is inherited from ContactMap
+    This class is inherited from ContactMap. The distances of all the
+    selected atoms are computed in a single pass, then the atom contacts
+    are summed up for each residue pair.
 
     Parameters
     ----------
-    traj
-    resids_a
-    resids_b
-    cutoff
+    traj : mt.Trajectory
+        The input trajectory for analysis
+    resids_a : list
+        The residue indices (starting from 0) for x-axis
+    resids_b : list
+        The residue indices (starting from 0) for y-axis
+    cutoff : float, default = 0.35
+        the distance cutoff, default is 3.5 angstrom
+    backend : str, default = 'brute'
+        the method for finding atom contacts. Options: brute, kdtree
 
     Attributes
     ----------
@@ -316,34 +899,30 @@ class CmapNbyN(ContactMap):
         the list of atom index for cmap x-axis
     atom_group_b : np.array
         the list of atom index for cmap y-axis
-    atom_pairs_ : np.ndarray, shape=[N, 2]
-        the atom pairs for distance calculation, N is the number
-        of atom pairs.
-    dist_matrix_ : np.ndarray, shape = [M, N]
-        the distance matrix, M is the number of atoms for x-axis
-        N is the number of atom pairs in y-axis
-    cmap_ : np.ndarray, shape = [M, N]
-        the contact map matrix, M is the number of atoms for x-axis
-        N is the number of atoms in y-axis
-    cmap_computed_ : bool
-        whether the contact map has been calculated
-    coord_num_
-    resids_a
-    resids_b
-    top_
-    contacts_by_res_
+    cmap_ : np.ndarray, shape = [N, M]
+        the contact map normalized by the product of the atom numbers
+        of the two residues, N is number of frames, M is number of
+        residue pairs
+    resids_a_ : list
+        the residue indices for x-axis
+    resids_b_ : list
+        the residue indices for y-axis
+    top_ : mt.Topology
+        the topology of the trajectory
+    contacts_by_res_ : np.ndarray, shape = [N, M]
+        the number of atom contacts of each residue pair,
+        N is number of frames, M is number of residue pairs
 
     See Also
     --------
     ContactMap
 
-    TODO: Bugs to be fixed in this module
-
     """
 
-    def __init__(self, traj, resids_a, resids_b, cutoff=0.35):
+    def __init__(self, traj, resids_a, resids_b, cutoff=0.35, backend="brute"):
 
-        super().__init__(traj=traj, group_a=[], group_b=[], cutoff=cutoff)
+        super().__init__(traj=traj, group_a=[], group_b=[], cutoff=cutoff,
+                         backend=backend)
 
         self.resids_a_ = resids_a
         self.resids_b_ = resids_b
@@ -351,77 +930,198 @@ class CmapNbyN(ContactMap):
         self.top_ = self.traj.topology
         self.contacts_by_res_ = np.array([])
 
-    def single_pair_dist(self, resid_a, resid_b, atomtype=["all"]):
+    def residue_atoms(self, resids, atomtype="all"):
+        """Select the atoms of a list of residues
+
+        Parameters
+        ----------
+        resids : list
+            The residue indices, starting from 0
+        atomtype : str, default = 'all'
+            The mdtraj atom selection applied to each residue
+
+        Returns
+        -------
+        atoms : np.array
+            the atom indices of all the residues
+        positions : np.array
+            the position of the residue in resids for each atom
+        n_atoms : np.array
+            the number of atoms selected for each residue
         """
 
+        selected = self.top_.select(atomtype)
+        res_of_atom = np.array([self.top_.atom(x).residue.index for x in selected],
+                               dtype=np.int64)
+
+        atoms, positions, n_atoms = [], [], []
+        for i, resid in enumerate(resids):
+            res_atoms = selected[res_of_atom == int(resid)]
+            atoms.append(res_atoms)
+            positions.append(np.repeat(i, res_atoms.shape[0]))
+            n_atoms.append(res_atoms.shape[0])
+
+        atoms = np.concatenate(atoms).astype(np.int64) if len(atoms) else np.array([], dtype=np.int64)
+        positions = np.concatenate(positions).astype(np.int64) if len(positions) else np.array([], dtype=np.int64)
+
+        return atoms, positions, np.array(n_atoms)
+
+    def residue_contacts(self, atomtype=["all", "all"]):
+        """Count the atom contacts between each residue pair
+
         Parameters
         ----------
-        resid_a : int
-            The residue id for x-axis
-        resid_b : int
-            The residue id for y-axis
+        atomtype : list, default = ['all', 'all']
+            The atom selections for x-axis and y-axis residues
 
         Returns
         -------
+        contacts : np.ndarray, shape = [N, M]
+            the number of atom contacts, N is number of frames and
+            M is number of residue pairs
+        n_pairs : np.array, shape = [M, ]
+            the number of atom pairs of each residue pair
+        """
+
+        atoms_a, pos_a, n_atoms_a = self.residue_atoms(self.resids_a_, atomtype[0])
+        atoms_b, pos_b, n_atoms_b = self.residue_atoms(self.resids_b_, atomtype[-1])
+
+        n_res_b = len(self.resids_b_)
+        n_res_pairs = len(self.resids_a_) * n_res_b
+        n_pairs = np.outer(n_atoms_a, n_atoms_b).ravel()
+
+        contacts = np.zeros((self.traj.n_frames, n_res_pairs))
+        if atoms_a.shape[0] == 0 or atoms_b.shape[0] == 0:
+            return contacts, n_pairs
+
+        # one distance calculation over all the selected atoms
+        self.atom_group_a = atoms_a
+        self.atom_group_b = atoms_b
+        self.cmap_computed_ = False
+        self.distmtx_computed_ = False
+        self.neighbors_computed_ = False
+
+        if self._use_neighbor_search():
+            self.neighbor_search()
+            frames = np.repeat(np.arange(len(self.contacts_)),
+                               [x.shape[0] for x in self.contacts_])
+            atom_contacts = np.concatenate(self.contacts_).astype(np.int64) \
+                if frames.shape[0] else np.array([], dtype=np.int64)
+        else:
+            self.generate_atom_pairs()
+            frames, atom_contacts = self.distance_contacts()
+
+        # map the atom pairs in contact to residue pairs, then count them
+        n_b = atoms_b.shape[0]
+        if frames.shape[0]:
+            res_pairs = pos_a[atom_contacts // n_b] * n_res_b + pos_b[atom_contacts % n_b]
+            counts = np.bincount(frames * n_res_pairs + res_pairs,
+                                 minlength=self.traj.n_frames * n_res_pairs)
+            contacts = counts.reshape((self.traj.n_frames, n_res_pairs)).astype(np.float64)
+
+        return contacts, n_pairs
 
+    def distance_contacts(self, block_size=2 ** 22):
+        """Find the atom pairs in contact from the atom distances. The
+        distances are computed in blocks of frames and atom pairs, thus
+        at most block_size distances are in memory at a time.
+
+        Parameters
+        ----------
+        block_size : int, default = 2 ** 22
+            the maximum number of distances (frames * atom pairs) per block
+
+        Returns
+        -------
+        frames : np.array
+            the frame index of each contact
+        atom_contacts : np.array
+            the atom pair index of each contact
         """
+        n_frames, n_pairs = self.traj.n_frames, self.n_pairs_()
+        pair_block = max(1, min(n_pairs, block_size))
+        frame_block = max(1, block_size // pair_block)
+
+        frames, atom_contacts = [], []
+        for start in range(0, n_frames, frame_block):
+            traj = self.traj.slice(slice(start, start + frame_block), copy=False)
+            for first in range(0, n_pairs, pair_block):
+                dist = mt.compute_distances(traj, self.atom_pairs_[first:first + pair_block])
+                f, p = np.nonzero(dist <= self.cutoff)
+                frames.append(f + start)
+                atom_contacts.append(p + first)
+
+        if len(frames):
+            return np.concatenate(frames).astype(np.int64), \
+                np.concatenate(atom_contacts).astype(np.int64)
+        else:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
 
-        atoms_list_a = self.top_.select("resid %d and %s"
-                                        % (resid_a, atomtype[0]))
-        atoms_list_b = self.top_.select("resid %d and %s"
-                                        % (resid_b, atomtype[-1]))
+    def single_pair_dist(self, resid_a, resid_b, atomtype=["all"]):
+        """Contacts between two residues
 
-        self.atom_group_a = atoms_list_a
-        self.atom_group_b = atoms_list_b
+        Parameters
+        ----------
+        resid_a : int
+            The residue id for x-axis
+        resid_b : int
+            The residue id for y-axis
+        atomtype : list, default = ['all', ]
+            The atom selections for x-axis and y-axis residues
 
-        #print(self.atom_group_a, self.atom_group_b)
+        Returns
+        -------
+        nbyn : np.ndarray, shape = [N, 1]
+            the contact number normalized by atom pair number
+        contacts : np.ndarray, shape = [N, 1]
+            the contact number, N is number of frames
 
-        self.generate_atom_pairs()
-        #self.distance_matrix()
-        self.generate_cmap()
-        self.coord_num()
+        """
 
-        nbyn = self.coord_number_ / self.atom_pairs_.shape[0]
+        nbyn = CmapNbyN(self.traj, [resid_a, ], [resid_b, ], self.cutoff,
+                        self.backend)
+        contacts, n_pairs = nbyn.residue_contacts(atomtype)
 
-        return nbyn.reshape((-1, 1)), self.coord_number_.reshape((-1, 1))
+        return contacts / np.maximum(n_pairs, 1), contacts
 
     def cmap_nbyn(self, atomtype=['all', 'all']):
         """The main function for residue-residue sidechain contact
         normalized by atom number products.
 
+        Parameters
+        ----------
+        atomtype : list, default = ['all', 'all']
+            The atom selections for x-axis and y-axis residues
+
         Returns
         -------
         self : an instance of itself
 
         """
 
-        cmap = np.array([])
+        contacts, n_pairs = self.residue_contacts(atomtype)
 
-        for res_a in self.resids_a_:
-            for res_b in self.resids_b_:
-                nbyn = self.single_pair_dist(res_a, res_b, atomtype)[0]
-                if cmap.shape[0] == 0:
-                    cmap = nbyn
-                else:
-                    cmap = np.concatenate((cmap, nbyn), axis=1)
-
-        self.cmap_ = cmap
+        # residue pairs without atoms selected are zero
+        self.cmap_ = contacts / np.maximum(n_pairs, 1)
+        self.contacts_by_res_ = contacts
 
         return self
 
-    def contact_nbyn(self, atomtype=['heavy', 'heavy']):
-        contacts = np.array([])
-        for res_a in self.resids_a_:
-            for res_b in self.resids_b_:
-                #print(res_a, res_b)
-                nbyn = self.single_pair_dist(res_a, res_b)[1]
-                #print(nbyn)
-                if contacts.shape[0] == 0:
-                    contacts = nbyn
-                else:
-                    contacts = np.concatenate((contacts, nbyn), axis=1)
+    def contact_nbyn(self, atomtype=['all', 'all']):
+        """The number of atom contacts between residues
 
-        self.contacts_by_res_ = contacts
+        Parameters
+        ----------
+        atomtype : list, default = ['all', 'all']
+            The atom selections for x-axis and y-axis residues
+
+        Returns
+        -------
+        self : an instance of itself
+
+        """
+
+        self.contacts_by_res_ = self.residue_contacts(atomtype)[0]
 
         return self
 
@@ -547,21 +1247,24 @@ class CommunityCmap(object):
 
     Parameters
     ----------
-    cmap : np.ndarray, or a cmap file name
-        str: the filename of a contact map
+    cmap : np.ndarray, BinaryCmap, or a cmap file name
+        str: the filename of a contact map, a .npz file is loaded
+        as a BinaryCmap object
         np.ndarray: a contactmap matrix np.ndarray object
     sep : str, default = ','
         the delimiter used in the cmap file.
 
     Attributes
     ----------
-    cmap_ : np.ndarray
+    cmap_ : np.ndarray, or BinaryCmap
 
     """
 
     def __init__(self, cmap, sep=",", is_file=False):
 
-        if is_file and os.path.exists(cmap):
+        if is_file and os.path.exists(cmap) and cmap.endswith(".npz"):
+            self.cmap_ = BinaryCmap.load(cmap)
+        elif is_file and os.path.exists(cmap):
             try:
                 self.cmap_ = np.loadtxt(cmap,
                                         delimiter=sep,
@@ -580,7 +1283,7 @@ class CommunityCmap(object):
         ----------
         icritical : float
             The
-        dat: np.ndarray, shape = [N, M]
+        dat: np.ndarray, or BinaryCmap, shape = [N, M]
             The contact map matrix, N is number of residues
 
         Returns
@@ -588,7 +1291,10 @@ class CommunityCmap(object):
 
         """
 
-        self.final_map_ = np.sum(np.greater(dat, icritical), axis=0) / dat.shape[0]
+        if isinstance(dat, BinaryCmap):
+            self.final_map_ = dat.greater_fraction(icritical)
+        else:
+            self.final_map_ = np.sum(np.greater(dat, icritical), axis=0) / dat.shape[0]
         self.final_map_ = (self.final_map_ >= cutoff) * 1.0
 
         return self.final_map_
@@ -753,6 +1459,34 @@ def arguments():
     parser.parser.add_argument('-details', default=None, type=str,
                                help="Provide detail contact information and write out to a file. \n"
                                     "Default is None.")
+    parser.parser.add_argument('-memmap', default=None, type=str,
+                               help="Input, optional. Default is None. \n"
+                                    "Store the per-frame contact map in this binary file (np.memmap)\n"
+                                    "instead of the memory, for very long trajectories. \n")
+    parser.parser.add_argument('-backend', default="brute", type=str,
+                               help="Input, optional. Default is brute. \n"
+                                    "The contact search method. Options: brute, kdtree. \n"
+                                    "brute: compute the distances of all the atom pairs. \n"
+                                    "kdtree: only the atom pairs within the cutoff found by a \n"
+                                    "neighbor search are evaluated, faster for large selections. \n")
+    parser.parser.add_argument('-storage', default="dense", type=str,
+                               help="Input, optional. Default is dense. \n"
+                                    "The storage format of the binary contact map. \n"
+                                    "Options: dense, packed, sparse. \n"
+                                    "packed: 1 bit per atom pair per frame (np.packbits). \n"
+                                    "sparse: only the atom pairs in contact are kept (CSR). \n"
+                                    "With packed or sparse, the time series contact map (-opt TS) \n"
+                                    "is written to a compressed .npz file (see BinaryCmap.load). \n"
+                                    "It does not work with -switch or -NbyN. \n")
+    parser.parser.add_argument('-nt', default=1, type=int,
+                               help="Input, optional. Default is 1. \n"
+                                    "Number of worker processes. The trajectory chunks are \n"
+                                    "distributed to the processes, the output is the same \n"
+                                    "as a serial calculation. \n")
+    parser.parser.add_argument('-std', default="", type=str,
+                               help="Output, optional. Default is empty. \n"
+                                    "Working with -opt A. The file name of the standard deviation \n"
+                                    "map of the contacts along the simulations. \n")
     parser.parser.add_argument('-opt', default="TS", type=str,
                                help="Optional setting controls. Default is A. \n"
                                     "Average, calculating the average cmap along the simulations.\n"
@@ -770,13 +1504,93 @@ def verbose(verbose=True, s=""):
         print(s)
 
 
-def cmap_general(trajs, ref, rc, lc, at, cutoff=0.35, v=True, switch=False):
+def chunk_cmap(traj, group_a, group_b, cutoff=0.35, switch=False, backend="brute",
+               storage="dense"):
+    """Calculate the contact map of a trajectory chunk
+
+    Parameters
+    ----------
+    traj : mt.Trajectory object
+        The trajectory chunk
+    group_a : np.array
+        The atom indices for x-axis
+    group_b : np.array
+        The atom indices for y-axis
+    cutoff : float, default = 0.35
+        The distance cutoff, in unit nanometer
+    switch : bool, default = False
+        Whether apply a switch function to have continuous contact map
+    backend : str, default = 'brute'
+        The contact search method, options: brute, kdtree
+    storage : str, default = 'dense'
+        The format of the contact map, options: dense, packed, sparse.
+        See ContactMap.binary_cmap
+
+    Returns
+    -------
+    cmap : np.ndarray, shape = [ N, M ]
+        The contact map, N is number of frames, M is number of atom pairs.
+    """
+
+    contmap = ContactMap(traj, group_a, group_b, cutoff=cutoff, backend=backend)
+    if storage != "dense" and not switch:
+        return contmap.binary_cmap(storage=storage)
+
+    contmap.generate_cmap(shape="array", switch=switch)
+
+    return contmap.cmap_
+
+
+def chunk_cmap_nbyn(traj, resids_a, resids_b, cutoff=0.35,
+                    atomtype=["sidechain", "sidechain"], backend="brute"):
+    """Calculate the residue based contact map of a trajectory chunk
+
+    Parameters
+    ----------
+    traj : mt.Trajectory object
+        The trajectory chunk
+    resids_a : list
+        The residue indices for x-axis
+    resids_b : list
+        The residue indices for y-axis
+    cutoff : float, default = 0.35
+        The distance cutoff, in unit nanometer
+    atomtype : list, default = ['sidechain', 'sidechain']
+        The atom types of x-axis and y-axis residues
+    backend : str, default = 'brute'
+        The contact search method, options: brute, kdtree
+
+    Returns
+    -------
+    cmap : np.ndarray, shape = [ N, M ]
+        The contact map, N is number of frames, M is number of residue pairs.
+    """
+
+    contmap = CmapNbyN(traj, resids_a=resids_a,
+                       resids_b=resids_b, cutoff=cutoff, backend=backend)
+    contmap.cmap_nbyn(atomtype=atomtype)
+
+    return contmap.cmap_
+
+
+def _map_chunks(trajs, func, n_jobs=1):
+    """Apply func to the trajectory chunks, in parallel if possible"""
+    if hasattr(trajs, "map"):
+        return trajs.map(func, n_jobs=n_jobs)
+    else:
+        return (func(traj) for traj in trajs)
+
+
+def cmap_general(trajs, ref, rc, lc, at, cutoff=0.35, v=True, switch=False,
+                 memmap=None, n_jobs=1, backend="brute", storage="dense",
+                 results=None):
     """Computate general type of contact maps
 
     Parameters
     ----------
-    trajs : list of mt.trajectory objects, shape = N
-        The input chunks of trajectories, N is number of chunks
+    trajs : iterable of mt.trajectory objects, shape = N
+        The input chunks of trajectories, N is number of chunks.
+        A gmxcli.TrajectoryChunks object loads the chunks lazily.
     ref : str
         The reference pdb file name
     rc : list, shape = 3
@@ -791,16 +1605,31 @@ def cmap_general(trajs, ref, rc, lc, at, cutoff=0.35, v=True, switch=False):
         Whether print detail information during the calculation
     switch : bool, default = False
         Whether apply a switch function to have continuous contact map
+    memmap : str, default = None
+        The file name of a np.memmap file to store the contact map on disk
+    n_jobs : int, default = 1
+        Number of worker processes. Chunks are sent to the workers by
+        their positions in the xtc file, trajs should be a
+        gmxcli.TrajectoryChunks object when n_jobs > 1.
+    backend : str, default = 'brute'
+        The contact search method, options: brute, kdtree
+    storage : str, default = 'dense'
+        The format of the contact map, options: dense, packed, sparse.
+        packed and sparse keep the binary contact map in a BinaryCmap
+        object, they do not work with switch.
+    results : object, default = None
+        The accumulator collecting the contact maps of the chunks, for
+        example an accumulator.MeanAccumulator to get the average contact
+        map in constant memory. Default is an ArrayAccumulator, or a
+        BinaryCmap with packed or sparse storage.
 
     Returns
     -------
-    contact_map : np.ndarray, shape = [ N, M ]
-        The output contact map dataset
+    contact_map : np.ndarray or BinaryCmap, shape = [ N, M ]
+        The output contact map dataset, or results.values()
         N is number of frames, M is number of dimensions.
     """
 
-    contact_map = np.array([])
-
     # receptor (x-axis) atom selection
     group_a = index.gen_atom_index(pdbin=ref, chain=[rc[0], ], resSeq=rc[1:],
                                    atomtype=at[0], style="mdtraj")
@@ -811,30 +1640,40 @@ def cmap_general(trajs, ref, rc, lc, at, cutoff=0.35, v=True, switch=False):
 
     verbose(verbose=v, s="Atom indices have been processed ......")
 
-    for i, traj in enumerate(trajs):
+    if results is not None:
+        storage = "dense"
+    elif storage != "dense" and not switch:
+        results = BinaryCmap(len(group_a) * len(group_b), storage=storage,
+                             memmap=memmap)
+    else:
+        results = ArrayAccumulator(n_rows=getattr(trajs, "n_frames_", None),
+                                   memmap=memmap)
+
+    func = partial(chunk_cmap, group_a=group_a, group_b=group_b,
+                   cutoff=cutoff, switch=switch, backend=backend,
+                   storage=storage)
+    for i, contmap in enumerate(_map_chunks(trajs, func, n_jobs)):
         # calculate cmap information
         verbose(v, "Generate cmap for chunk %5d ......" % i)
-        contmap = ContactMap(traj, group_a, group_b, cutoff=cutoff)
-        contmap.generate_cmap(shape="array", switch=switch)
+        results.append(contmap)
 
-        if i == 0:
-            contact_map = contmap.cmap_
-        else:
-            contact_map = np.concatenate((contact_map, contmap.cmap_),
-                                         axis=0)
+    if isinstance(results, BinaryCmap):
+        return results
 
-    return contact_map
+    return results.values()
 
 
 def cmap_nbyn(trajs, ref, rc, lc, v=True,
               cutoff=0.35, allchains=" ABCDEFGH",
-              atomtype=["sidechain", "sidechain"]):
+              atomtype=["sidechain", "sidechain"], memmap=None, n_jobs=1,
+              backend="brute", results=None):
     """Generate sidechain based contact maps.
 
     Parameters
     ----------
-    trajs : list of mt.trajectory objects, shape = N
-        The input chunks of trajectories, N is number of chunks
+    trajs : iterable of mt.trajectory objects, shape = N
+        The input chunks of trajectories, N is number of chunks.
+        A gmxcli.TrajectoryChunks object loads the chunks lazily.
     ref : str
         The reference pdb file name
     rc : list, shape = 3
@@ -847,8 +1686,21 @@ def cmap_nbyn(trajs, ref, rc, lc, v=True,
         Whether print detail information during the calculation
     allchains : str, default = 'ABCDEFGH'
         All available chain identifiers in the reference pdb files
+    memmap : str, default = None
+        The file name of a np.memmap file to store the contact map on disk
+    n_jobs : int, default = 1
+        Number of worker processes.
+    backend : str, default = 'brute'
+        The contact search method, options: brute, kdtree
+    results : object, default = None
+        The accumulator collecting the contact maps of the chunks.
+        Default is an ArrayAccumulator.
+
     Returns
     -------
+    contact_map : np.ndarray, shape = [ N, M ]
+        The output contact map dataset, or results.values()
+        N is number of frames, M is number of residue pairs.
 
     """
 
@@ -873,21 +1725,17 @@ def cmap_nbyn(trajs, ref, rc, lc, v=True,
             resids_b.append(i)
     print(resids_b)
 
-    contact_map = np.array([])
-    for i, traj in enumerate(trajs):
+    if results is None:
+        results = ArrayAccumulator(n_rows=getattr(trajs, "n_frames_", None),
+                                   memmap=memmap)
+    func = partial(chunk_cmap_nbyn, resids_a=resids_a, resids_b=resids_b,
+                   cutoff=cutoff, atomtype=atomtype, backend=backend)
+    for i, contmap in enumerate(_map_chunks(trajs, func, n_jobs)):
         # calculate cmap information
         verbose(v, "Generate cmap for chunk %5d ......" % i)
-        contmap = CmapNbyN(traj, resids_a=resids_a,
-                           resids_b=resids_b, cutoff=cutoff)
-
-        contmap.cmap_nbyn(atomtype=atomtype)
-        if i == 0:
-            contact_map = contmap.cmap_
-        else:
-            contact_map = np.concatenate((contact_map, contmap.cmap_),
-                                         axis=0)
+        results.append(contmap)
 
-    return contact_map
+    return results.values()
 
 
 def iterload_cmap():
@@ -924,40 +1772,68 @@ def iterload_cmap():
     trajs = gmxcli.read_xtc(args.f, args.s, chunk=1000,
                             stride=int(args.dt/args.ps))
 
-    n_frames = sum([x.n_frames for x in trajs])
+    n_frames = trajs.n_frames_
     verbose(args.v, "Total number of frames: %d " % n_frames)
 
+    average = args.opt in ['A', 'a', 'average', 'Average']
+    if average:
+        # only the running sums are kept, the -b/-e window is applied
+        # to the frames while streaming
+        rows = np.flatnonzero(pca.subset_mask(np.arange(n_frames) * args.dt, args.b, args.e))
+        start, end = (rows[0], rows[-1] + 1) if rows.shape[0] else (n_frames, n_frames)
+        results = MeanAccumulator(start=start, end=end, std=len(args.std) > 0)
+    else:
+        results = None
+
     verbose(args.v, "Start calculating contact map ......")
     if args.NbyN:
         contact_map = cmap_nbyn(trajs, inp, args.rc, args.lc,
                                 args.v, args.cutoff,
-                                " ABCDEFGHIJK", args.atomtype)
+                                " ABCDEFGHIJK", args.atomtype,
+                                memmap=args.memmap, n_jobs=args.nt,
+                                backend=args.backend, results=results)
     else:
         contact_map = cmap_general(trajs, inp, args.rc, args.lc,
                                    args.atomtype, args.cutoff,
-                                   v=args.v, switch=args.switch)
+                                   v=args.v, switch=args.switch,
+                                   memmap=args.memmap, n_jobs=args.nt,
+                                   backend=args.backend, storage=args.storage,
+                                   results=results)
 
     # subset the results
     verbose(args.v, "Preparing output file ......")
-    contact_map = pd.DataFrame(contact_map)
-    contact_map.index = np.arange(contact_map.shape[0]) * args.dt
-    contact_map = pca.datset_subset(contact_map, args.b, args.e)
-
-    # get mean cmap data
-    if args.opt in ['A', 'a', 'average', 'Average']:
-        results = np.mean(contact_map, axis=0).reshape((rec_index, lig_index))
-        results = pd.DataFrame(results)
-        results.index = range(int(args.rc[1]), int(args.rc[2]) + 1)
-        results.columns = range(int(args.lc[1]), int(args.lc[2]) + 1)
+    if average:
+        verbose(args.v, "Number of frames averaged: %d " % results.n_samples_)
+        outputs = [(args.o, results.mean()), ]
+        if len(args.std):
+            outputs.append((args.std, results.std()))
+
+        verbose(args.v, "Writing output now ...... ")
+        for fn, dat in outputs:
+            dat = pd.DataFrame(dat.reshape((rec_index, lig_index)))
+            dat.index = range(int(args.rc[1]), int(args.rc[2]) + 1)
+            dat.columns = range(int(args.lc[1]), int(args.lc[2]) + 1)
+            dat.to_csv(fn, sep=",", header=True, index=True, float_format="%.3f")
+
+    elif isinstance(contact_map, BinaryCmap):
+        contact_map.index_ = np.arange(contact_map.n_frames_) * args.dt
+        contact_map = contact_map.subset(pca.subset_mask(contact_map.index_, args.b, args.e))
+
+        verbose(args.v, "Writing %s contact map to a npz file ...... " % args.storage)
+        contact_map.save(args.o)
+
     else:
+        contact_map = pd.DataFrame(contact_map)
+        contact_map.index = np.arange(contact_map.shape[0]) * args.dt
+        contact_map = pca.datset_subset(contact_map, args.b, args.e)
+
         results = contact_map
-        results = pd.DataFrame(results)
         results.index = np.arange(results.shape[0]) * args.dt
         results.columns = [str(x) for x in np.arange(results.shape[1])]
 
-    # save results to an output file
-    verbose(args.v, "Writing output now ...... ")
-    results.to_csv(args.o, sep=",", header=True, index=True, float_format="%.3f")
+        # save results to an output file
+        verbose(args.v, "Writing output now ...... ")
+        results.to_csv(args.o, sep=",", header=True, index=True, float_format="%.3f")
 
     print("Total Time Usage: ")
     print(datetime.now() - startTime)
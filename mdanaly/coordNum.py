@@ -3,6 +3,7 @@
 from dockml import index
 from mdanaly import gmxcli, cmap
 from mdanaly.cmap import verbose
+from mdanaly.accumulator import ArrayAccumulator
 
 import pandas as pd
 import numpy as np
@@ -38,6 +39,10 @@ def arguments():
                                help="Input, optional. Default = 0.5 \n"
                                     "The distance cutoff for coordination number calculation. \n"
                                     "Unit is nanometer.")
+    parser.parser.add_argument("-backend", type=str, default="brute",
+                               help="Input, optional. Default = brute. \n"
+                                    "The contact search method. Options: brute, kdtree. \n"
+                                    "kdtree only evaluates the atom pairs within the cutoff.")
     parser.parser.add_argument("-byres", type=lambda x: (str(x).lower() == "true"), default=False,
                                help="Input, optional. Default = False. \n"
                                     "Computate contact number per residue. ")
@@ -105,34 +110,29 @@ def run_coord_number():
                                        resSeq=args.lc[1:], style="mdtraj")
         verbose(args.v, "Atom indexing processing completed ......")
 
-    results = np.array([])
-
     verbose(args.v, "Loading trajectory xtc file ...... ")
     trajs = gmxcli.read_xtc(args.f, args.s, chunk=1000,
                             stride=int(args.dt/args.ps))
 
+    results = ArrayAccumulator(n_rows=trajs.n_frames_)
+
     verbose(args.v, "Performing calculations ...... ")
     for i, traj in enumerate(trajs):
         verbose(args.v, "Generate coordinate number for chunk #%d trajectory "%i)
         if args.byres:
             coord = cmap.CmapNbyN(traj, resids_a=resides_a,
-                                  resids_b=resides_b, cutoff=args.cutoff)
+                                  resids_b=resides_b, cutoff=args.cutoff,
+                                  backend=args.backend)
             coord.contact_nbyn()
-            if i == 0:
-                results = coord.contacts_by_res_
-            else:
-                results = np.concatenate((results, coord.contacts_by_res_), axis=0)
+            results.append(coord.contacts_by_res_)
 
         else:
-            coord = cmap.ContactMap(traj, group_a, group_b, args.cutoff)
+            coord = cmap.ContactMap(traj, group_a, group_b, args.cutoff,
+                                    backend=args.backend)
             coord.coord_num()
+            results.append(coord.coord_number_)
 
-            if i == 0:
-                results = coord.coord_number_
-            else:
-                results = np.concatenate((results, coord.coord_number_), axis=0)
-
-    results = pd.DataFrame(results)
+    results = pd.DataFrame(results.values())
     results.index = np.arange(results.shape[0]) * args.dt
 
     verbose(args.v, "Saving results to output file ...... ")
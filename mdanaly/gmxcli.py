@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 
 import sys
+import math
+import multiprocessing
+import numpy as np
 import mdtraj as mt
 from argparse import ArgumentParser, RawTextHelpFormatter
 
@@ -96,8 +99,218 @@ class GromacsCommanLine(object):
         return self
 
 
+class TrajectoryChunks(object):
+    """Lazily iterate a Gromacs XTC trajectory file chunk by chunk
+
+    Only one chunk of frames is kept in memory at a time, the frames
+    are read from the disk when the object is iterated over. The total
+    number of frames and the time information are obtained from the
+    xtc frame offsets, without loading the coordinates.
+
+    Parameters
+    ----------
+    xtc : str
+        input xtc file name
+    top : str
+        input topology information file, a pdb
+    chunk : int, default = 100
+        number of frames per chunk
+    stride : int, default = 1
+        dt, save a frame every N number of frames
+
+    Attributes
+    ----------
+    topology_ : mt.Topology object
+        the topology of the trajectory
+    n_frames_total_ : int
+        number of frames stored in the xtc file
+    n_frames_ : int
+        number of frames to be loaded, stride applied
+    n_chunks_ : int
+        number of chunks to be loaded
+    start_time_ : float
+        the simulation time of the first frame, unit ps
+    time_step_ : float
+        the time interval between two loaded frames, unit ps
+
+    Examples
+    --------
+    >>> from mdanaly import gmxcli
+    >>> trajs = gmxcli.TrajectoryChunks("md.xtc", "reference.pdb", chunk=1000)
+    >>> trajs.n_frames_
+    25001
+    >>> for traj in trajs:
+    ...     print(traj.n_frames)
+
+    """
+
+    def __init__(self, xtc, top, chunk=100, stride=1):
+
+        self.xtc = xtc
+        self.top = top
+        self.chunk = max(int(chunk), 1)
+        self.stride = max(int(stride), 1)
+
+        self.topology_ = mt.load_topology(top)
+
+        with mt.open(xtc) as f:
+            self.n_frames_total_ = len(f)
+            xyz, time, step, box = f.read(n_frames=2)
+
+        self.start_time_ = float(time[0]) if len(time) else 0.0
+        if len(time) > 1:
+            self.time_step_ = float(time[1] - time[0]) * self.stride
+        else:
+            self.time_step_ = 0.0
+
+        self.n_frames_ = int(math.ceil(self.n_frames_total_ / float(self.stride)))
+        self.n_chunks_ = int(math.ceil(self.n_frames_ / float(self.chunk)))
+
+        # file handle kept open by read_chunk for random access
+        self._handle = None
+
+    def __len__(self):
+        return self.n_chunks_
+
+    def __getstate__(self):
+        # an open file handle could not be sent to other processes
+        state = self.__dict__.copy()
+        state["_handle"] = None
+        return state
+
+    def __iter__(self):
+        with mt.open(self.xtc) as f:
+            for skip, n_frames in self.chunk_ranges():
+                yield f.read_as_traj(self.topology_, n_frames=n_frames,
+                                     stride=self.stride)
+
+    def chunk_ranges(self):
+        """The position of each chunk in the xtc file
+
+        Returns
+        -------
+        ranges : list of tuple, shape = [ N, 2]
+            the starting frame in the xtc file (stride not applied) and
+            the number of frames (stride applied) of each chunk,
+            N is number of chunks
+        """
+
+        ranges = []
+        for i in range(self.n_chunks_):
+            n_frames = min(self.chunk, self.n_frames_ - i * self.chunk)
+            ranges.append((i * self.chunk * self.stride, n_frames))
+
+        return ranges
+
+    def read_chunk(self, skip, n_frames):
+        """Load a chunk of frames from the xtc file, which allows
+        random access to the chunks given by chunk_ranges
+
+        Parameters
+        ----------
+        skip : int
+            the starting frame in the xtc file, stride not applied
+        n_frames : int
+            number of frames to load, stride applied
+
+        Returns
+        -------
+        traj : mt.Trajectory object
+            the chunk of frames
+        """
+
+        # keep the file open, the xtc frame offsets are then only
+        # computed once for all the chunks
+        if self._handle is None:
+            self._handle = mt.open(self.xtc)
+
+        self._handle.seek(skip)
+        traj = self._handle.read_as_traj(self.topology_, n_frames=n_frames,
+                                         stride=self.stride)
+
+        return traj
+
+    def close(self):
+        """Close the file handle opened by read_chunk
+
+        Returns
+        -------
+        self : the instance itself
+        """
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+        return self
+
+    def map(self, func, n_jobs=1):
+        """Apply a function to every chunk, chunks are optionally
+        processed in parallel by a pool of worker processes.
+
+        Each worker loads its own chunks from the xtc file given the
+        chunk positions, so no trajectory data is sent between the
+        processes. The results are yielded in the order of the chunks,
+        thus they are identical to the serial calculation.
+
+        Parameters
+        ----------
+        func : callable
+            the function applied to each mt.Trajectory chunk. When
+            n_jobs > 1, it should be picklable, such as a module level
+            function or a functools.partial object of it.
+        n_jobs : int, default = 1
+            number of worker processes.
+
+        Returns
+        -------
+        results : generator
+            the results of func for each chunk, in order
+        """
+
+        if n_jobs <= 1 or self.n_chunks_ <= 1:
+            for traj in self:
+                yield func(traj)
+        else:
+            n_jobs = min(n_jobs, self.n_chunks_)
+            pool = multiprocessing.Pool(processes=n_jobs,
+                                        initializer=_init_chunk_worker,
+                                        initargs=(self, func))
+            try:
+                for result in pool.imap(_map_chunk_worker, self.chunk_ranges()):
+                    yield result
+            finally:
+                pool.close()
+                pool.join()
+
+    def times(self):
+        """The simulation time of the frames to be loaded
+
+        Returns
+        -------
+        times : np.ndarray, shape = [ N, ]
+            the time of each frame, unit ps. N is number of frames.
+        """
+
+        return self.start_time_ + np.arange(self.n_frames_) * self.time_step_
+
+
+# the trajectory reader and the function used by a worker process
+_chunk_worker = {}
+
+
+def _init_chunk_worker(trajs, func):
+    _chunk_worker["trajs"] = trajs
+    _chunk_worker["func"] = func
+
+
+def _map_chunk_worker(chunk_range):
+    traj = _chunk_worker["trajs"].read_chunk(*chunk_range)
+    return _chunk_worker["func"](traj)
+
+
 def read_xtc(xtc, top, chunk=100, stride=1):
-    """Read Gromacs XTC trajectory file iteratively with mdtraj.iterload
+    """Read Gromacs XTC trajectory file iteratively. The frames are
+    not loaded until the returned object is iterated over.
 
     Parameters
     ----------
@@ -112,14 +325,16 @@ def read_xtc(xtc, top, chunk=100, stride=1):
 
     Returns
     -------
-    trajs : list,
-        a list of mdtraj.Trajectory object
+    trajs : TrajectoryChunks object,
+        an iterable yielding mdtraj.Trajectory objects
+
+    See Also
+    --------
+    TrajectoryChunks
+
     """
-    trajs = []
-    for chunk in mt.iterload(xtc, chunk=chunk, top=top, stride=stride):
-        trajs.append(chunk)
+    trajs = TrajectoryChunks(xtc, top, chunk=chunk, stride=stride)
 
-    print("Number of chunks: ", len(trajs))
+    print("Number of chunks: ", trajs.n_chunks_)
 
     return trajs
-
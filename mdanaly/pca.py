@@ -1,17 +1,37 @@
 # -*- coding: utf-8 -*-
 
+import os
+import json
+import multiprocessing
 import numpy as np
 import pandas as pd
 import sklearn
 from sklearn import decomposition
 from sklearn import preprocessing
+from scipy import sparse
+from scipy.linalg import blas
+from scipy.sparse import linalg as splinalg
+from scipy.spatial import cKDTree
 from mdanaly import cmap
 from mdanaly import gmxcli
 from mdanaly import angles
+from mdanaly.accumulator import ArrayAccumulator
 import mdtraj as mt
 
 
 class tSNE(object):
+    """t-distributed stochastic neighbor embedding.
+
+    Two methods are available:
+    exact: the dense n x n P and Q matrices, the gradient is computed
+        with matrix products. The memory is O(n^2).
+    barnes_hut: P is kept as a sparse matrix of the k nearest neighbors
+        of each sample, the attractive forces are computed over the
+        neighbor pairs, and the repulsive forces are approximated with
+        a Barnes-Hut space partition tree of the embedding. The memory
+        is O(n * k).
+
+    """
 
     def __init__(self):
         pass
@@ -23,92 +43,145 @@ class tSNE(object):
 
         Parameters
         ----------
-        D: numpy ndarray,
-
-        beta: float,
-
+        D: numpy ndarray, shape = [k, ] or [n, k]
+            the squared distances of a sample (or n samples) to the others
+        beta: float, or np.ndarray, shape = [n, ]
+            the precision of the Gaussian distribution of each row
 
         Returns
         -------
-        H:
-        P:
+        H: float, or np.ndarray, shape = [n, ]
+            the entropy of each row
+        P: np.ndarray, shape = [k, ] or [n, k]
+            the normalized P-rows
         """
 
+        D = np.asarray(D, dtype=np.float64)
+        D2 = np.atleast_2d(D)
+        beta = np.asarray(beta, dtype=np.float64).reshape(-1, 1)
+
+        # shift by the smallest distance of each row, H is invariant and
+        # exp() does not underflow to zero for all the entries
+        D2 = D2 - D2.min(axis=1, keepdims=True)
+
         # Compute P-row and corresponding perplexity
-        P = np.exp(-D.copy() * beta)
-        sumP = sum(P)
-        H = np.log(sumP) + beta * np.sum(D * P) / sumP
-        P = P / sumP
+        P = np.exp(-D2 * beta)
+        sumP = P.sum(axis=1)
+        H = np.log(sumP) + beta[:, 0] * np.sum(D2 * P, axis=1) / sumP
+        P /= sumP[:, np.newaxis]
+
+        if D.ndim == 1:
+            return H[0], P[0]
         return H, P
 
-    def x2p(self, X=np.array([]), tol=1e-5, perplexity=30.0):
+    def _neighbor_distances(self, X, n_neighbors=None):
+        """The squared distances between each sample and its neighbors
+
+        Parameters
+        ----------
+        X : np.ndarray, shape = [n, d]
+            the dataset
+        n_neighbors : int, default = None
+            number of nearest neighbors, None for all the other samples
+
+        Returns
+        -------
+        D : np.ndarray, shape = [n, k]
+            the squared distances
+        neighbors : np.ndarray, shape = [n, k]
+            the indices of the neighbors
+        """
+        n = X.shape[0]
+
+        if n_neighbors is None or n_neighbors >= n - 1:
+            sum_X = np.sum(np.square(X), 1)
+            D = np.add(np.add(-2 * np.dot(X, X.T), sum_X).T, sum_X)
+            off_diagonal = ~np.eye(n, dtype=bool)
+            D = np.maximum(D[off_diagonal].reshape(n, n - 1), 0.0)
+            neighbors = np.nonzero(off_diagonal)[1].reshape(n, n - 1)
+            return D, neighbors
+
+        dist, neighbors = cKDTree(X).query(X, k=n_neighbors + 1)
+
+        # drop the sample itself, or the farthest neighbor if duplicated
+        # samples push the sample itself out of the first column
+        is_self = neighbors == np.arange(n)[:, np.newaxis]
+        is_self[~is_self.any(axis=1), -1] = True
+        keep = ~is_self
+        D = np.square(dist[keep].reshape(n, n_neighbors))
+        neighbors = neighbors[keep].reshape(n, n_neighbors)
+
+        return D, neighbors
+
+    def x2p(self, X=np.array([]), tol=1e-5, perplexity=30.0, n_neighbors=None, max_tries=50):
         """
         Performs a binary search to get P-values in such a way that each
-        conditional Gaussian has the same perplexity.
+        conditional Gaussian has the same perplexity. The binary searches
+        of all the rows run together.
 
         Parameters
         ----------
-        X
-        tol
-        perplexity
+        X : np.ndarray, shape = [n, d]
+            the dataset
+        tol : float, default = 1e-5
+            the tolerance of the entropy
+        perplexity : float, default = 30.0
+            the target perplexity
+        n_neighbors : int, default = None
+            only the nearest neighbors of each sample are considered,
+            P is then returned as a sparse matrix. None for all samples.
+        max_tries : int, default = 50
+            the maximum number of binary search steps
 
         Returns
         -------
+        P : np.ndarray, or scipy.sparse.csr_matrix, shape = [n, n]
+            the conditional probabilities, row-wise normalized
 
         """
 
         # Initialize some variables
         print("Computing pairwise distances...")
-        (n, d) = X.shape
-        sum_X = np.sum(np.square(X), 1)
-        D = np.add(np.add(-2 * np.dot(X, X.T), sum_X).T, sum_X)
-        P = np.zeros((n, n))
-        beta = np.ones((n, 1))
+        n = X.shape[0]
+        D, neighbors = self._neighbor_distances(X, n_neighbors)
+        beta = np.ones(n)
+        betamin = np.full(n, -np.inf)
+        betamax = np.full(n, np.inf)
         logU = np.log(perplexity)
 
-        # Loop over all datapoints
-        for i in range(n):
-
-            # Print progress
-            if i % 500 == 0:
-                print("Computing P-values for point %d of %d..." % (i, n))
-
-            # Compute the Gaussian kernel and entropy for the current precision
-            betamin = -np.inf
-            betamax = np.inf
-            Di = D[i, np.concatenate((np.r_[0:i], np.r_[i+1:n]))]
-            (H, thisP) = self.Hbeta(Di, beta[i])
-
-            # Evaluate whether the perplexity is within tolerance
+        # Compute the Gaussian kernel and entropy for the current precision
+        H, thisP = self.Hbeta(D, beta)
+        Hdiff = H - logU
+        tries = 0
+        active = np.abs(Hdiff) > tol
+        while active.any() and tries < max_tries:
+
+            # If not, increase or decrease precision
+            up = active & (Hdiff > 0)
+            betamin[up] = beta[up]
+            beta[up] = np.where(np.isinf(betamax[up]), beta[up] * 2.,
+                                (beta[up] + betamax[up]) / 2.)
+
+            down = active & (Hdiff <= 0)
+            betamax[down] = beta[down]
+            beta[down] = np.where(np.isinf(betamin[down]), beta[down] / 2.,
+                                  (beta[down] + betamin[down]) / 2.)
+
+            # Recompute the values of the rows not converged yet
+            H[active], thisP[active] = self.Hbeta(D[active], beta[active])
             Hdiff = H - logU
-            tries = 0
-            while np.abs(Hdiff) > tol and tries < 50:
-
-                # If not, increase or decrease precision
-                if Hdiff > 0:
-                    betamin = beta[i].copy()
-                    if betamax == np.inf or betamax == -np.inf:
-                        beta[i] = beta[i] * 2.
-                    else:
-                        beta[i] = (beta[i] + betamax) / 2.
-                else:
-                    betamax = beta[i].copy()
-                    if betamin == np.inf or betamin == -np.inf:
-                        beta[i] = beta[i] / 2.
-                    else:
-                        beta[i] = (beta[i] + betamin) / 2.
+            active = np.abs(Hdiff) > tol
+            tries += 1
 
-                # Recompute the values
-                (H, thisP) = self.Hbeta(Di, beta[i])
-                Hdiff = H - logU
-                tries += 1
+        print("Mean value of sigma: %f" % np.mean(np.sqrt(1 / beta)))
 
-            # Set the final row of P
-            P[i, np.concatenate((np.r_[0:i], np.r_[i+1:n]))] = thisP
+        if n_neighbors is None or n_neighbors >= n - 1:
+            P = np.zeros((n, n))
+            P[np.arange(n)[:, np.newaxis], neighbors] = thisP
+            return P
 
-        # Return final P-matrix
-        print("Mean value of sigma: %f" % np.mean(np.sqrt(1 / beta)))
-        return P
+        return sparse.csr_matrix((thisP.ravel(), neighbors.ravel(),
+                                  np.arange(n + 1) * neighbors.shape[1]), shape=(n, n))
 
     def pca(self, X=np.array([]), no_dims=50):
         """
@@ -132,7 +205,156 @@ class tSNE(object):
         Y = np.dot(X, M[:, 0:no_dims])
         return Y
 
-    def tsne(self, X=np.array([]), no_dims=2, initial_dims=50, perplexity=30.0):
+    def _gradient_exact(self, P, Y):
+        """The gradient and the Q matrix with the dense P matrix"""
+        n = Y.shape[0]
+
+        # Compute pairwise affinities
+        sum_Y = np.sum(np.square(Y), 1)
+        num = -2. * np.dot(Y, Y.T)
+        num = 1. / (1. + np.add(np.add(num, sum_Y).T, sum_Y))
+        num[range(n), range(n)] = 0.
+        Q = num / np.sum(num)
+        Q = np.maximum(Q, 1e-12)
+
+        # Compute gradient, sum_j (p_ij - q_ij) * num_ij * (y_i - y_j)
+        W = (P - Q) * num
+        dY = W.sum(axis=1)[:, np.newaxis] * Y - np.dot(W, Y)
+
+        return dY, Q
+
+    def _space_partition(self, Y, max_levels=12):
+        """Build the levels of a Barnes-Hut tree (quadtree for 2D) of
+        the embedding. Each level is a regular grid with twice as many
+        cells per axis as its parent, only the non-empty cells are kept.
+
+        Parameters
+        ----------
+        Y : np.ndarray, shape = [n, no_dims]
+            the embedding
+        max_levels : int, default = 12
+            the maximum depth of the tree
+
+        Returns
+        -------
+        levels : list of dict
+            for each level: width, the cell width; counts and centers, the
+            number of samples and their center of mass in each cell; cell,
+            the cell of each sample; ptr and children, the children cells
+            of each cell are children[ptr[c]:ptr[c+1]] in the next level
+        """
+        lower = Y.min(axis=0)
+        size = max(np.max(Y.max(axis=0) - lower), 1e-12) * (1. + 1e-9)
+
+        levels = []
+        for level in range(max_levels + 1):
+            n_cells = 2 ** level
+            grid = np.minimum(((Y - lower) / size * n_cells).astype(np.int64), n_cells - 1)
+            keys = np.ravel_multi_index(grid.T, (n_cells, ) * Y.shape[1])
+            keys, cell, counts = np.unique(keys, return_inverse=True, return_counts=True)
+            centers = np.stack([np.bincount(cell, Y[:, k]) for k in range(Y.shape[1])],
+                               axis=1) / counts[:, np.newaxis]
+
+            if level > 0:
+                # the children of the cells in the previous level
+                parents = levels[-1]["cell"][np.unique(cell, return_index=True)[1]]
+                levels[-1]["children"] = np.argsort(parents, kind="stable")
+                levels[-1]["ptr"] = np.concatenate(([0, ], np.cumsum(
+                    np.bincount(parents, minlength=levels[-1]["counts"].shape[0]))))
+
+            levels.append({"width": size / n_cells, "counts": counts,
+                           "centers": centers, "cell": cell.ravel()})
+            if counts.max() <= 1:
+                break
+
+        return levels
+
+    def _repulsive_forces(self, Y, theta=0.5, block=4096):
+        """Approximate the repulsive forces with the Barnes-Hut tree.
+        A cell is summarized by its center of mass if its width is smaller
+        than theta times its distance to the sample.
+
+        Parameters
+        ----------
+        Y : np.ndarray, shape = [n, no_dims]
+            the embedding
+        theta : float, default = 0.5
+            the accuracy of the approximation, 0 is exact
+        block : int, default = 4096
+            number of samples traversing the tree together
+
+        Returns
+        -------
+        F : np.ndarray, shape = [n, no_dims]
+            sum_j num_ij^2 * (y_i - y_j)
+        Z : float
+            sum_ij num_ij, num_ij = 1 / (1 + |y_i - y_j|^2)
+        """
+        n = Y.shape[0]
+        levels = self._space_partition(Y)
+        F = np.zeros(Y.shape)
+        z = np.zeros(n)
+
+        for begin in range(0, n, block):
+            points = np.arange(begin, min(begin + block, n))
+            n_points = points.shape[0]
+            cells = np.zeros(points.shape[0], dtype=np.int64)
+
+            for depth, level in enumerate(levels):
+                counts = level["counts"][cells].astype(np.float64)
+                centers = level["centers"][cells]
+
+                # exclude the sample itself from its own cell
+                own = level["cell"][points] == cells
+                centers[own] = (centers[own] * counts[own, np.newaxis] - Y[points[own]]) / \
+                    np.maximum(counts[own] - 1, 1)[:, np.newaxis]
+                counts[own] -= 1
+
+                diff = Y[points] - centers
+                d2 = np.sum(np.square(diff), axis=1)
+                accept = (level["width"] ** 2 < theta ** 2 * d2) | (counts <= 1) | \
+                    (depth == len(levels) - 1)
+
+                num = counts[accept] / (1. + d2[accept])
+                local = points[accept] - begin
+                z[begin:begin + n_points] += np.bincount(local, num, minlength=n_points)
+                qf = num / (1. + d2[accept])
+                for k in range(Y.shape[1]):
+                    F[begin:begin + n_points, k] += np.bincount(local, qf * diff[accept, k],
+                                                                minlength=n_points)
+
+                # open the other cells
+                points, cells = points[~accept], cells[~accept]
+                if points.shape[0] == 0:
+                    break
+                first, last = level["ptr"][cells], level["ptr"][cells + 1]
+                n_children = last - first
+                points = np.repeat(points, n_children)
+                offsets = np.arange(points.shape[0]) - np.repeat(np.cumsum(n_children) - n_children,
+                                                                 n_children)
+                cells = level["children"][np.repeat(first, n_children) + offsets]
+
+        return F, np.sum(z)
+
+    def _gradient_barnes_hut(self, P, Y, theta=0.5):
+        """The gradient with the sparse P matrix, and the Q values of the
+        non-zero entries of P"""
+        rows, cols, p = P.row, P.col, P.data
+
+        # attractive forces over the neighbor pairs
+        diff = Y[rows] - Y[cols]
+        num = 1. / (1. + np.sum(np.square(diff), axis=1))
+        w = p * num
+        attr = np.stack([np.bincount(rows, w * diff[:, k], minlength=Y.shape[0])
+                         for k in range(Y.shape[1])], axis=1)
+
+        rep, Z = self._repulsive_forces(Y, theta)
+        dY = attr - rep / Z
+
+        return dY, np.maximum(num / Z, 1e-12)
+
+    def tsne(self, X=np.array([]), no_dims=2, initial_dims=50, perplexity=30.0,
+             method="exact", n_neighbors=None, theta=0.5, max_iter=1000, random_state=None):
         """
         Runs t-SNE on the dataset in the NxD array X to reduce its
         dimensionality to no_dims dimensions. The syntaxis of the function is
@@ -140,13 +362,32 @@ class tSNE(object):
 
         Parameters
         ----------
-        X
-        no_dims
-        initial_dims
-        perplexity
+        X : np.ndarray, shape = [N, D]
+            the dataset
+        no_dims : int, default = 2
+            the number of dimensions of the embedding
+        initial_dims : int, default = 50
+            the dataset is reduced to initial_dims dimensions with PCA first
+        perplexity : float, default = 30.0
+            the perplexity of the conditional distributions
+        method : str, default = 'exact'
+            exact: dense P and Q, O(N^2) memory.
+            barnes_hut: sparse nearest-neighbor P and the Barnes-Hut
+            approximation of the repulsive forces, O(N * n_neighbors) memory.
+        n_neighbors : int, default = None
+            the number of nearest neighbors with method = barnes_hut,
+            default is 3 * perplexity
+        theta : float, default = 0.5
+            the accuracy of the Barnes-Hut approximation
+        max_iter : int, default = 1000
+            the number of iterations
+        random_state : int, default = None
+            the random seed of the initial embedding
 
         Returns
         -------
+        Y : np.ndarray, shape = [N, no_dims]
+            the embedding
 
         """
 
@@ -157,42 +398,46 @@ class tSNE(object):
         if round(no_dims) != no_dims:
             print("Error: number of dimensions should be an integer.")
             return -1
+        if method not in ["exact", "barnes_hut"]:
+            print("Error: method should be exact or barnes_hut.")
+            return -1
 
         # Initialize variables
         X = self.pca(X, initial_dims).real
         (n, d) = X.shape
-        max_iter = 1000
         initial_momentum = 0.5
         final_momentum = 0.8
         eta = 500
         min_gain = 0.01
-        Y = np.random.randn(n, no_dims)
+        Y = np.random.RandomState(random_state).randn(n, no_dims)
         dY = np.zeros((n, no_dims))
         iY = np.zeros((n, no_dims))
         gains = np.ones((n, no_dims))
 
         # Compute P-values
-        P = self.x2p(X, 1e-5, perplexity)
-        P = P + np.transpose(P)
-        P = P / np.sum(P)
-        P = P * 4. # early exaggeration
-        P = np.maximum(P, 1e-12)
+        if method == "barnes_hut":
+            if n_neighbors is None:
+                n_neighbors = int(3. * perplexity)
+            P = self.x2p(X, 1e-5, perplexity, n_neighbors=min(n_neighbors, n - 1))
+            P = (P + P.T).tocoo()
+            P.data = np.maximum(P.data / np.sum(P.data), 1e-12)
+        else:
+            P = self.x2p(X, 1e-5, perplexity)
+            P = P + np.transpose(P)
+            P = P / np.sum(P)
+            P = np.maximum(P, 1e-12)
+        exaggeration = 4.
 
         # Run iterations
         for iter in range(max_iter):
 
-            # Compute pairwise affinities
-            sum_Y = np.sum(np.square(Y), 1)
-            num = -2. * np.dot(Y, Y.T)
-            num = 1. / (1. + np.add(np.add(num, sum_Y).T, sum_Y))
-            num[range(n), range(n)] = 0.
-            Q = num / np.sum(num)
-            Q = np.maximum(Q, 1e-12)
-
-            # Compute gradient
-            PQ = P - Q
-            for i in range(n):
-                dY[i, :] = np.sum(np.tile(PQ[:, i] * num[:, i], (no_dims, 1)).T * (Y[i, :] - Y), 0)
+            # Compute gradient, early exaggeration in the first 100 iterations
+            if method == "barnes_hut":
+                P.data *= exaggeration
+                dY, Q = self._gradient_barnes_hut(P, Y, theta)
+                P.data /= exaggeration
+            else:
+                dY, Q = self._gradient_exact(P * exaggeration, Y)
 
             # Perform the update
             if iter < 20:
@@ -204,16 +449,20 @@ class tSNE(object):
             gains[gains < min_gain] = min_gain
             iY = momentum * iY - eta * (gains * dY)
             Y = Y + iY
-            Y = Y - np.tile(np.mean(Y, 0), (n, 1))
+            Y = Y - np.mean(Y, 0)
 
             # Compute current value of cost function
             if (iter + 1) % 10 == 0:
-                C = np.sum(P * np.log(P / Q))
+                if method == "barnes_hut":
+                    # the neighbor pairs only, the other P values are zero
+                    C = np.sum(P.data * exaggeration * np.log(P.data * exaggeration / Q))
+                else:
+                    C = np.sum(P * exaggeration * np.log(P * exaggeration / Q))
                 print("Iteration %d: error is %f" % (iter + 1, C))
 
             # Stop lying about P-values
             if iter == 100:
-                P = P / 4.
+                exaggeration = 1.
 
         # Return solution
         return Y
@@ -298,9 +547,42 @@ class Scaler(object):
                 self.object.fit(X)
             else:
                 self.object = MeanScaler()
-                self.object.scaler = np.zeros(X.shape)
+                self.object.scaler = np.zeros(np.asarray(X).shape[1])
                 self.object.scaled_ = True
 
+            self.scaled_ = True
+
+        return self
+
+    def partial_fit(self, X):
+        """Update the Scaler object with a chunk of the dataset, thus the
+        scaling parameters could be learned in a streaming pass.
+
+        Parameters
+        ----------
+        X : np.ndarry, pd.DataFrame, shape = [ N, M]
+            A chunk of the dataset. N is number of samples, M is the number of dimensions.
+
+        Returns
+        -------
+        self : the instance of self
+        """
+        if self.object is None:
+            if self.method == "minmax":
+                self.object = preprocessing.MinMaxScaler()
+            elif self.method == "zscore":
+                self.object = preprocessing.StandardScaler()
+            else:
+                self.object = MeanScaler()
+
+        if self.method in ["minmax", "zscore", "mean"]:
+            self.object.partial_fit(X)
+        else:
+            self.object.scaler = np.zeros(np.asarray(X).shape[1])
+            self.object.scaled_ = True
+
+        self.scaled_ = True
+
         return self
 
     def fit_transform(self, X):
@@ -342,6 +624,26 @@ class Scaler(object):
 
         return self.X_transformed_
 
+    def affine_params(self, n_dims):
+        """All the scaling methods are affine transformations, X * a + b.
+
+        Parameters
+        ----------
+        n_dims : int
+            the number of dimensions
+
+        Returns
+        -------
+        a : np.array, shape = [n_dims, ]
+            the scale of each dimension
+        b : np.array, shape = [n_dims, ]
+            the shift of each dimension
+        """
+        b = np.asarray(self.object.transform(np.zeros((1, n_dims))), dtype=np.float64)[0]
+        a = np.asarray(self.object.transform(np.ones((1, n_dims))), dtype=np.float64)[0] - b
+
+        return a, b
+
 
 class MeanScaler(Scaler):
     """Mean value scaler.
@@ -365,7 +667,22 @@ class MeanScaler(Scaler):
     def fit(self, X):
         #self.scaler = None
         if not self.scaled_:
-            self.scaler = X.mean(axis=0)
+            self.scaler = np.asarray(X.mean(axis=0))
+            self.scaled_ = True
+        return self
+
+    def partial_fit(self, X):
+        """Update the mean vector with a chunk of the dataset"""
+        X = np.asarray(X, dtype=np.float64)
+        if self.scaler is None:
+            self.n_samples_ = 0
+            self.sum_ = np.zeros(X.shape[1])
+
+        self.n_samples_ += X.shape[0]
+        self.sum_ += X.sum(axis=0)
+        self.scaler = self.sum_ / max(self.n_samples_, 1)
+        self.scaled_ = True
+
         return self
 
     def transform(self, X):
@@ -385,6 +702,16 @@ class PCA(object):
     ----------
     n_components: int, default is 20.
         number of remain dimensions after PCA analysis
+    scale_method : str, options=['mean', 'zscore', 'minmax', 'NA']
+        scale method for dataset X.
+    solver : str, default = 'auto', options=['auto', 'full', 'randomized', 'arpack']
+        the SVD solver. randomized (randomized SVD) and arpack (Lanczos)
+        only compute the first n_components, much faster for wide
+        datasets. With these two solvers, sparse matrices and
+        cmap.BinaryCmap objects are decomposed without densifying them,
+        see ImplicitPCA.
+    random_state : int, default = 0
+        the random seed of the randomized and arpack solvers
 
     Attributes
     ----------
@@ -460,9 +787,12 @@ class PCA(object):
     array([0.98719932, 0.01280068])
     """
 
-    def __init__(self, n_components=20, scale_method="mean"):
+    def __init__(self, n_components=20, scale_method="mean", solver="auto",
+                 random_state=0):
         self.n_components = n_components
         self.scale_method_ = scale_method
+        self.solver = solver
+        self.random_state = random_state
 
         self.trained_ = False
         self.X_transformed_ = None
@@ -476,13 +806,16 @@ class PCA(object):
         self.eigvalues_ratio_ = None
         self.eigvectors_ = None
 
+        self.model_ = None
+        self.metadata_ = {}
+
     def fit(self, X):
         """
         fit a pca object
 
         Parameters
         ----------
-        X: numpy ndarray, shape = [N, M]
+        X: numpy ndarray, or cmap.BinaryCmap, shape = [N, M]
             the input data matrix, N is the number of samples
             M is the number of dimensions
 
@@ -493,6 +826,15 @@ class PCA(object):
 
         """
 
+        if self.solver in ["randomized", "arpack"] and \
+                (sparse.issparse(X) or isinstance(X, cmap.BinaryCmap)):
+            return self._fit_sparse(X)
+
+        if isinstance(X, cmap.BinaryCmap):
+            X = X.toarray()
+        elif sparse.issparse(X):
+            X = X.toarray()
+
         if self.scaled_:
             Xs = X
         else:
@@ -508,7 +850,9 @@ class PCA(object):
         if self.n_components > self.X_scaled.shape[1]:
             self.n_components = self.X_scaled.shape[1]
 
-        pca_obj = decomposition.PCA(n_components=self.n_components)
+        pca_obj = decomposition.PCA(n_components=self.n_components,
+                                    svd_solver=self.solver,
+                                    random_state=self.random_state)
         self.pca_obj = pca_obj
         pca_obj.fit(Xs)
 
@@ -524,6 +868,29 @@ class PCA(object):
 
         return self
 
+    def _fit_sparse(self, X):
+        """Fit a sparse dataset with ImplicitPCA, the scaling is part of
+        the implicit operator."""
+        print("Perform PCA decompostion now ...... ")
+        pca_obj = ImplicitPCA(n_components=self.n_components,
+                              scale_method=self.scale_method_,
+                              solver=self.solver,
+                              random_state=self.random_state)
+        self.pca_obj = pca_obj
+        pca_obj.fit(X)
+        self.n_components = pca_obj.n_components
+        self.scaled_ = True
+
+        print("Transform dataset now ...... ")
+        self.X_transformed_ = pca_obj.transform(X)
+        self.trained_ = True
+
+        print("Obtain eigvalues and eigvectors ...... ")
+        self.eigvalues()
+        self.eigvectors()
+
+        return self
+
     def transform(self, X):
         """
 
@@ -545,6 +912,12 @@ class PCA(object):
             print("Your pca object is not trained yet. Training it now ...")
             self.fit(X)
 
+        if isinstance(self.pca_obj, ImplicitPCA):
+            return self.pca_obj.transform(X)
+
+        if isinstance(X, cmap.BinaryCmap):
+            X = X.toarray()
+
         return self.pca_obj.transform(X)
 
     def fit_transform(self, X):
@@ -567,6 +940,131 @@ class PCA(object):
         self.X_transformed_ = self.transform(X)
         return self.X_transformed_
 
+    def _center(self):
+        """The mean of the scaled dataset"""
+        return self.pca_obj.mean_
+
+    def model_params(self):
+        """The fitted model as arrays. The dataset X is projected as
+        (X * scale_a + scale_b - center) dot components.T
+
+        Returns
+        -------
+        params : dict
+            scale_a, scale_b, center : np.array, shape = [M, ]
+            components : np.ndarray, shape = [n_components, M]
+        """
+        if self.model_ is not None:
+            return self.model_
+
+        if not self.trained_:
+            print("Your pca object is not trained yet. ")
+            return None
+
+        n_dims = self.eigvectors_.shape[1]
+        if isinstance(self.pca_obj, ImplicitPCA):
+            a = self.pca_obj.scale_
+            b = np.zeros(n_dims)
+            center = self.pca_obj.mean_ * a
+        else:
+            a, b = self.scaler_.affine_params(n_dims)
+            center = np.asarray(self._center(), dtype=np.float64)
+
+        return {"scale_a": a, "scale_b": b, "center": center,
+                "components": np.asarray(self.eigvectors_, dtype=np.float64)}
+
+    def project(self, X):
+        """Scale and project a new dataset with the fitted (or loaded)
+        model, the dataset could be sparse.
+
+        Parameters
+        ----------
+        X: np.ndarray, scipy.sparse matrix, or cmap.BinaryCmap, shape = [ N, M]
+            the input dataset, N is number of samples,
+            M is number of dimensions
+
+        Returns
+        -------
+        X_transformed: np.ndarray, shape = [ N, n_components]
+            the transformed dataset
+        """
+        params = self.model_params()
+
+        if isinstance(X, cmap.BinaryCmap):
+            X = X.tocsr()
+        elif not sparse.issparse(X):
+            X = np.asarray(X, dtype=np.float64)
+
+        V = params["components"].T
+        offset = np.dot(params["scale_b"] - params["center"], V)
+
+        return X.dot(V * params["scale_a"][:, np.newaxis]) + offset
+
+    def save(self, fname, metadata=None):
+        """Save the fitted model, eigvalues and metadata to a compressed
+        .npz file
+
+        Parameters
+        ----------
+        fname : str
+            the output file name
+        metadata : dict, default = None
+            the information about the features, for example the
+            atom selections. Array-like values are stored as arrays,
+            the others are stored as a json string.
+
+        Returns
+        -------
+        self : the instance itself
+        """
+        metadata = dict(self.metadata_, **(metadata or {}))
+
+        arrays = dict(self.model_params())
+        info = {}
+        for key, value in metadata.items():
+            if isinstance(value, (np.ndarray, list, tuple)):
+                arrays["meta_" + key] = np.asarray(value)
+            else:
+                info[key] = value
+
+        np.savez_compressed(fname, eigvalues=self.eigvalues_,
+                            eigvalues_ratio=self.eigvalues_ratio_,
+                            metadata=json.dumps(info), **arrays)
+
+        return self
+
+    @classmethod
+    def load(cls, fname):
+        """Load a model saved by PCA.save
+
+        Parameters
+        ----------
+        fname : str
+            the model file name
+
+        Returns
+        -------
+        pca : PCA
+            a trained PCA object, use project() to transform new datasets
+        """
+        dat = np.load(fname)
+
+        pca = cls(n_components=dat["components"].shape[0])
+        pca.model_ = {x: dat[x] for x in ["scale_a", "scale_b", "center", "components"]}
+        pca.eigvalues_ = dat["eigvalues"]
+        pca.eigvalues_ratio_ = dat["eigvalues_ratio"]
+        pca.eigvectors_ = dat["components"]
+
+        pca.metadata_ = json.loads(str(dat["metadata"]))
+        for key in dat.files:
+            if key.startswith("meta_"):
+                pca.metadata_[key[5:]] = dat[key]
+
+        pca.scaled_ = True
+        pca.trained_ = True
+
+        return pca
+
     def eigvalues(self):
         """
         Eigen values, the variance of the eigenvectors
@@ -603,6 +1101,490 @@ class PCA(object):
         return self
 
 
+class ImplicitPCA(object):
+    """
+    Truncated PCA of a sparse dataset, the dataset is never densified.
+
+    The centered and scaled dataset (X - mean) * a is represented by a
+    scipy LinearOperator, where a is the column scale of the scaling
+    method, then its first singular vectors are computed with a
+    randomized SVD or with the Lanczos method (ARPACK). Only products of
+    the sparse matrix with thin dense matrices are needed.
+
+    Parameters
+    ----------
+    n_components: int, default is 20.
+        number of remain dimensions after PCA analysis
+    scale_method : str, options=['mean', 'zscore', 'minmax', 'NA']
+        scale method for dataset X. The centering is always applied.
+    solver : str, default = 'randomized', options=['randomized', 'arpack']
+        the truncated SVD solver
+    random_state : int, default = 0
+        the random seed
+    n_iter : int, default = 7
+        number of power iterations of the randomized solver
+    n_oversamples : int, default = 10
+        number of additional random vectors of the randomized solver
+
+    Attributes
+    ----------
+    mean_ : np.array, shape = [M, ]
+        the column means of X
+    scale_ : np.array, shape = [M, ]
+        the column scales applied after centering
+    components_ : np.ndarray, shape = [n_components, M]
+        the eigenvectors
+    explained_variance_ : np.array, shape = [n_components, ]
+        the eigvalues
+    explained_variance_ratio_ : np.array, shape = [n_components, ]
+        the percentage ratio of the eigvalues
+    singular_values_ : np.array, shape = [n_components, ]
+        the singular values
+
+    See Also
+    --------
+    PCA
+
+    """
+
+    def __init__(self, n_components=20, scale_method="mean", solver="randomized",
+                 random_state=0, n_iter=7, n_oversamples=10):
+        self.n_components = n_components
+        self.scale_method = scale_method
+        self.solver = solver
+        self.random_state = random_state
+        self.n_iter = n_iter
+        self.n_oversamples = n_oversamples
+
+        self.mean_ = None
+        self.scale_ = None
+        self.components_ = None
+        self.explained_variance_ = None
+        self.explained_variance_ratio_ = None
+        self.singular_values_ = None
+
+    def _check_input(self, X):
+        if isinstance(X, cmap.BinaryCmap):
+            X = X.tocsr()
+        return sparse.csr_matrix(X, dtype=np.float64)
+
+    def _column_scales(self, X):
+        """The column means, variances (ddof=0) and scales of X"""
+        n = X.shape[0]
+        mean = np.asarray(X.sum(axis=0)).ravel() / n
+        var = np.asarray(X.multiply(X).sum(axis=0)).ravel() / n - np.square(mean)
+        var = np.maximum(var, 0.0)
+
+        if self.scale_method == "zscore":
+            scale = np.sqrt(var)
+        elif self.scale_method == "minmax":
+            scale = np.asarray(X.max(axis=0).todense()).ravel() - \
+                    np.asarray(X.min(axis=0).todense()).ravel()
+        else:
+            scale = np.ones(mean.shape[0])
+        scale[scale == 0] = 1.0
+
+        return mean, var, 1.0 / scale
+
+    def _operator(self, X):
+        """The LinearOperator of (X - mean) * scale"""
+        mean, scale = self.mean_, self.scale_
+        ones = np.ones(X.shape[0])
+
+        def matmat(V):
+            V = V * scale[:, np.newaxis]
+            return X.dot(V) - np.outer(ones, mean.dot(V))
+
+        def rmatmat(U):
+            return (X.T.dot(U) - np.outer(mean, ones.dot(U))) * scale[:, np.newaxis]
+
+        return splinalg.LinearOperator(
+            X.shape, dtype=np.float64,
+            matvec=lambda v: matmat(v.reshape((-1, 1))).ravel(),
+            rmatvec=lambda u: rmatmat(u.reshape((-1, 1))).ravel(),
+            matmat=matmat, rmatmat=rmatmat)
+
+    def _randomized_svd(self, A, k):
+        """Randomized SVD (Halko et al. 2011) with power iterations"""
+        rng = np.random.RandomState(self.random_state)
+        n_random = min(k + self.n_oversamples, min(A.shape))
+
+        Q = A.matmat(rng.normal(size=(A.shape[1], n_random)))
+        for i in range(self.n_iter):
+            Q, _ = np.linalg.qr(Q)
+            Q, _ = np.linalg.qr(A.rmatmat(Q))
+            Q = A.matmat(Q)
+        Q, _ = np.linalg.qr(Q)
+
+        B = A.rmatmat(Q).T
+        u, s, vt = np.linalg.svd(B, full_matrices=False)
+
+        return s[:k], vt[:k]
+
+    def _arpack_svd(self, A, k):
+        """Truncated SVD with the Lanczos method"""
+        rng = np.random.RandomState(self.random_state)
+        v0 = rng.uniform(-1, 1, size=min(A.shape))
+        u, s, vt = splinalg.svds(A, k=k, v0=v0)
+        order = np.argsort(s)[::-1]
+
+        return s[order], vt[order]
+
+    def fit(self, X):
+        """Fit the truncated PCA
+
+        Parameters
+        ----------
+        X : scipy.sparse matrix, cmap.BinaryCmap, or np.ndarray, shape = [N, M]
+            the input dataset, N is number of samples,
+            M is number of dimensions
+
+        Returns
+        -------
+        self : the instance itself
+        """
+        X = self._check_input(X)
+        n_samples = X.shape[0]
+
+        mean, var, scale = self._column_scales(X)
+        self.mean_, self.scale_ = mean, scale
+
+        # arpack needs k < min(N, M)
+        max_k = min(X.shape) - 1 if self.solver == "arpack" else min(X.shape)
+        self.n_components = min(self.n_components, max_k)
+
+        A = self._operator(X)
+        if self.solver == "arpack":
+            s, vt = self._arpack_svd(A, self.n_components)
+        else:
+            s, vt = self._randomized_svd(A, self.n_components)
+
+        # the same sign convention as sklearn
+        max_abs = np.argmax(np.abs(vt), axis=1)
+        signs = np.sign(vt[np.arange(vt.shape[0]), max_abs])
+        signs[signs == 0] = 1.0
+        vt *= signs[:, np.newaxis]
+
+        total_var = np.sum(var * np.square(scale)) * n_samples / max(n_samples - 1, 1)
+
+        self.components_ = vt
+        self.singular_values_ = s
+        self.explained_variance_ = np.square(s) / max(n_samples - 1, 1)
+        self.explained_variance_ratio_ = self.explained_variance_ / total_var \
+            if total_var > 0 else np.zeros(s.shape[0])
+
+        return self
+
+    def transform(self, X):
+        """Project a dataset to the eigenvectors
+
+        Parameters
+        ----------
+        X : scipy.sparse matrix, cmap.BinaryCmap, or np.ndarray, shape = [N, M]
+            the input dataset
+
+        Returns
+        -------
+        X_transformed : np.ndarray, shape = [N, n_components]
+        """
+        X = self._check_input(X)
+        V = self.components_.T * self.scale_[:, np.newaxis]
+
+        return X.dot(V) - self.mean_.dot(V)
+
+
+class StreamingPCA(PCA):
+    """
+    PCA fitted on a dataset arriving in chunks, thus the whole
+    dataset is never loaded into memory.
+
+    The scaling parameters, the mean and the sums of cross products of
+    the dataset are accumulated in a single pass over the chunks. The
+    cross products are summed in place into one M * M buffer (upper
+    triangle, BLAS syrk), and the first n_components eigenvectors of the
+    covariance matrix of the scaled dataset are computed with the
+    Lanczos method (ARPACK) from matrix-vector products with the buffer,
+    the covariance matrix itself is never formed. While the samples are
+    fewer than half of the dimensions (2N < M), the shifted samples are
+    kept instead, which take less memory than the buffer, and the
+    eigenvectors are obtained from the N * N Gram matrix. The results
+    are the same as the PCA class (full solver), up to round-off errors.
+
+    Parameters
+    ----------
+    n_components: int, default is 20.
+        number of remain dimensions after PCA analysis
+    scale_method : str, options=['mean', 'zscore', 'minmax', 'NA']
+        scale method for dataset X.
+    solver : str, default = 'auto', options=['auto', 'full', 'arpack']
+        the eigen solver. full diagonalizes the whole matrix, arpack
+        only computes the first n_components. auto uses arpack for
+        matrices larger than 500 when n_components < 80% of the size.
+    random_state : int, default = 0
+        the random seed of the arpack solver
+
+    Attributes
+    ----------
+    n_samples_ : int
+        number of samples used for fitting
+    mean_ : np.array, shape = [M, ]
+        the mean of the scaled dataset
+    covariance_ : np.ndarray, shape = [M, M]
+        the covariance matrix of the scaled dataset, it is built on
+        request and takes M * M memory
+    eigvalues_: numpy array,
+        the eigvalues of the new axis
+    eigvalues_ratio_: numpy array,
+        the percentage ratio of the new axis variances
+    eigvectors_: numpy ndarray, shape = [n_components, M]
+        the eigenvectors
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> from mdanaly import pca
+    >>> x = np.random.rand(1000, 10)
+    >>> spca = pca.StreamingPCA(n_components=2, scale_method='zscore')
+    >>> for i in range(0, 1000, 100):
+    ...     spca.partial_fit(x[i:i+100])
+    >>> spca.finalize()
+    >>> X_transformed = spca.transform(x)
+
+    See Also
+    --------
+    PCA
+
+    """
+
+    def __init__(self, n_components=20, scale_method="mean", solver="auto",
+                 random_state=0):
+        PCA.__init__(self, n_components=n_components, scale_method=scale_method,
+                     solver=solver, random_state=random_state)
+
+        self.n_samples_ = 0
+        self.mean_ = None
+
+        self._shift = None
+        self._sum = None
+        self._sum_sq = None
+        self._samples = []
+
+    def _add_cross_products(self, Xc):
+        # _sum_sq += Xc.T * Xc, upper triangle only, without temporaries
+        self._sum_sq = blas.dsyrk(1.0, Xc.T, beta=1.0, c=self._sum_sq,
+                                  trans=0, lower=0, overwrite_c=1)
+
+    def partial_fit(self, X):
+        """Update the scaler, the sums and the sums of cross products
+        with a chunk of the dataset
+
+        Parameters
+        ----------
+        X: np.ndarray, pd.DataFrame, shape = [N, M]
+            a chunk of the dataset, N is the number of samples
+            M is the number of dimensions
+
+        Returns
+        -------
+        self : the instance itself
+        """
+        X = np.asarray(X, dtype=np.float64)
+        n_dims = X.shape[1]
+
+        if self.scaler_ is None:
+            self.scaler_ = Scaler(method=self.scale_method_)
+        self.scaler_.partial_fit(X)
+
+        if self._shift is None:
+            # shift the data to reduce the round-off errors of the
+            # sums of cross products
+            self._shift = X.mean(axis=0)
+            self._sum = np.zeros(n_dims)
+
+        Xc = np.ascontiguousarray(X - self._shift)
+        self._sum += Xc.sum(axis=0)
+        self.n_samples_ += X.shape[0]
+
+        if self._sum_sq is not None:
+            self._add_cross_products(Xc)
+        else:
+            self._samples.append(Xc)
+            if 2 * self.n_samples_ >= n_dims:
+                # the samples take more than half of the buffer memory now
+                self._sum_sq = np.zeros((n_dims, n_dims), order="F")
+                while len(self._samples):
+                    self._add_cross_products(self._samples.pop(0))
+
+        self.trained_ = False
+
+        return self
+
+    def _scaled_moments(self):
+        """The mean of the shifted dataset and the scales"""
+        mean = self._sum / self.n_samples_
+        a, b = self.scaler_.affine_params(mean.shape[0])
+
+        return mean, a, b
+
+    def _scaled_samples(self):
+        """The centered and scaled samples kept while 2N < M"""
+        if len(self._samples) > 1:
+            self._samples = [np.concatenate(self._samples), ]
+        mean, a, b = self._scaled_moments()
+
+        return (self._samples[0] - mean) * a
+
+    @property
+    def covariance_(self):
+        """The covariance matrix of the scaled dataset, shape = [M, M]"""
+        if self._sum is None:
+            return None
+
+        n = self.n_samples_
+        if self._sum_sq is None:
+            Z = self._scaled_samples()
+            return np.dot(Z.T, Z) / max(n - 1, 1)
+
+        mean, a, b = self._scaled_moments()
+        cov = np.array(self._sum_sq, order="F")
+        for j in range(cov.shape[0]):
+            cov[j + 1:, j] = cov[j, j + 1:]
+            cov[:, j] -= n * mean * mean[j]
+            cov[:, j] *= a * (a[j] / max(n - 1, 1))
+
+        return cov
+
+    def _eigen(self, dim, matvec, matrix):
+        """The largest n_components eigenpairs of a symmetric matrix of
+        size dim, given as a matrix-vector product function or built
+        by the matrix function"""
+        k = min(self.n_components, dim)
+        if self.solver == "auto":
+            arpack = dim > 500 and k < 0.8 * dim
+        else:
+            arpack = self.solver != "full"
+
+        if arpack and k < dim:
+            rng = np.random.RandomState(self.random_state)
+            operator = splinalg.LinearOperator((dim, dim), matvec=matvec,
+                                               dtype=np.float64)
+            eigvals, eigvects = splinalg.eigsh(operator, k=k, which="LA",
+                                               v0=rng.uniform(-1, 1, size=dim))
+        else:
+            eigvals, eigvects = np.linalg.eigh(matrix())
+
+        order = np.argsort(eigvals)[::-1][:k]
+
+        return eigvals[order], eigvects[:, order]
+
+    def finalize(self):
+        """Compute the first eigenvectors of the covariance matrix
+        of the scaled dataset
+
+        Returns
+        -------
+        self : the instance itself
+        """
+        n = self.n_samples_
+        mean, a, b = self._scaled_moments()
+        n_dims = mean.shape[0]
+
+        self.mean_ = (mean + self._shift) * a + b
+        self.scaled_ = True
+
+        print("Perform PCA decompostion now ...... ")
+        if self.n_components > n_dims:
+            self.n_components = n_dims
+
+        if self._sum_sq is None:
+            # 2N < M, the covariance matrix Z.T * Z / (n - 1) and the
+            # Gram matrix Z * Z.T / (n - 1) share the non-zero eigenvalues
+            Z = self._scaled_samples()
+
+            def matvec(v):
+                return np.dot(Z, np.dot(np.ravel(v), Z)) / max(n - 1, 1)
+
+            eigvals, eigvects = self._eigen(n, matvec,
+                                            lambda: np.dot(Z, Z.T) / max(n - 1, 1))
+            components = np.dot(eigvects.T, Z)
+            norms = np.sqrt(np.sum(np.square(components), axis=1))
+            norms[norms == 0] = 1.0
+            components /= norms[:, np.newaxis]
+            total_var = np.einsum("ij,ij->", Z, Z) / max(n - 1, 1)
+        else:
+            S = self._sum_sq
+
+            def matvec(v):
+                v = np.ravel(v) * a
+                w = blas.dsymv(1.0, S, v, lower=0) - n * mean * np.dot(mean, v)
+                return w * a / max(n - 1, 1)
+
+            eigvals, eigvects = self._eigen(n_dims, matvec, lambda: self.covariance_)
+            components = eigvects.T
+            total_var = np.sum(np.square(a) * (np.diagonal(S) - n * np.square(mean))) \
+                / max(n - 1, 1)
+
+        # the same sign convention as sklearn
+        max_abs = np.argmax(np.abs(components), axis=1)
+        signs = np.sign(components[np.arange(components.shape[0]), max_abs])
+        signs[signs == 0] = 1.0
+        components *= signs[:, np.newaxis]
+
+        self.eigvalues_ = np.maximum(eigvals, 0.0)
+        self.eigvalues_ratio_ = self.eigvalues_ / total_var if total_var > 0 \
+            else np.zeros(self.eigvalues_.shape[0])
+        self.eigvectors_ = components
+        self.trained_ = True
+
+        return self
+
+    def fit(self, X):
+        """Fit with a dataset in memory, see partial_fit for chunks
+
+        Parameters
+        ----------
+        X: numpy ndarray, shape = [N, M]
+            the input data matrix, N is the number of samples
+            M is the number of dimensions
+
+        Returns
+        -------
+        self : the instance itself
+        """
+        self.partial_fit(X)
+        self.finalize()
+        self.X_transformed_ = self.transform(X)
+
+        return self
+
+    def transform(self, X):
+        """Project a dataset (or a chunk of it) to the eigenvectors
+
+        Parameters
+        ----------
+        X: np.ndarray, shape = [ N, M]
+            the input dataset, N is number of samples,
+            M is number of dimensions
+
+        Returns
+        -------
+        X_transformed: np.ndarray, shape = [ N, n_components]
+            the transformed dataset
+        """
+        if isinstance(X, cmap.BinaryCmap):
+            X = X.toarray()
+
+        if not self.trained_:
+            self.finalize()
+
+        Xs = self.scaler_.transform(np.asarray(X, dtype=np.float64))
+
+        return np.dot(Xs - self.mean_, self.eigvectors_.T)
+
+    def _center(self):
+        return self.mean_
+
+
 def datset_subset(dat, begin, end):
     """
     Subset a dataset given the index range
@@ -630,12 +1612,38 @@ def datset_subset(dat, begin, end):
         X = pd.DataFrame(dat)
 
     # slice the dataset
+    X = X[subset_mask(X.index, begin, end)]
+
+    return X
+
+
+def subset_mask(index, begin, end):
+    """
+    The rows of a dataset within the index range
+
+    Parameters
+    ----------
+    index: np.array, or pd.Index
+        the index (time) of the rows
+    begin: int,
+        the beginning index
+    end:
+        the ending index
+
+    Returns
+    -------
+    mask: np.array, dtype = bool
+        whether each row is in the range
+    """
+    index = np.asarray(index)
+    mask = np.ones(index.shape[0], dtype=bool)
+
     if begin > 0:
-        X = X[X.index >= begin]
+        mask &= index >= begin
     if end > 0 and end > begin:
-        X = X[X.index <= end]
+        mask &= index <= end
 
-    return X
+    return mask
 
 
 def iterload_xyz_coordinates(xtcfile, top, chunk, stride, atom_selection="name CA"):
@@ -667,20 +1675,58 @@ def iterload_xyz_coordinates(xtcfile, top, chunk, stride, atom_selection="name C
 
     trajs = gmxcli.read_xtc(xtc=xtcfile, top=top, chunk=chunk, stride=stride)
 
-    xyz = np.array([])
+    xyz = ArrayAccumulator(n_rows=trajs.n_frames_)
 
-    for i, traj in enumerate(trajs):
+    for index, dat in iter_xyz_chunks(trajs, top, atom_selection):
+        xyz.append(dat)
 
-        copca = cmap.CoordinatesXYZ(traj, top, atom_selection)
+    xyz = pd.DataFrame(xyz.values())
 
-        if i == 0:
-            xyz = copca.xyz_coordinates()
-        else:
-            xyz = np.concatenate((xyz, copca.xyz_coordinates()), axis=0)
+    return xyz
 
-    xyz = pd.DataFrame(xyz)
 
-    return xyz
+def iter_xyz_chunks(trajs, top, atom_selection="name CA", dt=1.0, begin=0, end=0):
+    """
+    Extract the atom xyz coordinates of the trajectory chunks one by one.
+
+    Parameters
+    ----------
+    trajs: iterable of mt.Trajectory objects
+        the trajectory chunks, for example from gmxcli.read_xtc
+    top: str, format pdb
+        the reference pdb file
+    atom_selection: str,
+        the atom selection language
+    dt: float, default = 1.0
+        the time step between two frames
+    begin: float, default = 0
+        the beginning time, see subset_mask
+    end: float, default = 0
+        the ending time, see subset_mask
+
+    Yields
+    ------
+    index: np.array, shape = [N, ]
+        the time of the frames in the chunk
+    xyz: np.ndarray, shape = [N, M]
+        the xyz coordinates of the chunk, M is n_atoms * 3
+
+    """
+
+    # the reference structure is loaded once for all the chunks
+    context = cmap.SuperposeContext(top, atom_selection)
+
+    n_frames = 0
+    for traj in trajs:
+
+        xyz = context.xyz_coordinates(traj)
+
+        index = (n_frames + np.arange(xyz.shape[0])) * dt
+        n_frames += xyz.shape[0]
+
+        mask = subset_mask(index, begin, end)
+        if mask.any():
+            yield index[mask], xyz[mask]
 
 
 def write_results(X_transformed, variance_ratio, X_out, variance_out,
@@ -716,12 +1762,7 @@ def write_results(X_transformed, variance_ratio, X_out, variance_out,
 
     """
     # save the data into a file
-    dat = pd.DataFrame(X_transformed)
-    dat.index = col_index
-    #dat.index = np.arange(X_transformed.shape[0]) * dt
-    dat.columns = ["PC_%d" % x for x in np.arange(X_transformed.shape[1])]
-    dat.to_csv(X_out, sep=",", header=True, index=True,
-               index_label="time(ps)", float_format="%.3f")
+    write_transformed(X_transformed, X_out, col_index)
 
     # save variance ratio into a file
     variance = list(variance_ratio)
@@ -739,6 +1780,31 @@ def write_results(X_transformed, variance_ratio, X_out, variance_out,
     return None
 
 
+def write_transformed(X_transformed, X_out, col_index):
+    """Write the transformed dataset into a csv file
+
+    Parameters
+    ----------
+    X_transformed: np.ndarray, shape = [ N_samples, N_components]
+        the transformed X dataset
+    X_out: str
+        the transformed dataset output file name
+    col_index : np.array, shape = [ N_samples, 1]
+        the index label (time) for output file
+
+    Returns
+    -------
+
+    """
+    dat = pd.DataFrame(X_transformed)
+    dat.index = col_index
+    dat.columns = ["PC_%d" % x for x in np.arange(X_transformed.shape[1])]
+    dat.to_csv(X_out, sep=",", header=True, index=True,
+               index_label="time(ps)", float_format="%.3f")
+
+    return None
+
+
 def load_dataset(fn, skip_index=True, sep=","):
     """
     Load a dataset file.
@@ -746,7 +1812,8 @@ def load_dataset(fn, skip_index=True, sep=","):
     Parameters
     ----------
     fn : str
-        input dataset file name, a csv comma separated file
+        input dataset file name, a csv comma separated file, or a
+        binary contact map .npz file written by gmx_cmap.py
     skip_index : bool, default = True
         whether skip the first col and using it as index
     sep : str, default = ","
@@ -759,6 +1826,10 @@ def load_dataset(fn, skip_index=True, sep=","):
 
     """
 
+    if fn.endswith(".npz"):
+        cm = cmap.BinaryCmap.load(fn)
+        return pd.DataFrame(cm.toarray(), index=cm.index_)
+
     # load dataset, assign the index information
     if skip_index:
         X = pd.read_csv(fn, sep=sep, header=0, index_col=0)
@@ -769,7 +1840,8 @@ def load_dataset(fn, skip_index=True, sep=","):
 
 
 def run_pca(dat, proj=10, output="transformed.csv", var_ratio_out="variance_explained.dat",
-            eigenvector_out="", scale="mean"):
+            eigenvector_out="", scale="mean", solver="auto", random_state=0, index=None,
+            model_out="", metadata=None):
     """Perform PCA calculation given a clean dataset file.
     The dataset could be xyz coordinates, general CV values, angles, dihedral angles,
     contact map, distance matrix, or any other well-formated time-series datasets.
@@ -792,16 +1864,34 @@ def run_pca(dat, proj=10, output="transformed.csv", var_ratio_out="variance_expl
         zscore : the StandardScaler, substract by its means then divided by its stds
         minmax : the MinMaxScaler, substract by its mins then divided by its ranges
         NA : do not perform scaling or normalization before PCA
+    solver : str, default = 'auto'
+        the SVD solver, options: auto, full, randomized, arpack
+    random_state : int, default = 0
+        the random seed of the randomized and arpack solvers
+    index : np.array, default = None
+        the labels of the samples, if dat has no index (sparse matrix)
+    model_out : str, default = ""
+        the output file name of the fitted model, see PCA.save
+    metadata : dict, default = None
+        the information about the features saved with the model
 
     Returns
     -------
 
     """
 
-    index_col = dat.index
+    if index is not None:
+        index_col = index
+    elif isinstance(dat, cmap.BinaryCmap):
+        index_col = dat.index_
+    elif hasattr(dat, "index"):
+        index_col = dat.index
+    else:
+        index_col = np.arange(dat.shape[0])
 
     # calculate PCA
-    pca = PCA(n_components=proj, scale_method=scale)
+    pca = PCA(n_components=proj, scale_method=scale, solver=solver,
+              random_state=random_state)
     pca.fit(dat)
 
     # get transformed dataset
@@ -813,6 +1903,78 @@ def run_pca(dat, proj=10, output="transformed.csv", var_ratio_out="variance_expl
     write_results(X_transformed=X_transformed, variance_ratio=variance_ratio,
                   X_out=output, variance_out=var_ratio_out, col_index=index_col,
                   eigenvector=eigenvectors, eigvector_out=eigenvector_out)
+
+    if len(model_out):
+        pca.save(model_out, metadata)
+
+    return None
+
+
+def run_pca_streaming(chunks, proj=10, output="transformed.csv",
+                      var_ratio_out="variance_explained.dat", eigenvector_out="",
+                      scale="mean", model_out="", metadata=None, solver="auto",
+                      random_state=0):
+    """Perform PCA calculation with a dataset arriving in chunks, the
+    outputs are the same as run_pca.
+
+    Parameters
+    ----------
+    chunks : callable
+        chunks() returns an iterable of (index, X) tuples, index is
+        the labels (time) of the samples and X is np.ndarray, shape = [N, M].
+        It is called twice, the first pass fits the PCA and the second
+        pass transforms the dataset.
+    proj : int, default = 10
+        number of projections to output
+    output : str,
+        the transformed or projected dataset output file name, format is csv
+    var_ratio_out : str,
+        the variance explained ratio of the eigvalues output file name
+    eigenvector_out : str, default = ""
+        the eigenvector output file name
+    scale : str, default = 'mean'
+        the scaling method used to normalize X before PCA, see run_pca
+    model_out : str, default = ""
+        the output file name of the fitted model, see PCA.save
+    metadata : dict, default = None
+        the information about the features saved with the model
+    solver : str, default = 'auto'
+        the eigen solver, see StreamingPCA
+    random_state : int, default = 0
+        the random seed of the arpack solver
+
+    Returns
+    -------
+
+    See Also
+    --------
+    run_pca, StreamingPCA
+
+    """
+
+    pca = StreamingPCA(n_components=proj, scale_method=scale, solver=solver,
+                       random_state=random_state)
+
+    print("Fitting PCA with the dataset chunks ...... ")
+    for index, X in chunks():
+        pca.partial_fit(X)
+    pca.finalize()
+
+    print("Transform dataset now ...... ")
+    X_transformed = ArrayAccumulator()
+    index_col = ArrayAccumulator()
+    for index, X in chunks():
+        X_transformed.append(pca.transform(X))
+        index_col.append(np.asarray(index))
+
+    # write result
+    write_results(X_transformed=X_transformed.values(), variance_ratio=pca.eigvalues_ratio_,
+                  X_out=output, variance_out=var_ratio_out, col_index=index_col.values(),
+                  eigenvector=pca.eigvectors_, eigvector_out=eigenvector_out)
+
+    if len(model_out):
+        pca.save(model_out, metadata)
+
     return None
 
 
@@ -826,10 +1988,11 @@ def gen_cmap(args):
 
     Returns
     -------
-    cmap_dat: pd.DataFrame, shape = [ N, M]
+    cmap_dat: pd.DataFrame, or cmap.BinaryCmap, shape = [ N, M]
         the contactmap along the time. N is number of frames,
         M is N_res * N_res (N_res is number of residues for cmap
-        calculations. )
+        calculations. ) A BinaryCmap is returned if args.storage
+        is packed or sparse.
 
     """
 
@@ -850,28 +2013,41 @@ def gen_cmap(args):
     print("Iterloading xtc trajectory file ...... ")
     trajs = gmxcli.read_xtc(xtc=args.f, top=args.s, chunk=1000, stride=int(args.dt/args.ps))
 
-    cmap_dat = np.array([])
+    storage = getattr(args, "storage", "dense")
+    if storage != "dense" and not args.switch:
+        cmap_dat = cmap.BinaryCmap(atom_grp_a.shape[0] * atom_grp_b.shape[0], storage=storage)
+    else:
+        storage = "dense"
+        cmap_dat = ArrayAccumulator(n_rows=trajs.n_frames_)
+
     print("Computing contactmap ...... ")
     for i, traj in enumerate(trajs):
         contmap = cmap.ContactMap(traj=traj, group_a=atom_grp_a, group_b=atom_grp_b, cutoff=args.cutoff)
-        contmap.generate_cmap(shape="array", switch=args.switch)
-        if i == 0:
-            cmap_dat = contmap.cmap_
+        if storage != "dense":
+            cmap_dat.append(contmap.binary_cmap(storage=storage))
         else:
-            cmap_dat = np.concatenate((cmap_dat, contmap.cmap_), axis=0)
+            contmap.generate_cmap(shape="array", switch=args.switch)
+            cmap_dat.append(contmap.cmap_)
+
+    if storage != "dense":
+        cmap_dat.index_ = np.arange(cmap_dat.n_frames_) * args.dt
+        return cmap_dat
 
-    cmap_dat = pd.DataFrame(cmap_dat)
+    cmap_dat = pd.DataFrame(cmap_dat.values())
 
     return cmap_dat
 
 
-def gen_dihedrals(args):
+def gen_dihedrals(args, elements=None):
     """General dihedral angles from gromacs xtc file
 
     Parameters
     ----------
     args : argparse object,
         the arguments options
+    elements : np.ndarray, shape = [N, 4], default = None
+        the atom indices of the dihedral angles, if None, they
+        are read from the index file args.n
 
     Returns
     -------
@@ -881,25 +2057,23 @@ def gen_dihedrals(args):
     """
     #args = arguments(d=d)
 
-    elements = angles.read_index(args.n, angle_type="dihedral")
-
-    dih_angles = np.array([])
+    if elements is None:
+        elements = angles.read_index(args.n, angle_type="dihedral")
 
     # load the trajectory file by chunks iteratively
     print("Loading xtc trajectory file now ......")
     trajs = gmxcli.read_xtc(args.f, args.s, chunk=200, stride=int(args.dt / args.ps))
 
+    dih_angles = ArrayAccumulator(n_rows=trajs.n_frames_)
+
     # calculate the dihedral angles by chunks iteratively
     print("Calculating dihedral angles ...... ")
     for traj in trajs:
         dang = angles.ComputeAngles(traj)
-        if dih_angles.shape[0] == 0:
-            dih_angles = dang.get_dihedral_angles(elements)
-        else:
-            dih_angles = np.concatenate((dih_angles, dang.get_dihedral_angles(elements)), axis=0)
+        dih_angles.append(dang.get_dihedral_angles(elements))
 
     #if not isinstance(dih_angles, pd.DataFrame):
-    dih_angles = pd.DataFrame(dih_angles)
+    dih_angles = pd.DataFrame(dih_angles.values())
     dih_angles.index = np.arange(dih_angles.shape[0]) * args.dt
 
     return dih_angles
@@ -916,17 +2090,52 @@ def cmap_pca(args):
         the arguments options
     """
 
+    if args.streaming and args.storage == "dense" and not args.switch:
+        # keep the binary contact map compact, dense blocks are streamed to PCA
+        args.storage = "packed"
+
     # contmap is a pd.DataFrame containing the contact map information
     contmap = gen_cmap(args)
-    contmap.index = np.arange(contmap.shape[0]) * args.dt
 
-    # process the begin end information
-    contmap = datset_subset(contmap, begin=args.b, end=args.e)
+    if isinstance(contmap, cmap.BinaryCmap):
+        contmap = contmap.subset(subset_mask(contmap.index_, begin=args.b, end=args.e))
+
+        # only the atom pairs ever in contact are converted to a dense matrix
+        columns = np.flatnonzero(contmap.sum(axis=0))
+        metadata = model_metadata(args, columns=columns)
+        if args.solver in ["randomized", "arpack"]:
+            # the truncated solvers work on the sparse matrix directly
+            run_pca(contmap.tocsr(columns=columns), proj=args.proj, output=args.o,
+                    var_ratio_out=args.var_ratio, scale=args.scale_method,
+                    solver=args.solver, random_state=args.seed, index=contmap.index_,
+                    model_out=args.model, metadata=metadata)
+            return None
+        elif args.streaming:
+            def chunks(block=1000):
+                for i in range(0, contmap.n_frames_, block):
+                    yield contmap.index_[i:i + block], \
+                        contmap.toarray(i, i + block, columns=columns)
+
+            run_pca_streaming(chunks, proj=args.proj, output=args.o,
+                              var_ratio_out=args.var_ratio, scale=args.scale_method,
+                              model_out=args.model, metadata=metadata,
+                              solver=args.solver, random_state=args.seed)
+            return None
+
+        contmap = pd.DataFrame(contmap.toarray(columns=columns), index=contmap.index_,
+                               columns=columns)
+    else:
+        contmap.index = np.arange(contmap.shape[0]) * args.dt
+
+        # process the begin end information
+        contmap = datset_subset(contmap, begin=args.b, end=args.e)
 
-    contmap = contmap.loc[:, (contmap != 0).any(axis=0)]
+        contmap = contmap.loc[:, (contmap != 0).any(axis=0)]
+        metadata = model_metadata(args, columns=contmap.columns.values)
 
     # run pca and write result to outputs
-    run_pca(contmap, proj=args.proj, output=args.o, var_ratio_out=args.var_ratio, scale=args.scale_method)
+    run_pca(contmap, proj=args.proj, output=args.o, var_ratio_out=args.var_ratio, scale=args.scale_method,
+            solver=args.solver, random_state=args.seed, model_out=args.model, metadata=metadata)
 
 
 def general_pca(args):
@@ -940,6 +2149,15 @@ def general_pca(args):
 
     """
 
+    if args.f.endswith(".npz") and args.solver in ["randomized", "arpack"]:
+        # a binary contact map is decomposed without densifying it
+        dat = cmap.BinaryCmap.load(args.f)
+        dat = dat.subset(subset_mask(dat.index_, begin=args.b, end=args.e))
+        run_pca(dat, proj=args.proj, output=args.o, var_ratio_out=args.var_ratio,
+                eigenvector_out=args.eigvect, solver=args.solver, random_state=args.seed,
+                model_out=args.model, metadata=model_metadata(args))
+        return None
+
     # dat is a pd.DataFrame with index information
     dat = load_dataset(args.f, args.skip_index)
 
@@ -947,7 +2165,9 @@ def general_pca(args):
     dat = datset_subset(dat, begin=args.b, end=args.e)
 
     # run pca and write result to outputs
-    run_pca(dat, proj=args.proj, output=args.o, var_ratio_out=args.var_ratio, eigenvector_out=args.eigvect)
+    run_pca(dat, proj=args.proj, output=args.o, var_ratio_out=args.var_ratio, eigenvector_out=args.eigvect,
+            solver=args.solver, random_state=args.seed, model_out=args.model,
+            metadata=model_metadata(args, columns=np.asarray(dat.columns, dtype=str)))
 
 
 def xyz_pca(args):
@@ -969,6 +2189,23 @@ def xyz_pca(args):
     if args.v:
         print("Start to load trajectory file ...... ")
 
+    if args.streaming:
+        # the trajectory is read twice, for fitting and for transforming,
+        # only one chunk of coordinates is in memory at a time
+        trajs = gmxcli.read_xtc(xtc=args.f, top=args.s, chunk=1000,
+                                stride=int(args.dt/args.ps))
+
+        def chunks():
+            return iter_xyz_chunks(trajs, args.s, atom_selection=args.select,
+                                   dt=args.dt, begin=args.b, end=args.e)
+
+        run_pca_streaming(chunks, proj=args.proj, output=args.o,
+                          var_ratio_out=args.var_ratio, eigenvector_out=args.eigvect,
+                          scale=args.scale_method, model_out=args.model,
+                          metadata=model_metadata(args), solver=args.solver,
+                          random_state=args.seed)
+        return None
+
     # obtain all xyz coordinates in a long trajectory file
     dat = iterload_xyz_coordinates(xtcfile=args.f, top=args.s,
                                    chunk=10000, stride=int(args.dt/args.ps),
@@ -983,7 +2220,9 @@ def xyz_pca(args):
 
     # run pca and write result to outputs
     run_pca(dat, proj=args.proj, output=args.o, var_ratio_out=args.var_ratio,
-            eigenvector_out=args.eigvect, scale=args.scale_method)
+            eigenvector_out=args.eigvect, scale=args.scale_method,
+            solver=args.solver, random_state=args.seed, model_out=args.model,
+            metadata=model_metadata(args))
 
 
 def dihedral_pca(args):
@@ -995,7 +2234,9 @@ def dihedral_pca(args):
         the arguments holder
     """
 
-    dih_angles = gen_dihedrals(args)
+    elements = angles.read_index(args.n, angle_type="dihedral")
+
+    dih_angles = gen_dihedrals(args, elements)
     dih_angles = datset_subset(dih_angles, begin=args.b, end=args.e)
 
     # cosine and sine dihedrals
@@ -1008,7 +2249,205 @@ def dihedral_pca(args):
 
     # perform PCA calculation
     run_pca(dihedrals, proj=args.proj, output=args.o, var_ratio_out=args.var_ratio,
-            scale=args.scale_method, eigenvector_out=args.eigvect)
+            scale=args.scale_method, eigenvector_out=args.eigvect,
+            solver=args.solver, random_state=args.seed, model_out=args.model,
+            metadata=model_metadata(args, elements=elements))
+
+
+def model_metadata(args, **kwargs):
+    """The feature settings saved together with a PCA model, thus
+    new trajectories could be projected with the same features.
+
+    Parameters
+    ----------
+    args : argparse object,
+        the arguments holder
+    kwargs : dict
+        the other information, for example the contact map columns
+
+    Returns
+    -------
+    metadata : dict
+    """
+    metadata = {"mode": args.mode, "select": args.select, "cutoff": args.cutoff,
+                "switch": args.switch, "scale_method": args.scale_method}
+    metadata.update(kwargs)
+
+    return metadata
+
+
+def model_chunks(model, inp, top, dt=2, ps=2, begin=0, end=-1):
+    """Compute the features of a new dataset chunk by chunk, the same
+    way as when the model was fitted.
+
+    Parameters
+    ----------
+    model : PCA
+        the loaded model, with its metadata_
+    inp : str
+        the input xtc trajectory file, or a dataset file in general mode
+    top : str
+        the reference pdb file
+    dt : int, default = 2
+        the time step of the output, unit is ps
+    ps : int, default = 2
+        the time step of the xtc file, unit is ps
+    begin : float, default = 0
+        the beginning time, see subset_mask
+    end : float, default = -1
+        the ending time, see subset_mask
+
+    Yields
+    ------
+    index : np.array, shape = [N, ]
+        the time of the samples in the chunk
+    X : np.ndarray, or scipy.sparse matrix, shape = [N, M]
+        the features of the chunk
+    """
+    meta = model.metadata_
+    mode = meta.get("mode", "general")
+
+    if mode == "general":
+        dat = datset_subset(load_dataset(inp), begin=begin, end=end)
+        if "columns" in meta.keys():
+            dat.columns = dat.columns.astype(str)
+            dat = dat[list(meta["columns"])]
+        yield dat.index.values, dat.values
+        return
+
+    trajs = gmxcli.read_xtc(xtc=inp, top=top, chunk=1000, stride=int(dt / ps))
+
+    if mode == "xyz":
+        for index, X in iter_xyz_chunks(trajs, top, atom_selection=meta["select"],
+                                        dt=dt, begin=begin, end=end):
+            yield index, X
+        return
+
+    if mode == "cmap":
+        atoms_selections = meta["select"].split()
+        if len(atoms_selections) != 2:
+            atoms_selections = [atoms_selections[0]] * 2
+        topology = mt.load(top).topology
+        atom_grp_a = topology.select("name %s" % atoms_selections[0])
+        atom_grp_b = topology.select("name %s" % atoms_selections[1])
+
+    n_frames = 0
+    for traj in trajs:
+        index = (n_frames + np.arange(traj.n_frames)) * dt
+        n_frames += traj.n_frames
+
+        mask = subset_mask(index, begin, end)
+        if not mask.any():
+            continue
+
+        if mode == "cmap":
+            contmap = cmap.ContactMap(traj=traj[mask], group_a=atom_grp_a,
+                                      group_b=atom_grp_b, cutoff=meta["cutoff"])
+            if meta["switch"]:
+                contmap.generate_cmap(shape="array", switch=True)
+                X = contmap.cmap_[:, meta["columns"]]
+            else:
+                X = contmap.binary_cmap(storage="sparse")[:, meta["columns"]]
+        else:
+            dang = angles.ComputeAngles(traj[mask]).get_dihedral_angles(meta["elements"])
+            X = np.concatenate((np.cos(dang), np.sin(dang)), axis=1)
+
+        yield index[mask], X
+
+
+def project_trajectory(model_file, inp, top, output, dt=2, ps=2, begin=0, end=-1):
+    """Project a new trajectory (or dataset) with a saved PCA model,
+    the trajectory is processed chunk by chunk.
+
+    Parameters
+    ----------
+    model_file : str
+        the model file written with -model in the fitting modes
+    inp : str
+        the input xtc trajectory file, or a dataset file in general mode
+    top : str
+        the reference pdb file
+    output : str
+        the transformed dataset output file name, format is csv
+    dt, ps, begin, end :
+        see model_chunks
+
+    Returns
+    -------
+    output : str
+        the output file name
+    """
+    model = PCA.load(model_file)
+
+    X_transformed = ArrayAccumulator()
+    index_col = ArrayAccumulator()
+    for index, X in model_chunks(model, inp, top, dt=dt, ps=ps, begin=begin, end=end):
+        X_transformed.append(model.project(X))
+        index_col.append(np.asarray(index))
+
+    write_transformed(X_transformed.values(), output, index_col.values())
+
+    return output
+
+
+def projection_outputs(inputs, output):
+    """The output file names of the projected trajectories. For more
+    than one input, the base name of each input is appended to the
+    output file name; if some inputs share a base name (for example,
+    replicas rep1/md.xtc and rep2/md.xtc), the index of the input is
+    appended too, thus no output file is overwritten.
+
+    Parameters
+    ----------
+    inputs : list of str
+        the input trajectory (or dataset) files
+    output : str
+        the output file name given by -o
+
+    Returns
+    -------
+    outputs : list of str
+        the output file names, one for each input
+    """
+    if len(inputs) == 1:
+        return [output, ]
+
+    stem, ext = os.path.splitext(output)
+    names = [os.path.splitext(os.path.basename(x))[0] for x in inputs]
+    if len(set(names)) < len(names):
+        names = ["%d_%s" % (i, x) for i, x in enumerate(names)]
+
+    return ["%s_%s%s" % (stem, x, ext) for x in names]
+
+
+def project_pca(args):
+    """Project new trajectories with a saved PCA model, the
+    trajectories are processed in parallel.
+
+    Parameters
+    ----------
+    args: argparse object,
+        the arguments holder
+    """
+    inputs = args.trajs if len(args.trajs) else [args.f, ]
+    outputs = projection_outputs(inputs, args.o)
+
+    jobs = [(args.model, inp, args.s, out, args.dt, args.ps, args.b, args.e)
+            for inp, out in zip(inputs, outputs)]
+
+    if args.nt > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(min(args.nt, len(jobs)))
+        try:
+            pool.starmap(project_trajectory, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for job in jobs:
+            project_trajectory(*job)
+
+    if args.v:
+        print("Projected files: ", " ".join(outputs))
 
 
 def arguments(d="Descriptions."):
@@ -1032,11 +2471,12 @@ def arguments(d="Descriptions."):
     parser.parser.add_argument("-mode", type=str, default="general",
                                help="Input, optional. Default is general. \n"
                                     "The PCA calculation mode. \n"
-                                    "Options: general, xyz, cmap, dihedral \n"
+                                    "Options: general, xyz, cmap, dihedral, project \n"
                                     "general: perform general PCA using a well formated dataset file. \n"
                                     "xyz: perform xyz coordinate PCA analysis using a trajectory xtc file. \n"
                                     "cmap: perform contact map PCA analysis using a trajectory xtc file. \n"
-                                    "dihedral: perform dihedral PCA calculation using a trajectory xtc file. \n")
+                                    "dihedral: perform dihedral PCA calculation using a trajectory xtc file. \n"
+                                    "project: project new trajectories with a saved model (-model). \n")
     parser.parser.add_argument("-cutoff", default=0.5, type=float,
                                help="Input, optional, it works with mode =cmap. Default is 0.5. \n"
                                     "The distance cutoff for contactmap calculation. Unit is nanometer.\n")
@@ -1070,6 +2510,40 @@ def arguments(d="Descriptions."):
                                     "minmax: min-max scale \n"
                                     "zscore: z-standardization \n"
                                     "mean: substract mean values \n")
+    parser.parser.add_argument("-solver", type=str, default="auto",
+                               help="Input, optional. Default is auto. \n"
+                                    "The SVD solver of PCA. Options: auto, full, randomized, arpack. \n"
+                                    "randomized: randomized truncated SVD. arpack: Lanczos truncated SVD. \n"
+                                    "Both only compute the first -proj components, which is much faster \n"
+                                    "for wide datasets. Binary contact maps (-storage packed/sparse, or \n"
+                                    "a .npz file in general mode) are decomposed without densifying. \n")
+    parser.parser.add_argument("-seed", type=int, default=0,
+                               help="Input, optional. Default is 0. \n"
+                                    "The random seed of the randomized and arpack solvers. \n")
+    parser.parser.add_argument("-streaming", type=lambda x: (str(x).lower() == "true"), default=False,
+                               help="Input, optional. Working with mode == xyz or cmap. Default is False. \n"
+                                    "Fit the PCA chunk by chunk with the accumulated covariance matrix, \n"
+                                    "the dataset is never loaded as a whole. The memory usage depends \n"
+                                    "on the number of dimensions only, not the number of frames. \n")
+    parser.parser.add_argument("-storage", type=str, default="dense",
+                               help="Input, optional. Working with mode == cmap. Default is dense. \n"
+                                    "The storage format of the contact map during the calculation. \n"
+                                    "Options: dense, packed, sparse. packed and sparse store the \n"
+                                    "binary contact map compactly, only the atom pairs in contact \n"
+                                    "are used in the PCA. It does not work with -switch. \n")
+    parser.parser.add_argument("-model", type=str, default="",
+                               help="Output or input, optional. Default is empty. \n"
+                                    "The PCA model file (.npz). In the fitting modes, the fitted \n"
+                                    "model, scaler and feature settings are saved to this file. \n"
+                                    "In project mode, the model is loaded from this file. \n")
+    parser.parser.add_argument("-trajs", type=str, nargs="+", default=[],
+                               help="Input, optional. Working with mode == project. \n"
+                                    "Multiple xtc files to project, default is the -f file. Each \n"
+                                    "output is named after -o and the trajectory file name, \n"
+                                    "and the input index when file names are repeated. \n")
+    parser.parser.add_argument("-nt", type=int, default=1,
+                               help="Input, optional. Working with mode == project. Default is 1. \n"
+                                    "Number of trajectories projected in parallel. \n")
 
     parser.parse_arguments()
     args = parser.args
@@ -1101,6 +2575,11 @@ def main():
     for PCA calculation. 
     gmx_pca.py -mode dihedral -f mytrajecotry.xtc -s reference.pdb -n dihedral.ndx -proj 10
 
+    Add -model pca_model.npz to any of the above to save the fitted model, then project
+    other trajectories with it.
+    gmx_pca.py -mode project -model pca_model.npz -s reference.pdb -trajs rep1.xtc rep2.xtc
+    -o projected.csv -nt 2
+
     """
 
     args = arguments(d=d)
@@ -1117,4 +2596,7 @@ def main():
     elif args.mode == "dihedral":
         dihedral_pca(args=args)
 
+    elif args.mode == "project":
+        project_pca(args=args)
+
     return None
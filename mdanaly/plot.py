@@ -9,6 +9,35 @@ import argparse
 import pandas as pd
 
 from dockml import algorithms
+from mdanaly import pmf as pmf_module
+
+
+def iterload_scaled(filename, cols, scales, shifts, start=0, sep=","):
+    """Read columns of a data file (with a header line) chunk by chunk,
+    and scale and shift them
+
+    Parameters
+    ----------
+    filename : str
+        the input data file
+    cols : list of int
+        the columns to read
+    scales : list of float
+        the scale of each column
+    shifts : list of float
+        the shift of each column
+    start : int, default = 0
+        number of leading data lines to skip
+    sep : str, default = ","
+        the delimiter
+
+    Yields
+    ------
+    X : np.ndarray, shape = [N, len(cols)]
+    """
+    for X in pmf_module.iterload_columns(filename, cols, delimiter=sep, skiprows=1, start=start):
+        yield X * np.asarray(scales) + np.asarray(shifts)
+
 
 def plot2dScatter(filenames,
                   xlim=[], ylim=[],
@@ -58,20 +87,25 @@ def plot2dScatter(filenames,
 
     """
 
-    X = np.loadtxt(filenames[0], comments=["#", "@"], usecols=[xcol, ], dtype=float, delimiter=sep, skiprows=1)
-    X = X * xscale + np.repeat(xshift[0], X.shape[0])
-    Y = np.loadtxt(filenames[0], comments=["#", "@"], usecols=[ycol, ], dtype=float, delimiter=sep, skiprows=1)
-    Y = Y * yscale + np.repeat(yshift[0], Y.shape[0])
-
     if pmf:
+        # the data file is counted chunk by chunk into the histogram
+        def chunks():
+            return iterload_scaled(filenames[0], [xcol, ycol], [xscale, yscale],
+                                   [xshift[0], yshift[0]], sep=sep)
+
         algo = algorithms.BasicAlgorithm()
-        x, y, z = algo.pmf2d(X, Y, minX=minX, bins=bins)
+        x, y, z = algo.pmf2d(pmf_module.histogram_chunks(chunks, bins), None, minX=minX)
 
         plt.pcolormesh(x, y, z, cmap=cmaptype)
         cb = plt.colorbar()
         cb.set_label(label, fontsize=12)
 
     else:
+        X = np.loadtxt(filenames[0], comments=["#", "@"], usecols=[xcol, ], dtype=float, delimiter=sep, skiprows=1)
+        X = X * xscale + np.repeat(xshift[0], X.shape[0])
+        Y = np.loadtxt(filenames[0], comments=["#", "@"], usecols=[ycol, ], dtype=float, delimiter=sep, skiprows=1)
+        Y = Y * yscale + np.repeat(yshift[0], Y.shape[0])
+
         if gradient:
             colors = np.arange(X.shape[0]) * timescale
             plt.scatter(X, Y, c=colors, marker=marker, alpha=alpha, cmap=cmaptype)
@@ -289,11 +323,11 @@ def plot1Dhistogram(filename, color,
                     legend_loc='', legend_box=0,
                     alpha=1.0, sep=","
                     ):
-    data = np.loadtxt(filename, comments=["#","@"], usecols=[xcol], delimiter=sep, skiprows=1)
-
-    X = data[xstart:] * xscale
+    def chunks():
+        return iterload_scaled(filename, [xcol, ], [xscale, ], [0.0, ], start=xstart, sep=sep)
 
-    hist, bin_edges = np.histogram(X, bins=num_bins)
+    hist = pmf_module.histogram_chunks(chunks, num_bins)
+    hist, bin_edges = hist.counts_, hist.edges_[0]
 
     if relative_prob:
         prob = hist / float(np.max(hist))
@@ -341,13 +375,13 @@ def plot1Dhistogram(filename, color,
 
 
 def histBins(files, num_bins=20, xcol=1, xscale=1.0, xstart=0, xshift=0, sep=","):
-    X, bins = [], []
+    x_min, x_max, bins = np.inf, -np.inf, []
     for f in files:
-        x = np.loadtxt(f, comments=["#", '@'], usecols=[int(xcol)], delimiter=sep, skiprows=1)[xstart:] * xscale + xshift
-        X = X + list(x)
+        for x in iterload_scaled(f, [int(xcol), ], [xscale, ], [xshift, ], start=xstart, sep=sep):
+            x_min, x_max = min(x_min, np.min(x)), max(x_max, np.max(x))
 
     for i in range(num_bins):
-        bins.append(np.min(X) + float(i) * (np.max(X) - np.min(X)) / float(num_bins))
+        bins.append(x_min + float(i) * (x_max - x_min) / float(num_bins))
     return bins
 
 
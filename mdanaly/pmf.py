@@ -4,6 +4,9 @@ import numpy as np
 import sys
 import argparse
 from argparse import RawTextHelpFormatter
+from itertools import islice
+
+from mdanaly.accumulator import HistogramAccumulator
 
 
 class PMF(object):
@@ -32,8 +35,11 @@ class PMF(object):
 
         Parameters
         ----------
-        data
-        nbins
+        data: np.ndarray, or HistogramAccumulator
+            input data set, or a 2D histogram counted chunk by chunk
+        nbins: int, or list of np.ndarray
+            number of bins, or the bin edges of the two columns.
+            It is ignored if data is a histogram.
         xcol
         ycol
         RT: float,
@@ -46,10 +52,12 @@ class PMF(object):
         y
 
         """
-        data = np.asarray(data)
-
         # calculate 2d probability distributions
-        hist2d, edges1, edges2 = np.histogram2d(data[:, xcol], data[:, ycol], bins=nbins)
+        if not isinstance(data, HistogramAccumulator):
+            data = np.asarray(data)[:, [xcol, ycol]]
+            data = histogram(data, nbins)
+        hist2d = data.counts_.astype(np.float64)
+        edges1, edges2 = data.edges_
 
         max_val = float(np.max(hist2d))
         min_val = 1.0 / 2.5
@@ -76,10 +84,11 @@ class PMF(object):
 
         Parameters
         ----------
-        data: np.ndarray,
-            input data set
-        nbins: int,
-            number of bins for probability distribution
+        data: np.ndarray, or HistogramAccumulator
+            input data set, or a histogram counted chunk by chunk
+        nbins: int, or np.ndarray
+            number of bins for probability distribution, or the bin edges.
+            It is ignored if data is a histogram.
         RT: float,
             Gas constant * Absolution temperature
 
@@ -89,7 +98,10 @@ class PMF(object):
         """
 
         # probability distribution
-        hist, edges = np.histogram(data, bins=nbins)
+        if not isinstance(data, HistogramAccumulator):
+            data = histogram(np.ravel(data), nbins)
+        hist = data.counts_.astype(np.float64)
+        edges = data.edges_[0]
 
         max_val = np.max(hist)
         min_val = np.sort(hist, axis=None)[1]
@@ -102,18 +114,137 @@ class PMF(object):
         return pmf, edges
 
 
+def histogram(data, bins=20):
+    """Count a dataset in memory into a HistogramAccumulator. The
+    edges are the same as np.histogram (np.histogramdd) given the bins.
+
+    Parameters
+    ----------
+    data : np.ndarray, shape = [N, ] or [N, n_dims]
+        the dataset
+    bins : int, np.ndarray, or list
+        the number of bins, or the bin edges (of each dimension)
+
+    Returns
+    -------
+    hist : HistogramAccumulator
+    """
+    data = np.asarray(data, dtype=np.float64)
+    if data.ndim == 1:
+        edges = np.histogram_bin_edges(data, bins=bins)
+    else:
+        if np.ndim(bins) == 0:
+            bins = [bins, ] * data.shape[1]
+        edges = [np.histogram_bin_edges(data[:, i], bins=bins[i]) for i in range(data.shape[1])]
+
+    return HistogramAccumulator(edges).append(data)
+
+
+def iterload_columns(fname, cols, chunk=1000000, comments=("#", "@"), delimiter=None, skiprows=0,
+                     start=0):
+    """Read columns of a large text data file chunk by chunk
+
+    Parameters
+    ----------
+    fname : str
+        the input data file
+    cols : list of int
+        the columns to read
+    chunk : int, default = 1000000
+        number of lines per chunk
+    comments : tuple of str, default = ('#', '@')
+        the lines starting with these characters are skipped
+    delimiter : str, default = None
+        the delimiter, None for white spaces
+    skiprows : int, default = 0
+        number of leading lines to skip, for example the header
+    start : int, default = 0
+        number of leading data lines (not comments) to skip
+
+    Yields
+    ------
+    X : np.ndarray, shape = [N, len(cols)]
+        the values of a chunk of lines
+    """
+    with open(fname) as lines:
+        for i in range(skiprows):
+            next(lines, None)
+
+        while True:
+            block = list(islice(lines, chunk))
+            if not len(block):
+                break
+
+            block = [x for x in block if len(x.strip()) and not x.lstrip().startswith(comments)]
+            if start > 0:
+                n_skip = min(start, len(block))
+                block, start = block[n_skip:], start - n_skip
+            if len(block):
+                yield np.loadtxt(block, usecols=cols, delimiter=delimiter,
+                                 ndmin=2, dtype=np.float64)
+
+
+def histogram_chunks(chunks, bins=20):
+    """Count a dataset arriving in chunks into a HistogramAccumulator.
+    If the bin edges are not given, the chunks are read twice, the
+    first pass gets the min and max, thus the edges are the same as
+    np.histogram (np.histogramdd) of the whole dataset.
+
+    Parameters
+    ----------
+    chunks : callable
+        chunks() returns an iterable of np.ndarray, shape = [N, ] or [N, n_dims]
+    bins : int, np.ndarray, or list
+        the number of bins, or the bin edges (of each dimension)
+
+    Returns
+    -------
+    hist : HistogramAccumulator
+    """
+    if np.ndim(bins) == 0:
+        lower, upper = None, None
+        for X in chunks():
+            X = np.asarray(X, dtype=np.float64)
+            X = X.reshape((X.shape[0], -1))
+            if lower is None:
+                lower, upper = np.nanmin(X, axis=0), np.nanmax(X, axis=0)
+            else:
+                lower, upper = np.fmin(lower, np.nanmin(X, axis=0)), np.fmax(upper, np.nanmax(X, axis=0))
+
+        # np.histogram extends an empty range by 0.5 on both sides
+        empty = lower == upper
+        lower, upper = np.where(empty, lower - 0.5, lower), np.where(empty, upper + 0.5, upper)
+        hist = HistogramAccumulator.from_range([[a, b] for a, b in zip(lower, upper)], bins=bins)
+    else:
+        hist = HistogramAccumulator(bins)
+
+    for X in chunks():
+        hist.append(X)
+
+    return hist
+
+
 def arguments():
     d = '''
         Transform a 2D data (time series) file into a PMF matrix
         (Only numerical data files are accepted)
         Usage:
         python pmf2d.py -dat your2d.data -numbins numberofbins
+
+        The data files are read chunk by chunk, so very large files could
+        be used. Several files are counted into the same histogram. The
+        histogram could be saved with -save_hist, and histograms (.npz)
+        from other runs with the same -range could be merged by passing
+        them to -dat:
+        python pmf2d.py -dat rep1.dat -cols 1 2 -range -3 3 -3 3 -save_hist rep1.npz
+        python pmf2d.py -dat rep1.npz rep2.npz rep3.dat -cols 1 2 -range -3 3 -3 3
     '''
 
     parser = argparse.ArgumentParser(description=d, formatter_class=RawTextHelpFormatter)
 
-    parser.add_argument('-dat', type=str, default='time_series.dat',
-                        help="Input file name. Two columns or one column. ")
+    parser.add_argument('-dat', type=str, default=['time_series.dat', ], nargs="+",
+                        help="Input file name(s). Two columns or one column. \n"
+                             "A .npz file is a histogram saved with -save_hist. ")
     parser.add_argument('-numbins', type=int, default=40,
                         help="Number of bins for histogram analysis. \n")
     parser.add_argument('-out', type=str, default='',
@@ -121,6 +252,14 @@ def arguments():
     parser.add_argument('-cols', type=int, default=[0], nargs="+",
                         help="Use which cols for analysis. \n "
                              "Default is col 0. ")
+    parser.add_argument('-range', type=float, default=[], nargs="+",
+                        help="The min and max of each col, for example -range -3 3 -2 2. \n"
+                             "The bin edges are fixed by the range. If not given, the data \n"
+                             "files are read twice to get the min and max of each col. ")
+    parser.add_argument('-chunk', type=int, default=1000000,
+                        help="Number of lines to read per time. Default is 1000000. \n")
+    parser.add_argument('-save_hist', type=str, default='',
+                        help="Output file name (.npz) of the histogram counts. \n")
 
     args = parser.parse_args()
 
@@ -135,27 +274,64 @@ def arguments():
 def main():
     args = arguments()
 
-    dataf = args.dat
     nb = args.numbins
     if len(args.out):
         out = args.out
     else:
-        out = "pmf_"+dataf
+        out = "pmf_" + args.dat[0]
+        if out.endswith(".npz"):
+            # the pmf matrix is a text file
+            out = out[:-4] + ".dat"
+
+    hist_files = [x for x in args.dat if x.endswith(".npz")]
+    data_files = [x for x in args.dat if not x.endswith(".npz")]
+
+    def chunks():
+        for fn in data_files:
+            for X in iterload_columns(fn, args.cols, args.chunk):
+                yield X
+
+    # the bin edges are fixed before counting, thus all the counts are additive
+    if len(hist_files):
+        hist = HistogramAccumulator.load(hist_files[0])
+        for fn in hist_files[1:]:
+            hist.merge(HistogramAccumulator.load(fn))
+
+        if len(data_files) and len(args.cols) != hist.ndim:
+            raise ValueError("%d cols (-cols) could not be counted into the %dD histogram of %s"
+                             % (len(args.cols), hist.ndim, hist_files[0]))
+        if len(args.range):
+            edges = [np.linspace(r[0], r[1], nb + 1) for r in np.reshape(args.range, (-1, 2))]
+            if len(edges) != hist.ndim or \
+                    not all([np.allclose(a, b) for a, b in zip(edges, hist.edges_)]):
+                raise ValueError("-range and -numbins do not match the bin edges of %s, "
+                                 "the histograms could only be merged with their own edges"
+                                 % hist_files[0])
+        else:
+            print("The bin edges of %s are used, -numbins is ignored. " % hist_files[0])
+
+        for X in chunks():
+            hist.append(X)
+    elif len(args.range):
+        hist = histogram_chunks(chunks, [np.linspace(r[0], r[1], nb + 1)
+                                         for r in np.reshape(args.range, (-1, 2))])
+    else:
+        hist = histogram_chunks(chunks, nb)
 
-    df = np.loadtxt(dataf, comments=["#", "@"], usecols= args.cols)
+    if len(args.save_hist):
+        hist.save(args.save_hist)
 
     pmf = PMF()
 
-    if len(args.cols) == 2:
-        matrix, edges1, edges2 = pmf.pmf2d(df, nb)
+    if hist.ndim == 2:
+        matrix, edges1, edges2 = pmf.pmf2d(hist)
         print("X ticks ")
         print(",".join([str(x) for x in list(edges1)]))
         print("Y ticks ")
         print(",".join([str(x) for x in list(edges2)]))
     else :
-        matrix, edges = pmf.pmf1d(df, nb)
+        matrix, edges = pmf.pmf1d(hist)
         print("X ticks ")
         print(",".join([str(x) for x in list(edges)]))
 
     np.savetxt(out, matrix, fmt="%.3f")
-
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+"""
+Shared fixtures of the pytest checks.
+
+The other test_*.py files in this folder are stand-alone scripts which
+need private data sets, they are not collected by pytest.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+TEST_ROOT = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(TEST_ROOT))
+
+collect_ignore = ["test_GOLD_Results.py", "test_PRLBD_VS.py", "test_cmap.py",
+                  "test_cmap_NbyN.py", "test_commonrank.py", "test_domainCmapPCA.py",
+                  "test_features.py", "test_gmxtop.py", "test_gridfeatures.py",
+                  "test_rotateDNA.py", "test2.py", "gen_results.py",
+                  "check_hydrogen_bonds.py", "read_MMPBSA.py", "shiftPDB.py"]
+
+# the residue of test/input.pdb used as the ligand
+LIGAND_RESIDUE = (" ", "D", "20")
+
+
+def _complex_lines(shift=0.0, pdbqt=True):
+    """Build a receptor-ligand complex from test/input.pdb, one nucleotide
+    of chain D is renamed as LIG and shifted along x by shift angstrom.
+    For pdbqt, a partial charge and the element as the atom type are
+    appended to each line."""
+    lines = []
+    with open(os.path.join(TEST_ROOT, "input.pdb")) as f:
+        for s in f:
+            if s[:4] != "ATOM":
+                continue
+            s = s.rstrip("\n").ljust(80)
+            if s[21] == LIGAND_RESIDUE[1] and s[22:26].strip() == LIGAND_RESIDUE[2]:
+                x = float(s[30:38]) + shift
+                s = s[:17] + "LIG" + s[20:30] + "%8.3f" % x + s[38:]
+            if pdbqt:
+                charge = ((int(s[6:11]) % 7) - 3) * 0.1
+                s = s[:66] + "    %6.3f %s" % (charge, s[76:78].strip())
+            lines.append(s.rstrip())
+    return lines
+
+
+@pytest.fixture
+def complexes(tmp_path, monkeypatch):
+    """Write a few poses of the same complex into a temporary folder,
+    which is the working directory of the test. Returns the input file
+    of BindingFeature.extractFeatures and the complex file names."""
+    monkeypatch.chdir(tmp_path)
+
+    names = []
+    for i, shift in enumerate(np.linspace(0.0, 1.5, 7)):
+        fn = "pose%02d.pdbqt" % i
+        with open(fn, "w") as tofile:
+            tofile.write("\n".join(_complex_lines(shift)) + "\n")
+        names.append(fn)
+
+    with open("input.dat", "w") as tofile:
+        tofile.write("".join(["%s LIG\n" % x for x in names]))
+
+    return "input.dat", names
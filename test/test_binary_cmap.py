@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import mdtraj as mt
+import numpy as np
+import pytest
+from scipy import sparse
+
+from mdanaly import cmap
+
+TEST_ROOT = os.path.abspath(os.path.dirname(__file__))
+
+
+def _contacts(n_frames, n_pairs, seed=0):
+    rng = np.random.RandomState(seed)
+    X = (rng.rand(n_frames, n_pairs) < 0.3).astype(np.float64)
+    # the atom pair in the padded last byte is in contact
+    X[::2, -1] = 1.0
+    return X
+
+
+def _packed_with_padding(X):
+    """np.packbits frames with all the padding bits set"""
+    packed = np.packbits(X != 0, axis=1)
+    n_pad = (-X.shape[1]) % 8
+    packed[:, -1] |= np.uint8((1 << n_pad) - 1)
+    return packed
+
+
+@pytest.mark.parametrize("storage", ["packed", "sparse"])
+@pytest.mark.parametrize("n_pairs", [1, 8, 13, 45])
+def test_round_trip(tmp_path, storage, n_pairs):
+    X = _contacts(23, n_pairs)
+
+    cm = cmap.BinaryCmap(n_pairs, storage=storage)
+    cm.append(X[:7])
+    cm.append(sparse.csr_matrix(X[7:12]))
+    if n_pairs > 1:
+        cm.append(_packed_with_padding(X[12:]))
+    else:
+        # an uint8 array with one column is taken as a dense contact map
+        cm.append(X[12:].astype(np.uint8))
+    assert cm.shape == X.shape
+
+    columns = np.array([n_pairs - 1, 0])
+    assert np.array_equal(cm.toarray(), X)
+    assert np.array_equal(cm.toarray(5, 15, columns=columns), X[5:15][:, columns])
+    assert np.array_equal(cm.tocsr(block=4).toarray(), X)
+    assert np.array_equal(np.concatenate(list(cm.iter_blocks(block=4))), X)
+
+    assert np.array_equal(cm.sum(axis=0), X.sum(axis=0))
+    assert np.array_equal(cm.sum(axis=1), X.sum(axis=1))
+    assert np.allclose(cm.mean(axis=0), X.mean(axis=0))
+    assert np.array_equal(cm.greater_fraction(0.5), X.mean(axis=0))
+
+    sub = cm.subset(X[:, -1] > 0)
+    assert np.array_equal(sub.toarray(), X[X[:, -1] > 0])
+
+    cm.index_ = np.arange(X.shape[0]) * 2.0
+    cm.save(str(tmp_path / "cmap.npz"))
+    loaded = cmap.BinaryCmap.load(str(tmp_path / "cmap.npz"))
+    assert loaded.storage_ == storage
+    assert np.array_equal(loaded.index_, cm.index_)
+    assert np.array_equal(loaded.toarray(), X)
+    assert np.array_equal(loaded.sum(axis=1), X.sum(axis=1))
+
+    # and the other storage
+    other = cmap.BinaryCmap(n_pairs, storage="sparse" if storage == "packed" else "packed")
+    other.append(loaded.data_)
+    assert np.array_equal(other.toarray(), X)
+
+
+@pytest.mark.parametrize("storage", ["packed", "sparse"])
+def test_contact_map_storage(storage):
+    ref = mt.load(os.path.join(TEST_ROOT, "input.pdb"))
+    rng = np.random.RandomState(0)
+    xyz = ref.xyz[0] + rng.normal(scale=0.05, size=(4, ref.n_atoms, 3))
+    traj = mt.Trajectory(xyz.astype(np.float32), ref.topology)
+
+    # 13 * 31 atom pairs, the last byte is padded
+    group_a, group_b = np.arange(400, 413), np.arange(381, 412)
+    expected = cmap.ContactMap(traj, group_a, group_b, cutoff=0.45).generate_cmap().cmap_
+    assert expected.sum() > 0 and expected[:, -1].sum() > 0
+
+    data = cmap.ContactMap(traj, group_a, group_b, cutoff=0.45).binary_cmap(storage=storage)
+    if storage == "packed":
+        assert data.dtype == np.uint8 and data.shape == (4, (13 * 31 + 7) // 8)
+    else:
+        assert sparse.issparse(data) and data.shape == expected.shape
+
+    cm = cmap.BinaryCmap(expected.shape[1], storage=storage)
+    cm.append(data)
+    assert np.array_equal(cm.toarray(), expected)
+    assert np.array_equal(cm.sum(axis=1), expected.sum(axis=1))
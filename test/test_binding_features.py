@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+import math
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+from dockml import features
+
+
+def _switch(x, d0, n=6, m=12):
+    return (1.0 - math.pow(x / d0, n)) / (1.0 - math.pow(x / d0, m))
+
+
+def _reference_features(binding, pdbfilename, ligCode, dielec=4.0):
+    """The descriptors of one complex computed pair by pair from the
+    atomID-distance dictionaries, as extractFeatures did before the array
+    backend (with the vdw atom type aliases of the ligand fixed)"""
+    recXYZ, ligXYZ, recLines, ligLines = binding.getAtomInfor(pdbfilename, ligCode)
+    distances = binding.atomDistMatrix(recXYZ, ligXYZ)
+    params = binding.getVdWParams()
+    alias = {"N1+": "N", "L": "Cl", "CL": "Cl", "B": "Br", "BR": "Br", "R": "Br"}
+
+    def atomtype(t):
+        if t in params:
+            return t
+        return alias[t] if alias.get(t) in params else "DU"
+
+    values = defaultdict(float)
+    for key, d in distances.items():
+        recID, ligID = key.split("+")
+        recline, ligline = recLines[recID], ligLines[ligID]
+        res = "_".join(recID.split("_")[1:4])
+        part = "back" if recline.split()[2] in binding.backboneAtoms else "side"
+        s = _switch(d, binding.distCutoff * 2.0)
+
+        if d <= binding.contactCutoff:
+            values["count" + part + "_" + res] += s
+        if d <= binding.vdwEnerCutoff:
+            t1, t2 = atomtype(recline.split()[-1]), atomtype(ligline.split()[-1])
+            sigma = 0.5 * (params[t1][0] + params[t2][0])
+            epsilon = math.sqrt(params[t1][1] * params[t2][1])
+            r = d * 0.1
+            values["vdw" + part + "_" + res] += 4.0 * epsilon * (sigma ** 12 / r ** 12
+                                                                 - sigma ** 6 / r ** 6)
+        if d <= binding.colEnerCutoff:
+            q1, q2 = float(recline.split()[-2]), float(ligline.split()[-2])
+            values["columb" + part + "_" + res] += 138.935485 * q1 * q2 / (d * 0.1 * dielec)
+        if d <= binding.distCutoff * 2.0:
+            values["atomTCount_" + atomtype(recline.split()[-1]) + "_"
+                   + atomtype(ligline.split()[-1])] += s
+
+    residues = set(["_".join(x.split("_")[1:4]) for x in recXYZ.keys()])
+    for key in list(values.keys()):
+        if key.startswith("vdw"):
+            values[key] = min(values[key], 10.0)
+
+    return values, residues
+
+
+def test_extract_features_matches_pairwise_reference(complexes):
+    inp, names = complexes
+    binding = features.BindingFeature(pdbqt=True)
+    binding.extractFeatures(inp, "features.csv", dielec=4.0)
+
+    dense = np.loadtxt("features.csv", delimiter=",")
+    with open("features.csv") as lines:
+        columns = lines.readline()[2:].strip().split(",")
+
+    assert dense.shape == (len(names), len(columns))
+    for row, fn in zip(dense, names):
+        expected, residues = _reference_features(binding, fn, "LIG", dielec=4.0)
+
+        # one column per receptor residue for each residue feature
+        rescols = [x for x in columns if x.startswith("countback_")]
+        assert set([x[len("countback_"):] for x in rescols]) == residues
+        # all the non-zero reference values have a column
+        assert set([k for k, v in expected.items() if v != 0.0]) <= set(columns)
+
+        reference = np.array([expected.get(x, 0.0) for x in columns])
+        # the csv is written with %.3f
+        assert np.abs(row - reference).max() <= 5e-4 + 1e-9
+
+
+def test_receptor_is_parsed_once(complexes, monkeypatch):
+    inp, names = complexes
+    binding = features.BindingFeature(pdbqt=True)
+
+    parsed = []
+    getAtomArrays = binding.getAtomArrays
+
+    def counted(atomLines):
+        parsed.append(len(atomLines))
+        return getAtomArrays(atomLines)
+
+    monkeypatch.setattr(binding, "getAtomArrays", counted)
+
+    for fn in names:
+        reslist, values, atomTypeCounts = binding.caseFeatures(fn, "LIG")
+        fresh = features.BindingFeature(pdbqt=True).caseFeatures(fn, "LIG")
+        assert reslist == fresh[0]
+        assert values == fresh[1]
+        assert atomTypeCounts == fresh[2]
+
+    # the receptor once, then the ligand of each pose
+    assert len(binding.receptorCache_) == 1
+    assert len(parsed) == len(names) + 1
+    assert parsed[0] > parsed[1]
+
+
+def test_receptor_cache_size(complexes):
+    inp, names = complexes
+    with open(names[0]) as lines:
+        lines = lines.readlines()
+    # another receptor, the first atom is moved
+    x = float(lines[0][30:38]) + 0.5
+    lines[0] = lines[0][:30] + "%8.3f" % x + lines[0][38:]
+    with open("other.pdbqt", "w") as tofile:
+        tofile.write("".join(lines))
+
+    binding = features.BindingFeature(pdbqt=True, receptorCacheSize=1)
+    first = binding.caseFeatures(names[0], "LIG")
+    binding.caseFeatures("other.pdbqt", "LIG")
+    assert len(binding.receptorCache_) == 1
+
+    again = binding.caseFeatures(names[0], "LIG")
+    assert again[1] == first[1]
+    assert len(binding.receptorCache_) == 1
+
+
+def test_vdw_pair_tables():
+    binding = features.BindingFeature(pdbqt=True)
+    params = binding.getVdWParams()
+    types = list(params.keys())
+
+    distances = np.array([0.25, 0.35, 0.6, 1.2])
+    for t1 in types:
+        for t2 in types:
+            sigma = 0.5 * (params[t1][0] + params[t2][0])
+            epsilon = math.sqrt(params[t1][1] * params[t2][1])
+            for d in distances:
+                expected = 4.0 * epsilon * (sigma ** 12 / d ** 12 - sigma ** 6 / d ** 6)
+                assert binding.atomicVdWEnergy(t1, t2, d) == \
+                    pytest.approx(expected, rel=1e-12, abs=1e-15)
+
+    # arrays of atom type ids
+    ids = binding.atomTypeIndex(types)
+    t1, t2 = np.meshgrid(ids, ids, indexing="ij")
+    energy = binding.atomicVdWEnergy(t1.ravel(), t2.ravel(), 0.35)
+    expected = [binding.atomicVdWEnergy(a, b, 0.35) for a in types for b in types]
+    assert np.allclose(energy, expected, rtol=1e-14, atol=0.0)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import mdtraj as mt
+import numpy as np
+import pytest
+
+from mdanaly import cmap
+
+TEST_ROOT = os.path.abspath(os.path.dirname(__file__))
+
+
+def _trajectory(box=None, angles=(90.0, 90.0, 90.0), n_frames=3):
+    """A few noisy frames of test/input.pdb. With a box smaller than the
+    molecule, the atoms on opposite faces are in contact through the
+    periodic images, and part of the atoms are outside the box."""
+    ref = mt.load(os.path.join(TEST_ROOT, "input.pdb"))
+    rng = np.random.RandomState(0)
+    xyz = ref.xyz[0] + rng.normal(scale=0.05, size=(n_frames, ref.n_atoms, 3))
+    traj = mt.Trajectory(xyz.astype(np.float32), ref.topology)
+    if box is not None:
+        traj.unitcell_lengths = np.tile(np.array(box, dtype=np.float32), (n_frames, 1))
+        traj.unitcell_angles = np.tile(np.array(angles, dtype=np.float32), (n_frames, 1))
+    return traj
+
+
+def _groups(traj):
+    return np.arange(0, 600, 2), np.arange(600, traj.n_atoms)
+
+
+def _contact_maps(traj, backend, cutoff=0.45):
+    group_a, group_b = _groups(traj)
+
+    def contmap():
+        return cmap.ContactMap(traj, group_a, group_b, cutoff=cutoff, backend=backend)
+
+    return {"array": contmap().generate_cmap(shape="array").cmap_,
+            "matrix": contmap().generate_cmap(shape="matrix").cmap_,
+            "switch": contmap().generate_cmap(switch=True).cmap_,
+            "coord_num": contmap().coord_num().coord_number_,
+            "packed": contmap().binary_cmap(storage="packed"),
+            "sparse": contmap().binary_cmap(storage="sparse").toarray()}
+
+
+@pytest.mark.parametrize("box, angles, neighbor_search", [
+    (None, (90.0, 90.0, 90.0), True),
+    # shifted out of and wrapped across a rectangular box
+    ((6.6, 2.9, 2.2), (90.0, 90.0, 90.0), True),
+    # triclinic boxes fall back to the distance matrix
+    ((6.6, 2.9, 2.2), (90.0, 80.0, 90.0), False),
+])
+def test_kdtree_matches_brute(box, angles, neighbor_search):
+    traj = _trajectory(box, angles)
+    group_a, group_b = _groups(traj)
+    kdtree = cmap.ContactMap(traj, group_a, group_b, cutoff=0.45, backend="kdtree")
+    assert kdtree._use_neighbor_search() == neighbor_search
+
+    expected = _contact_maps(traj, "brute")
+    results = _contact_maps(traj, "kdtree")
+    assert expected["array"].sum() > 0
+    for key in expected.keys():
+        assert np.array_equal(results[key], expected[key]), key
+
+    if neighbor_search:
+        kdtree.neighbor_search()
+        assert [x.shape[0] for x in kdtree.contacts_] == list(expected["coord_num"])
+
+
+def test_periodic_contacts():
+    # the contacts through the box faces are found by the kdtree
+    traj = _trajectory((6.6, 2.9, 2.2))
+    group_a, group_b = _groups(traj)
+    periodic = cmap.ContactMap(traj, group_a, group_b, cutoff=0.45,
+                               backend="kdtree").coord_num().coord_number_
+    plain = cmap.ContactMap(_trajectory(), group_a, group_b, cutoff=0.45,
+                            backend="kdtree").coord_num().coord_number_
+    assert np.all(periodic > plain)
+
+
+def test_wrap_coordinates():
+    box = np.array([1.0, 2.0, 3.0])
+    xyz = np.array([[-0.25, 2.0, 3.5], [1.0, -4.0, 0.0], [0.5, 1.999, -1e-12]])
+    wrapped = cmap._wrap_coordinates(xyz, box)
+
+    assert np.all(wrapped >= 0.0) and np.all(wrapped < box)
+    # the same points modulo the box
+    shift = (xyz - wrapped) / box
+    assert np.allclose(shift, np.round(shift))
@@ -1,12 +1,19 @@
+import os
+import sys
+import tempfile
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from conftest import _complex_lines
 from dockml import features
-import os
 
 print(os.getcwd())
 
-inp = './test/CplxM1.pdb'
+# CplxM1.pdb is not shipped, a complex is built from test/input.pdb instead
+inp = os.path.join(tempfile.mkdtemp(), 'CplxM1.pdbqt')
+with open(inp, 'w') as tofile:
+    tofile.write("\n".join(_complex_lines(0.5)) + "\n")
 
-ligf = features.BindingFeature()
+ligf = features.BindingFeature(pdbqt=True)
 
 params = ligf.getVdWParams()
 
@@ -14,19 +21,16 @@ print(params.keys())
 
 receptorXYZ, ligandXYZ, recatomDetailInfor, ligatomDetailInfor = ligf.getAtomInfor(input=inp, ligCode='LIG')
 
-alldistpairs = ligf.atomDistMatrix(receptorXYZ, ligandXYZ)
+recAtoms = ligf.getAtomArrays(recatomDetailInfor)
+ligAtoms = ligf.getAtomArrays(ligatomDetailInfor)
+pairs = ligf.pairList(recAtoms["xyz"], ligAtoms["xyz"])
 
 # for all the atomtypes combinations, what are the contacts counts given a cutoff as 6.0 angstrom?
-# this function passes the test and works fine
-#atomTypeCounts = ligf.contactsAtomtype(alldistpairs, recatomDetailInfor, ligatomDetailInfor, params, distanceCutoff=6.0, pdbqt=False)
+#atomTypeCounts = ligf.contactsAtomtype(pairs, recAtoms, ligAtoms)
 
-#reslist2, backcount, sidecount = ligf.residueCounts(alldistpairs, recatomDetailInfor, distanceCutoff=4.0)
+#reslist2, backcount, sidecount = ligf.residueCounts(pairs, recAtoms)
 
-reslist2, backvan, sidevan = ligf.resVdWContribution(alldistpairs,
-                                                     recatomDetailInfor,
-                                                     ligatomDetailInfor,
-                                                     params,
-                                                     maxCutoff=12.0)
+reslist2, backvan, sidevan = ligf.resVdWContribution(pairs, recAtoms, ligAtoms)
 
 #print(atomTypeCounts)
 print(sidevan)
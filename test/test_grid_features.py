@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+import math
+
+import numpy as np
+import pytest
+
+from dockml import features
+from conftest import LIGAND_RESIDUE, _complex_lines
+
+
+@pytest.fixture
+def ligands(tmp_path, monkeypatch):
+    """The receptor and a few poses of the ligand in separated files"""
+    monkeypatch.chdir(tmp_path)
+
+    names = []
+    for i, shift in enumerate([0.0, 0.7, 1.4]):
+        lines = _complex_lines(shift)
+        fn = "lig%d.pdbqt" % i
+        with open(fn, "w") as tofile:
+            tofile.write("\n".join([x for x in lines if x[17:20] == "LIG"]) + "\n")
+        names.append(fn)
+
+    with open("receptor.pdbqt", "w") as tofile:
+        tofile.write("\n".join([x for x in _complex_lines() if x[17:20] != "LIG"]) + "\n")
+
+    return "receptor.pdbqt", names
+
+
+def _switch(x, d0):
+    return (1.0 - math.pow(x / d0, 6)) / (1.0 - math.pow(x / d0, 12))
+
+
+def test_grid_properties_match_pair_loop(ligands):
+    receptor, names = ligands
+    gf = features.GridBasedFeature(names[1], receptor)
+    coords = gf.ligCoords()
+    grids, shape = gf.pocketGrids(extension=2.0, coordinates=list(coords.values()))
+    properties = gf.atomProperties(gf.ligndx)
+
+    gmap = gf.gridAtomMap(grids, coords)
+    features_ = gf.gridBinProperty(gmap, properties, count_cutoff=0.2)
+
+    for k in range(0, grids.shape[0], 7):
+        expected = np.zeros(5)
+        for ndx in gf.ligndx:
+            count = _switch(np.linalg.norm(np.array(coords[ndx]) - grids[k]), 8.0)
+            if count >= 0.2:
+                expected += np.array(properties[ndx]) * count
+        assert np.allclose(features_[k], expected, rtol=1e-12, atol=1e-12)
+
+
+def test_pocket_grids_are_cached(ligands):
+    receptor, names = ligands
+    gf = features.GridBasedFeature(names[0], receptor)
+
+    grids, shape = gf.pocketGrids([18, 19, 20, 21], LIGAND_RESIDUE[1], 4.0)
+    assert grids.shape == (int(np.prod(shape)), 3)
+    again = features.GridBasedFeature(names[1], receptor).pocketGrids([21, 20, 19, 18],
+                                                                      LIGAND_RESIDUE[1], 4.0)
+    assert again[0] is grids
+
+    other = gf.pocketGrids([18, 19, 20, 21], LIGAND_RESIDUE[1], 5.0)
+    assert other[0] is not grids
+    assert other[0].shape[0] > grids.shape[0]
+
+    with pytest.raises(ValueError):
+        gf.pocketGrids()
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_voxelized_shards(ligands, compress):
+    receptor, names = ligands
+    shards = features.voxelizePoses(names, receptor, output="voxels", extension=2.0,
+                                    shard_size=2, compress=compress)
+    assert shards == ["voxels_00000.npz", "voxels_00001.npz"]
+
+    gf = features.GridBasedFeature(names[0], receptor)
+    grids, shape = gf.pocketGrids(extension=2.0, coordinates=list(gf.ligCoords().values()))
+
+    rows = []
+    for fn in shards:
+        data = np.load(fn, mmap_mode=None if compress else "r")
+        assert data["voxels"].dtype == np.float32
+        assert data["voxels"].shape[1:] == (5, ) + tuple(shape)
+        assert np.allclose(data["origin"], grids[0])
+        rows += list(zip(data["names"], data["voxels"]))
+
+    assert [x[0] for x in rows] == names
+    for name, voxels in rows:
+        expected = features.GridBasedFeature(name, receptor).voxelTensor(grids, shape)
+        assert np.array_equal(voxels, expected)
+        assert voxels.any()
+
+
+def test_atom_properties_match_per_atom_parsing(ligands):
+    receptor, names = ligands
+    gf = features.GridBasedFeature(names[0], receptor)
+
+    with open(names[0]) as lines:
+        charges = dict([(s.split()[1], float(s.split()[-2])) for s in lines if "ATOM" in s])
+
+    properties = gf.atomProperties(gf.ligndx)
+    assert len(properties) == len(gf.ligndx) > 0
+    for ndx in gf.ligndx:
+        ele = gf.atominfor[ndx][7]
+        ele = "C" if ele == "A" else ele
+        sigma, epsilon = gf.vdwparm[ele] if ele in gf.vdwparm else (0.0, 0.0)
+        eleid, negat = gf.eleparm[ele] if ele in gf.eleparm else (0.0, 0.0)
+        assert properties[ndx] == [eleid, sigma, epsilon, charges[ndx], negat]
+
+    counts = features.LigandFingerPrints().elementCount(names[0])
+    assert sum(counts.values()) == len(gf.ligndx)
+    for ele in set([gf.atominfor[x][7] for x in gf.ligndx]):
+        assert counts[ele] == sum([gf.atominfor[x][7] == ele for x in gf.ligndx])
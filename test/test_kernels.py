@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import math
+
+import numpy as np
+import pytest
+
+from dockml import kernels
+
+
+def _switch(x, d0, n=6, m=12):
+    """The scalar rational switch function"""
+    if x == d0:
+        return float(n) / float(m)
+    return (1.0 - math.pow(x / d0, n)) / (1.0 - math.pow(x / d0, m))
+
+
+def test_rational_switch_matches_scalar():
+    x = np.linspace(0.0, 30.0, 3001)
+    for n, m in [(6, 12), (6, 10)]:
+        expected = np.array([_switch(v, 7.0, n, m) for v in x])
+        assert np.allclose(kernels.rational_switch(x, d0=7.0, n=n, m=m), expected,
+                           rtol=0.0, atol=1e-12)
+
+
+@pytest.mark.parametrize("method, kwargs", [
+    ("rational", {"d0": 7.0}),
+    ("rational", {"d0": 7.0, "n": 6, "m": 10}),
+    ("exponential", {"r0": 1.5, "d0": 2.0}),
+    ("gaussian", {"r0": 1.5, "d0": 2.0}),
+    ("cosine", {"rc": 8.0}),
+])
+def test_float32_input_is_computed_in_float64(method, kwargs):
+    x = np.linspace(0.0, 12.0, 1201).astype(np.float32)
+    expected = kernels.switch_function(x.astype(np.float64), method, **kwargs)
+
+    s = kernels.switch_function(x, method, **kwargs)
+    assert s.dtype == np.float32
+    assert np.array_equal(s, expected.astype(np.float32))
+
+    # in place, and into a float64 output
+    y = x.copy()
+    kernels.switch_function(y, method, out=y, **kwargs)
+    assert np.array_equal(y, s)
+
+    out = np.empty(x.shape)
+    kernels.switch_function(x, method, out=out, **kwargs)
+    assert np.array_equal(out, expected)
+
+
+def test_scalar_and_integer_inputs():
+    assert kernels.rational_switch(7, d0=7.0) == pytest.approx(0.5)
+    assert isinstance(kernels.rational_switch(3.5, d0=7.0), float)
+    assert kernels.rational_switch(np.arange(3), d0=7.0).dtype == np.float64
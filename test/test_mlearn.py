@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dockml import mlearn
+
+
+def _dataset(n_samples=300, seed=0):
+    """A few groups of correlated features, plus independent ones"""
+    rng = np.random.RandomState(seed)
+    base = rng.normal(size=(n_samples, 4))
+    columns = []
+    for i in range(4):
+        for noise in [0.0, 0.2, 0.5, 1.5]:
+            columns.append(base[:, i] * rng.uniform(0.5, 2.0)
+                           + noise * rng.normal(size=n_samples))
+    columns.append(rng.randint(0, 3, size=n_samples).astype(np.float64))
+    columns.append(np.ones(n_samples))
+    X = np.column_stack(columns)
+    return pd.DataFrame(X, columns=["f%d" % i for i in range(X.shape[1])])
+
+
+def _old_remove_correlated(X, corr_cutoff=0.85):
+    """removeCorrelated before the blocked correlations"""
+    features = list(X.columns)
+    corr = np.reshape([X[f1].corr(X[f2]) for f1 in features for f2 in features],
+                      (len(features), len(features)))
+
+    key_fe = list(X.columns.values)
+    for i in range(len(features)):
+        for j in range(len(features)):
+            if math.fabs(corr[i, j]) > corr_cutoff and i != j and \
+                    features[i] in key_fe and features[j] in key_fe:
+                key_fe.remove(features[i])
+    return X[key_fe], key_fe
+
+
+@pytest.mark.parametrize("n_jobs, block_size", [(1, None), (1, 5), (2, 5)])
+def test_mutual_information_matches_pairwise(n_jobs, block_size):
+    X = _dataset().values
+    select = mlearn.FeatureSelection()
+
+    mi = mlearn.MutualInformation(nbins=20, n_jobs=n_jobs, block_size=block_size).fit(X)
+    expected = np.array([[select.mutualInformation(X[:, i], X[:, j])
+                          for j in range(X.shape[1])] for i in range(X.shape[1])])
+
+    assert mi.mi_.shape == expected.shape
+    # the entropies are summed in another order
+    assert np.allclose(mi.mi_, expected, rtol=5e-15, atol=5e-15)
+
+    normalized = select.mutualInformationMatrix(X, normalized=True)
+    mean = (np.diag(expected)[:, np.newaxis] + np.diag(expected)[np.newaxis, :]) / 2.0
+    mean[mean == 0] = np.inf
+    assert np.allclose(normalized, np.maximum(expected, 0.0) / mean, rtol=5e-15, atol=5e-15)
+
+
+@pytest.mark.parametrize("corr_cutoff", [0.3, 0.6, 0.85, 0.95])
+def test_remove_correlated_matches_pairwise_loop(corr_cutoff):
+    X = _dataset().drop(columns=["f17"])
+
+    data, key_fe = mlearn.FeatureSelection().removeCorrelated(X, corr_cutoff)
+    expected, expected_fe = _old_remove_correlated(X, corr_cutoff)
+
+    assert key_fe == expected_fe
+    assert data.equals(expected)
+    assert 0 < len(key_fe) < X.shape[1]
+
+
+def test_correlations_match_pandas():
+    X = _dataset().drop(columns=["f17"])
+    corr = mlearn.FeatureSelection().correlations(X, block=4)
+
+    assert np.allclose(corr, X.corr().values, rtol=0.0, atol=1e-12)
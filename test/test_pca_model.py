@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+
+from mdanaly import cmap
+from mdanaly import pca
+
+
+def _dataset(n_samples=300, n_dims=30, seed=0):
+    rng = np.random.RandomState(seed)
+    return np.dot(rng.rand(n_samples, 4), rng.rand(4, n_dims)) \
+        + 0.1 * rng.rand(n_samples, n_dims)
+
+
+def test_projection_outputs():
+    assert pca.projection_outputs(["rep1/md.xtc"], "proj.csv") == ["proj.csv"]
+    assert pca.projection_outputs(["rep1/md1.xtc", "rep2/md2.xtc"], "proj.csv") == \
+        ["proj_md1.csv", "proj_md2.csv"]
+    assert pca.projection_outputs(["rep1/md.xtc", "rep2/md.xtc", "rep3/eq.xtc"],
+                                  "out/proj.csv") == \
+        ["out/proj_0_md.csv", "out/proj_1_md.csv", "out/proj_2_eq.csv"]
+
+
+def test_project_replicas_with_the_same_name(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    X = _dataset()
+
+    model = pca.PCA(n_components=3, scale_method="mean")
+    model.fit(X)
+    expected = model.X_transformed_
+    model.save("model.npz", metadata={"mode": "general"})
+
+    inputs = []
+    for i, rows in enumerate([slice(0, 100), slice(100, 250)]):
+        os.mkdir("rep%d" % i)
+        fn = os.path.join("rep%d" % i, "data.csv")
+        pd.DataFrame(X[rows], index=np.arange(X[rows].shape[0]) * 2.0).to_csv(fn)
+        inputs.append(fn)
+
+    args = argparse.Namespace(trajs=inputs, f="", o="proj.csv", model="model.npz",
+                              s="", dt=2, ps=2, b=0, e=-1, nt=2, v=False)
+    pca.project_pca(args)
+
+    for fn, rows in zip(["proj_0_data.csv", "proj_1_data.csv"],
+                        [slice(0, 100), slice(100, 250)]):
+        projected = pd.read_csv(fn, index_col=0).values
+        assert projected.shape == (X[rows].shape[0], 3)
+        assert np.abs(projected - expected[rows]).max() <= 5e-4 + 1e-9
+
+
+@pytest.mark.parametrize("scale_method, solver", [
+    ("mean", "full"),
+    ("zscore", "full"),
+    ("minmax", "randomized"),
+    ("NA", "arpack"),
+])
+def test_dense_model_round_trip(tmp_path, scale_method, solver):
+    X = _dataset()
+    model = pca.PCA(n_components=4, scale_method=scale_method, solver=solver)
+    model.fit(X)
+    model.save(str(tmp_path / "model.npz"), metadata={"mode": "general", "columns": ["a", "b"]})
+
+    loaded = pca.PCA.load(str(tmp_path / "model.npz"))
+    assert loaded.metadata_["mode"] == "general"
+    assert list(loaded.metadata_["columns"]) == ["a", "b"]
+    assert np.array_equal(loaded.eigvalues_, model.eigvalues_)
+    assert np.array_equal(loaded.eigvalues_ratio_, model.eigvalues_ratio_)
+
+    # the fitted model transforms the scaled dataset
+    expected = model.pca_obj.transform(model.scaler_.transform(X))
+    assert np.allclose(model.X_transformed_, expected, rtol=0.0, atol=1e-10)
+    assert np.allclose(model.project(X), expected, rtol=0.0, atol=1e-10)
+    assert np.allclose(loaded.project(X), expected, rtol=0.0, atol=1e-10)
+
+
+@pytest.mark.parametrize("storage", ["sparse", "packed"])
+@pytest.mark.parametrize("scale_method, solver", [
+    ("mean", "randomized"),
+    ("zscore", "arpack"),
+])
+def test_sparse_model_round_trip(tmp_path, storage, scale_method, solver):
+    X = (_dataset(n_dims=45) > 1.2) * 1.0
+    X[:, 3] = 0.0
+    assert 0.0 < X.mean() < 0.5
+
+    cm = cmap.BinaryCmap(X.shape[1], storage=storage)
+    cm.append(X[:150])
+    cm.append(sparse.csr_matrix(X[150:]))
+
+    model = pca.PCA(n_components=3, scale_method=scale_method, solver=solver)
+    model.fit(cm)
+    assert isinstance(model.pca_obj, pca.ImplicitPCA)
+    model.save(str(tmp_path / "model.npz"))
+    loaded = pca.PCA.load(str(tmp_path / "model.npz"))
+
+    expected = model.transform(X)
+    assert np.allclose(model.X_transformed_, expected, rtol=0.0, atol=1e-10)
+    for data in [X, sparse.csr_matrix(X), cm]:
+        assert np.allclose(loaded.project(data), expected, rtol=0.0, atol=1e-10)
+
+    # the same decomposition as the dense dataset
+    dense = pca.PCA(n_components=3, scale_method=scale_method, solver="full")
+    dense.fit(X)
+    assert np.allclose(np.abs(loaded.project(X)), np.abs(dense.X_transformed_),
+                       rtol=0.0, atol=1e-6)
+
+
+def test_project_trajectory_of_a_dataset(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    X = _dataset()
+    columns = ["f%d" % i for i in range(X.shape[1])]
+    pd.DataFrame(X, columns=columns, index=np.arange(X.shape[0]) * 2.0).to_csv("data.csv")
+
+    model = pca.PCA(n_components=3, scale_method="zscore")
+    model.fit(X[:, 5:])
+    model.save("model.npz", metadata={"mode": "general", "columns": columns[5:]})
+
+    pca.project_trajectory("model.npz", "data.csv", "", "proj.csv", begin=100, end=400)
+    projected = pd.read_csv("proj.csv", index_col=0)
+
+    rows = (np.arange(X.shape[0]) * 2.0 >= 100) & (np.arange(X.shape[0]) * 2.0 <= 400)
+    assert np.array_equal(projected.index.values, np.arange(X.shape[0])[rows] * 2.0)
+    assert np.abs(projected.values - model.X_transformed_[rows]).max() <= 5e-4 + 1e-9
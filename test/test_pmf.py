@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from dockml import algorithms
+from mdanaly import pmf
+from mdanaly.accumulator import HistogramAccumulator
+
+
+def _dataset():
+    rng = np.random.RandomState(0)
+    return rng.normal(size=(5000, 2))
+
+
+def test_algorithms_accept_histograms():
+    X = _dataset()
+    algo = algorithms.BasicAlgorithm()
+
+    edges = np.linspace(-4, 4, 21)
+    hist = HistogramAccumulator([edges, ])
+    for i in range(0, X.shape[0], 700):
+        hist.append(X[i:i + 700, 0])
+    assert np.allclose(algo.pmf(hist), algo.pmf(X[:, 0], bins=edges))
+
+    hist2d = HistogramAccumulator([edges, edges])
+    for i in range(0, X.shape[0], 700):
+        hist2d.append(X[i:i + 700])
+    expected = algo.pmf2d(X[:, 0], X[:, 1], 0.5, bins=[edges, edges])
+    for a, b in zip(algo.pmf2d(hist2d, None, 0.5), expected):
+        assert np.allclose(a, b)
+
+
+def test_pmf2d_default_output_of_histograms(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    np.savetxt("rep1.dat", _dataset())
+
+    monkeypatch.setattr(sys, "argv", ["pmf2d.py", "-dat", "rep1.dat", "-cols", "0", "1",
+                                      "-range", "-4", "4", "-4", "4",
+                                      "-save_hist", "rep1.npz"])
+    pmf.main()
+    expected = np.loadtxt("pmf_rep1.dat")
+    os.remove("pmf_rep1.dat")
+
+    monkeypatch.setattr(sys, "argv", ["pmf2d.py", "-dat", "rep1.npz", "-cols", "0", "1",
+                                      "-range", "-4", "4", "-4", "4"])
+    pmf.main()
+    # the histogram is not overwritten, the pmf is written as text
+    assert HistogramAccumulator.load("rep1.npz").counts_.sum() == 5000
+    assert not os.path.exists("pmf_rep1.npz")
+    assert np.array_equal(np.loadtxt("pmf_rep1.dat"), expected)
+
+
+def test_pmf2d_histograms_check_the_data_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    np.savetxt("rep1.dat", _dataset())
+    monkeypatch.setattr(sys, "argv", ["pmf2d.py", "-dat", "rep1.dat", "-cols", "0", "1",
+                                      "-range", "-4", "4", "-4", "4",
+                                      "-save_hist", "rep1.npz"])
+    pmf.main()
+
+    # a 1D data file with the 2D histogram
+    monkeypatch.setattr(sys, "argv", ["pmf2d.py", "-dat", "rep1.npz", "rep1.dat",
+                                      "-cols", "0"])
+    with pytest.raises(ValueError):
+        pmf.main()
+
+    # other bin edges than the saved histogram
+    for extra in [["-range", "-3", "3", "-4", "4"], ["-range", "-4", "4", "-4", "4",
+                                                     "-numbins", "20"]]:
+        monkeypatch.setattr(sys, "argv", ["pmf2d.py", "-dat", "rep1.npz", "rep1.dat",
+                                          "-cols", "0", "1"] + extra)
+        with pytest.raises(ValueError):
+            pmf.main()
+
+    monkeypatch.setattr(sys, "argv", ["pmf2d.py", "-dat", "rep1.npz", "rep1.dat",
+                                      "-cols", "0", "1", "-save_hist", "both.npz"])
+    pmf.main()
+    assert HistogramAccumulator.load("both.npz").counts_.sum() == 10000
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import mdtraj as mt
+import numpy as np
+import pytest
+
+from mdanaly import cmap
+
+TEST_ROOT = os.path.abspath(os.path.dirname(__file__))
+
+
+@pytest.fixture
+def traj():
+    ref = mt.load(os.path.join(TEST_ROOT, "input.pdb"))
+    rng = np.random.RandomState(0)
+    xyz = ref.xyz[0] + rng.normal(scale=0.05, size=(6, ref.n_atoms, 3))
+    return mt.Trajectory(xyz.astype(np.float32), ref.topology)
+
+
+def _reference_contacts(traj, resids_a, resids_b, cutoff):
+    """Count the atom contacts residue pair by residue pair"""
+    contacts = []
+    for res_a in resids_a:
+        for res_b in resids_b:
+            atoms_a = traj.topology.select("resid %d" % res_a)
+            atoms_b = traj.topology.select("resid %d" % res_b)
+            pairs = np.array([[i, j] for i in atoms_a for j in atoms_b])
+            dist = mt.compute_distances(traj, pairs)
+            contacts.append(np.sum(dist <= cutoff, axis=1))
+    return np.array(contacts, dtype=np.float64).T
+
+
+@pytest.mark.parametrize("backend", ["brute", "kdtree"])
+def test_residue_contacts(traj, backend):
+    resids_a, resids_b = [0, 1, 2, 5], [3, 4, 6, 7, 8]
+    nbyn = cmap.CmapNbyN(traj, resids_a, resids_b, cutoff=0.45, backend=backend)
+    contacts, n_pairs = nbyn.residue_contacts()
+
+    expected = _reference_contacts(traj, resids_a, resids_b, 0.45)
+    assert contacts.shape == (traj.n_frames, len(resids_a) * len(resids_b))
+    assert expected.sum() > 0
+    assert np.array_equal(contacts, expected)
+
+
+def test_distance_contacts_blocks(traj):
+    nbyn = cmap.CmapNbyN(traj, [0, 1, 2], [3, 4, 5], cutoff=0.45)
+    nbyn.residue_contacts()
+
+    frames, atom_contacts = nbyn.distance_contacts()
+    # blocks smaller than a frame, and several frames per block
+    for block_size in [7, nbyn.n_pairs_() * 4]:
+        f, p = nbyn.distance_contacts(block_size=block_size)
+        assert np.array_equal(np.lexsort((p, f)), np.arange(f.shape[0]))
+        assert np.array_equal(f, frames)
+        assert np.array_equal(p, atom_contacts)
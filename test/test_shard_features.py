@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pytest
+
+from dockml import features
+from conftest import _complex_lines
+
+
+def _read_output(stem):
+    dense = np.loadtxt(stem + ".csv", delimiter=",")
+    with open(stem + "_names.dat") as lines:
+        names = lines.read().strip().split(",")
+    return dense, names
+
+
+def test_shards_match_single_pass(complexes):
+    inp, names = complexes
+    binding = features.BindingFeature(pdbqt=True)
+
+    binding.extractFeatures(inp, "single.csv", shard_size=100)
+    binding.extractFeatures(inp, "sharded.csv", shard_size=2)
+    binding.extractFeatures(inp, "parallel.csv", shard_size=2, n_jobs=2)
+
+    single, single_names = _read_output("single")
+    assert single_names == names
+    assert not os.path.exists("single.csv.ckpt")
+
+    for stem in ["sharded", "parallel"]:
+        dense, rows = _read_output(stem)
+        assert rows == names
+        assert np.array_equal(dense, single)
+
+
+def test_resume_after_interruption(complexes, monkeypatch):
+    inp, names = complexes
+    binding = features.BindingFeature(pdbqt=True)
+    binding.extractFeatures(inp, "full.csv", shard_size=2)
+
+    worker = features._featurize_shard_worker
+    calls = []
+
+    def broken_worker(cases):
+        calls.append(cases)
+        if len(calls) > 2:
+            raise KeyboardInterrupt
+        return worker(cases)
+
+    monkeypatch.setattr(features, "_featurize_shard_worker", broken_worker)
+    with pytest.raises(KeyboardInterrupt):
+        binding.extractFeatures(inp, "resumed.csv", shard_size=2)
+    assert os.path.exists("resumed.csv.ckpt")
+
+    # a partial shard written after the checkpoint is dropped on resume
+    with open("resumed.csv", "a") as tofile:
+        tofile.write("1.0,2.0\n")
+
+    monkeypatch.setattr(features, "_featurize_shard_worker", worker)
+    binding.extractFeatures(inp, "resumed.csv", shard_size=2, resume=True)
+    assert not os.path.exists("resumed.csv.ckpt")
+
+    full, full_names = _read_output("full")
+    resumed, resumed_names = _read_output("resumed")
+    assert resumed_names == full_names == names
+    assert np.array_equal(resumed, full)
+
+
+def test_errors_are_logged_with_the_exception(complexes):
+    inp, names = complexes
+    with open(inp, "a") as tofile:
+        tofile.write("missing.pdbqt LIG\n")
+
+    binding = features.BindingFeature(pdbqt=True)
+    binding.extractFeatures(inp, "features.csv", shard_size=3)
+
+    dense, rows = _read_output("features")
+    assert rows == names
+    assert dense.shape[0] == len(names)
+
+    with open("features_errors.log") as lines:
+        errors = lines.read().strip().split("\n")
+    assert len(errors) == 1
+    assert errors[0].startswith("missing.pdbqt ")
+    assert "Error" in errors[0]
+
+
+def _add_far_poses(inp, n=2):
+    names = []
+    for i in range(n):
+        fn = "far%d.pdbqt" % i
+        with open(fn, "w") as tofile:
+            tofile.write("\n".join(_complex_lines(20.0 + i)) + "\n")
+        names.append(fn)
+    with open(inp, "a") as tofile:
+        tofile.write("".join(["%s LIG\n" % x for x in names]))
+    return names
+
+
+def _read_rejected(fname):
+    with open(fname) as lines:
+        header = lines.readline()
+        records = [x.strip().split(",") for x in lines]
+    assert header.startswith("# name,")
+    return dict([(x[0], x[-1]) for x in records])
+
+
+def test_prefilter_reject_and_flag(complexes):
+    inp, names = complexes
+    names = names + _add_far_poses(inp)
+
+    # the closest poses have one heavy atom pair within the clash cutoff
+    binding = features.BindingFeature(pdbqt=True, maxClashes=0)
+    expected = {}
+    for fn in names:
+        atoms = binding.getComplexArrays(fn, "LIG")
+        reasons = binding.poseFilter(atoms[0], atoms[1])[-1]
+        if len(reasons):
+            expected[fn] = ";".join(reasons)
+    assert "clash" in expected.values() and "pocket" in expected.values()
+    assert len(expected) < len(names)
+
+    binding.extractFeatures(inp, "all.csv", shard_size=3)
+    binding.extractFeatures(inp, "reject.csv", shard_size=3, prefilter="reject")
+    binding.extractFeatures(inp, "flag.csv", shard_size=3, prefilter="flag")
+
+    full, full_names = _read_output("all")
+    assert full_names == names
+    assert not os.path.exists("all_rejected.csv")
+
+    flagged, flagged_names = _read_output("flag")
+    assert flagged_names == names
+    assert np.array_equal(flagged, full)
+    assert _read_rejected("flag_rejected.csv") == expected
+
+    kept = [i for i, x in enumerate(names) if x not in expected]
+    rejected, rejected_names = _read_output("reject")
+    assert rejected_names == [names[i] for i in kept]
+    assert np.array_equal(rejected, full[kept])
+    assert _read_rejected("reject_rejected.csv") == expected
+
+
+def test_prefilter_resume(complexes, monkeypatch):
+    inp, names = complexes
+    _add_far_poses(inp)
+    binding = features.BindingFeature(pdbqt=True, maxClashes=0)
+    binding.extractFeatures(inp, "full.csv", shard_size=2, prefilter="reject")
+
+    worker = features._featurize_shard_worker
+    calls = []
+
+    def broken_worker(cases):
+        calls.append(cases)
+        if len(calls) > 3:
+            raise KeyboardInterrupt
+        return worker(cases)
+
+    monkeypatch.setattr(features, "_featurize_shard_worker", broken_worker)
+    with pytest.raises(KeyboardInterrupt):
+        binding.extractFeatures(inp, "resumed.csv", shard_size=2, prefilter="reject")
+
+    monkeypatch.setattr(features, "_featurize_shard_worker", worker)
+    binding.extractFeatures(inp, "resumed.csv", shard_size=2, prefilter="reject",
+                            resume=True)
+
+    full, full_names = _read_output("full")
+    resumed, resumed_names = _read_output("resumed")
+    assert resumed_names == full_names
+    assert np.array_equal(resumed, full)
+    with open("full_rejected.csv") as a, open("resumed_rejected.csv") as b:
+        assert a.read() == b.read()
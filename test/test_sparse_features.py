@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+from dockml import features, mlearn
+
+
+def test_npz_roundtrip_matches_csv(complexes):
+    inp, names = complexes
+    binding = features.BindingFeature(pdbqt=True)
+
+    binding.extractFeatures(inp, "features.csv", shard_size=3)
+    binding.extractFeatures(inp, "features.npz", shard_size=3, output_format="npz")
+
+    dense = np.loadtxt("features.csv", delimiter=",")
+    with open("features.csv") as lines:
+        columns = lines.readline()[2:].strip().split(",")
+
+    data = mlearn.DataClean().loadDataFile("features.npz")
+    assert all([isinstance(x, pd.SparseDtype) and x.fill_value == 0.0 for x in data.dtypes])
+    assert list(data.columns) == columns
+    assert list(data.index) == names
+
+    values = data.sparse.to_dense().values
+    assert not np.isnan(values).any()
+    # the csv is written with %.3f
+    assert np.abs(values - dense).max() <= 5e-4 + 1e-9
+    # the implicit entries are zeros, not missing values
+    assert (dense[values == 0] == 0).all()
+
+
+def test_training_loader_is_dense(complexes):
+    inp, names = complexes
+    binding = features.BindingFeature(pdbqt=True)
+    binding.extractFeatures(inp, "features.npz", output_format="npz")
+
+    data = mlearn.BindingFeatureClean(None, None).loadDataSet("features.npz")
+    assert not any([isinstance(x, pd.SparseDtype) for x in data.dtypes])
+    assert data.shape[0] == len(names)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from mdanaly import pca
+
+
+def _dataset(n_samples, n_dims, seed=1):
+    rng = np.random.RandomState(seed)
+    return np.dot(rng.rand(n_samples, 5), rng.rand(5, n_dims)) \
+        + 0.05 * rng.rand(n_samples, n_dims)
+
+
+@pytest.mark.parametrize("n_samples, n_dims, solver", [
+    (2000, 40, "auto"),
+    (2000, 600, "arpack"),
+    (2000, 600, "full"),
+    (200, 900, "arpack"),
+    (200, 900, "full"),
+])
+@pytest.mark.parametrize("scale_method", ["mean", "zscore", "minmax"])
+def test_streaming_matches_full_pca(n_samples, n_dims, solver, scale_method):
+    X = _dataset(n_samples, n_dims)
+
+    spca = pca.StreamingPCA(n_components=5, scale_method=scale_method, solver=solver)
+    for i in range(0, n_samples, 150):
+        spca.partial_fit(X[i:i + 150])
+    spca.finalize()
+    # the samples are only kept while they are fewer than half of the dimensions
+    assert (spca._sum_sq is None) == (2 * n_samples < n_dims)
+
+    ref = pca.PCA(n_components=5, scale_method=scale_method, solver="full")
+    ref.fit(X)
+
+    assert np.allclose(spca.eigvalues_ratio_, ref.eigvalues_ratio_, atol=1e-12)
+    assert np.allclose(spca.eigvectors_, ref.eigvectors_, atol=1e-10)
+    assert np.allclose(spca.transform(X), ref.X_transformed_, atol=1e-9)
+
+
+def test_covariance_matrix():
+    X = _dataset(400, 30)
+
+    spca = pca.StreamingPCA(n_components=3, scale_method="zscore")
+    for i in range(0, 400, 64):
+        spca.partial_fit(X[i:i + 64])
+
+    Xs = (X - X.mean(axis=0)) / X.std(axis=0)
+    assert np.allclose(spca.covariance_, np.cov(Xs, rowvar=False), atol=1e-12)
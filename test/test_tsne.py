@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+from scipy import sparse
+
+from mdanaly import pca
+
+
+def _embedding(n=150, no_dims=2, seed=0):
+    rng = np.random.RandomState(seed)
+    Y = rng.normal(size=(n, no_dims))
+    # a duplicated sample and a far one
+    Y[1] = Y[0]
+    Y[2] = 20.0
+    return Y
+
+
+def _affinities(n, seed=0):
+    rng = np.random.RandomState(seed)
+    P = sparse.random(n, n, density=0.05, random_state=rng).toarray()
+    np.fill_diagonal(P, 0.0)
+    P = P + P.T
+    return P / P.sum()
+
+
+def _old_gradient(P, Y):
+    """The gradient of tsne before the vectorized version"""
+    n, no_dims = Y.shape
+    sum_Y = np.sum(np.square(Y), 1)
+    num = -2. * np.dot(Y, Y.T)
+    num = 1. / (1. + np.add(np.add(num, sum_Y).T, sum_Y))
+    num[range(n), range(n)] = 0.
+    Q = num / np.sum(num)
+    Q = np.maximum(Q, 1e-12)
+
+    PQ = P - Q
+    dY = np.zeros((n, no_dims))
+    for i in range(n):
+        dY[i, :] = np.sum(np.tile(PQ[:, i] * num[:, i], (no_dims, 1)).T * (Y[i, :] - Y), 0)
+    return dY, Q
+
+
+@pytest.mark.parametrize("no_dims", [2, 3])
+def test_exact_gradient_matches_loop(no_dims):
+    Y = _embedding(no_dims=no_dims)
+    P = np.maximum(_affinities(Y.shape[0]), 1e-12)
+
+    dY, Q = pca.tSNE()._gradient_exact(P, Y)
+    expected, expected_Q = _old_gradient(P, Y)
+
+    assert np.array_equal(Q, expected_Q)
+    assert np.allclose(dY, expected, rtol=1e-12, atol=1e-15)
+
+
+@pytest.mark.parametrize("no_dims", [2, 3])
+def test_barnes_hut_without_approximation(no_dims):
+    Y = _embedding(no_dims=no_dims)
+    tsne = pca.tSNE()
+
+    diff = Y[:, np.newaxis, :] - Y[np.newaxis, :, :]
+    num = 1. / (1. + np.sum(np.square(diff), axis=2))
+    np.fill_diagonal(num, 0.0)
+
+    # theta = 0 opens every cell down to single samples
+    F, Z = tsne._repulsive_forces(Y, theta=0.0, block=64)
+    assert np.allclose(Z, num.sum(), rtol=1e-12, atol=0.0)
+    assert np.allclose(F, np.einsum("ij,ijk->ik", num ** 2, diff), rtol=1e-10, atol=1e-14)
+
+    # the same gradient as the dense P
+    P = _affinities(Y.shape[0])
+    dY, Q = tsne._gradient_barnes_hut(sparse.coo_matrix(P), Y, theta=0.0)
+    expected, expected_Q = tsne._gradient_exact(P, Y)
+    assert np.allclose(dY, expected, rtol=1e-9, atol=1e-14)
+    rows, cols = np.nonzero(P)
+    assert np.allclose(Q, expected_Q[rows, cols], rtol=1e-12, atol=0.0)
+
+    # the approximation stays close
+    F_approx, Z_approx = tsne._repulsive_forces(Y, theta=0.5)
+    assert abs(Z_approx - Z) < 0.01 * Z
+    assert np.abs(F_approx - F).max() < 0.05 * np.abs(F).max()